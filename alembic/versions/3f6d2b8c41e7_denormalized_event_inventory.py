@@ -0,0 +1,44 @@
+"""denormalized event inventory
+
+Revision ID: 3f6d2b8c41e7
+Revises: 51b1b49e8e92
+Create Date: 2026-10-17 10:12:03.511240
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f6d2b8c41e7'
+down_revision: Union[str, Sequence[str], None] = '51b1b49e8e92'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('events', sa.Column('total_remaining', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('events', sa.Column('is_sold_out', sa.Boolean(), nullable=False, server_default=sa.false()))
+    op.create_index('ix_events_listing', 'events', ['status', 'deleted_at', 'is_sold_out', 'date'], unique=False)
+
+    # backfilling the counters from the tickets that already exist
+    events = sa.table('events', sa.column('id', sa.Integer), sa.column('total_remaining', sa.Integer), sa.column('is_sold_out', sa.Boolean))
+    tickets = sa.table('tickets', sa.column('event_id', sa.Integer), sa.column('quantity_available', sa.Integer))
+    remaining = (
+        sa.select(sa.func.coalesce(sa.func.sum(tickets.c.quantity_available), 0))
+        .where(tickets.c.event_id == events.c.id)
+        .scalar_subquery()
+    )
+    has_tickets = sa.exists().where(tickets.c.event_id == events.c.id)
+    op.execute(events.update().values(total_remaining=remaining))
+    op.execute(events.update().values(is_sold_out=sa.and_(has_tickets, events.c.total_remaining <= 0)))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_events_listing', table_name='events')
+    op.drop_column('events', 'is_sold_out')
+    op.drop_column('events', 'total_remaining')
@@ -0,0 +1,27 @@
+"""waitlist queue index
+
+Revision ID: 8b1e4c7d9a20
+Revises: 3f6d2b8c41e7
+Create Date: 2026-10-17 14:02:45.118302
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b1e4c7d9a20'
+down_revision: Union[str, Sequence[str], None] = '3f6d2b8c41e7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_waitlist_queue', 'waitlist', ['ticket_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_waitlist_queue', table_name='waitlist')
@@ -0,0 +1,62 @@
+"""event full text search
+
+Revision ID: a93f6d2e8c15
+Revises: 5e2c8f1a7b34
+Create Date: 2026-10-17 18:05:52.270149
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a93f6d2e8c15'
+down_revision: Union[str, Sequence[str], None] = '5e2c8f1a7b34'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+SQLITE_UPGRADE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS events_fts USING fts5(title, description, venue, content='events', content_rowid='id')",
+    """CREATE TRIGGER IF NOT EXISTS events_fts_insert AFTER INSERT ON events BEGIN
+        INSERT INTO events_fts(rowid, title, description, venue) VALUES (new.id, new.title, new.description, new.venue);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS events_fts_delete AFTER DELETE ON events BEGIN
+        INSERT INTO events_fts(events_fts, rowid, title, description, venue) VALUES ('delete', old.id, old.title, old.description, old.venue);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS events_fts_update AFTER UPDATE OF title, description, venue ON events BEGIN
+        INSERT INTO events_fts(events_fts, rowid, title, description, venue) VALUES ('delete', old.id, old.title, old.description, old.venue);
+        INSERT INTO events_fts(rowid, title, description, venue) VALUES (new.id, new.title, new.description, new.venue);
+    END""",
+    "INSERT INTO events_fts(events_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0, 4.0)')",
+    "INSERT INTO events_fts(events_fts) VALUES ('rebuild')",
+]
+SQLITE_DOWNGRADE = [
+    "DROP TRIGGER IF EXISTS events_fts_update",
+    "DROP TRIGGER IF EXISTS events_fts_delete",
+    "DROP TRIGGER IF EXISTS events_fts_insert",
+    "DROP TABLE IF EXISTS events_fts",
+]
+POSTGRES_UPGRADE = [
+    "CREATE INDEX IF NOT EXISTS ix_events_search ON events USING gin (("
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(venue, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'C')))",
+]
+POSTGRES_DOWNGRADE = ["DROP INDEX IF EXISTS ix_events_search"]
+
+
+def _run(statements_by_dialect) -> None:
+    for statement in statements_by_dialect.get(op.get_bind().dialect.name, []):
+        op.execute(statement)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    _run({"sqlite": SQLITE_UPGRADE, "postgresql": POSTGRES_UPGRADE})
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _run({"sqlite": SQLITE_DOWNGRADE, "postgresql": POSTGRES_DOWNGRADE})
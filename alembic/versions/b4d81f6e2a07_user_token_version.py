@@ -0,0 +1,29 @@
+"""user token version
+
+Revision ID: b4d81f6e2a07
+Revises: e62d4f8a1c97
+Create Date: 2026-10-17 23:18:40.512930
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4d81f6e2a07'
+down_revision: Union[str, Sequence[str], None] = 'e62d4f8a1c97'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # tokens issued so far carry version 0 (or none, read as 0) and stay valid
+    op.add_column('users', sa.Column('token_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('users', 'token_version')
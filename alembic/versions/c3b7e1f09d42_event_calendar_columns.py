@@ -0,0 +1,49 @@
+"""event calendar columns
+
+Revision ID: c3b7e1f09d42
+Revises: a93f6d2e8c15
+Create Date: 2026-10-17 19:12:40.318226
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3b7e1f09d42'
+down_revision: Union[str, Sequence[str], None] = 'a93f6d2e8c15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# filling the new columns from events.date, day_of_week counts from 0 = Sunday
+BACKFILL = {
+    "sqlite": "UPDATE events SET start_day = date(date), start_hour = CAST(strftime('%H', date) AS INTEGER), day_of_week = CAST(strftime('%w', date) AS INTEGER) WHERE date IS NOT NULL",
+    "postgresql": "UPDATE events SET start_day = CAST(date AS DATE), start_hour = EXTRACT(HOUR FROM date), day_of_week = EXTRACT(DOW FROM date) WHERE date IS NOT NULL",
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('events', sa.Column('start_day', sa.Date(), nullable=True))
+    op.add_column('events', sa.Column('start_hour', sa.Integer(), nullable=True))
+    op.add_column('events', sa.Column('day_of_week', sa.Integer(), nullable=True))
+    op.execute(BACKFILL[op.get_bind().dialect.name])
+    op.create_index('ix_events_start_day', 'events', ['status', 'deleted_at', 'start_day', 'is_sold_out', 'date'], unique=False)
+    # the listing index gains the calendar columns at the end
+    op.drop_index('ix_events_listing', table_name='events')
+    op.create_index('ix_events_listing', 'events', ['status', 'deleted_at', 'is_sold_out', 'date', 'start_hour', 'day_of_week'], unique=False)
+    # fresh statistics, without them sqlite prefers the listing index whatever the filter
+    op.execute('ANALYZE events')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_events_listing', table_name='events')
+    op.create_index('ix_events_listing', 'events', ['status', 'deleted_at', 'is_sold_out', 'date'], unique=False)
+    op.drop_index('ix_events_start_day', table_name='events')
+    op.drop_column('events', 'day_of_week')
+    op.drop_column('events', 'start_hour')
+    op.drop_column('events', 'start_day')
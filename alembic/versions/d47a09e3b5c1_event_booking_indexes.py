@@ -0,0 +1,29 @@
+"""event booking indexes
+
+Revision ID: d47a09e3b5c1
+Revises: 8b1e4c7d9a20
+Create Date: 2026-10-17 15:20:11.604733
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd47a09e3b5c1'
+down_revision: Union[str, Sequence[str], None] = '8b1e4c7d9a20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(op.f('ix_tickets_event_id'), 'tickets', ['event_id'], unique=False)
+    op.create_index('ix_bookings_ticket_status', 'bookings', ['ticket_id', 'status'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_bookings_ticket_status', table_name='bookings')
+    op.drop_index(op.f('ix_tickets_event_id'), table_name='tickets')
@@ -0,0 +1,52 @@
+"""ticket sales rollup
+
+Revision ID: e62d4f8a1c97
+Revises: c3b7e1f09d42
+Create Date: 2026-10-17 21:04:52.180371
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e62d4f8a1c97'
+down_revision: Union[str, Sequence[str], None] = 'c3b7e1f09d42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('ticket_sales_rollup',
+    sa.Column('ticket_id', sa.Integer(), nullable=False),
+    sa.Column('event_id', sa.Integer(), nullable=False),
+    sa.Column('tickets_sold', sa.Integer(), nullable=False),
+    sa.Column('confirmed_bookings', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['event_id'], ['events.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['ticket_id'], ['tickets.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('ticket_id')
+    )
+    op.create_index(op.f('ix_ticket_sales_rollup_event_id'), 'ticket_sales_rollup', ['event_id'], unique=False)
+    op.create_index('ix_events_organizer', 'events', ['organizer_id', 'date', 'id'], unique=False)
+
+    # backfilling the rollups from the confirmed bookings that already exist
+    rollup = sa.table('ticket_sales_rollup', sa.column('ticket_id', sa.Integer), sa.column('event_id', sa.Integer), sa.column('tickets_sold', sa.Integer), sa.column('confirmed_bookings', sa.Integer))
+    bookings = sa.table('bookings', sa.column('ticket_id', sa.Integer), sa.column('quantity', sa.Integer), sa.column('status', sa.String))
+    tickets = sa.table('tickets', sa.column('id', sa.Integer), sa.column('event_id', sa.Integer))
+    totals = (
+        sa.select(bookings.c.ticket_id, tickets.c.event_id, sa.func.sum(bookings.c.quantity), sa.func.count())
+        .join(tickets, tickets.c.id == bookings.c.ticket_id)
+        .where(bookings.c.status == 'confirmed', tickets.c.event_id.isnot(None))
+        .group_by(bookings.c.ticket_id, tickets.c.event_id)
+    )
+    op.execute(rollup.insert().from_select(['ticket_id', 'event_id', 'tickets_sold', 'confirmed_bookings'], totals))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_events_organizer', table_name='events')
+    op.drop_index(op.f('ix_ticket_sales_rollup_event_id'), table_name='ticket_sales_rollup')
+    op.drop_table('ticket_sales_rollup')
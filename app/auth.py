@@ -2,27 +2,59 @@
 Security and JWT logic. Our demand is based on role based access control, 
 we need a way to verify user type before letting them hit
 specific endpoints.
+
+Access tokens carry the user's id, email and role, so verifying a request is
+a signature check (cached for a short while per token) plus a check of the
+token's version against users.token_version. Changing the email or password
+or deleting the account bumps (or removes) it in the same transaction, which
+revokes every token issued before. The versions are read through a cache of
+TOKEN_VERSION_TTL_SECONDS per process, the longest another worker keeps
+accepting a revoked token; other than that the users table is only read by
+handlers that ask for the full ORM user.
+
+bcrypt runs on its own bounded executor (threads or processes) so a burst
+of logins queues up there instead of starving every other endpoint.
 """
 
+import asyncio
+import hmac
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional, Union, Any
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from . import database, models
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import cache, database, models, schemas
 
 
 # configuration 
 SECRET_KEY = "our-secret-key"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
+CLAIMS_CACHE_TTL_SECONDS = float(os.getenv("CLAIMS_CACHE_TTL_SECONDS", "60"))
+CLAIMS_CACHE_MAX_ENTRIES = int(os.getenv("CLAIMS_CACHE_MAX_ENTRIES", "10000"))
+TOKEN_VERSION_TTL_SECONDS = float(os.getenv("TOKEN_VERSION_TTL_SECONDS", "5")) # how long a worker trusts a user's token version
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12")) # work factor, existing hashes are upgraded on login
+HASH_EXECUTOR = os.getenv("HASH_EXECUTOR", "thread") # thread or process
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 2)))
+HASH_MAX_WAITING = int(os.getenv("HASH_MAX_WAITING", "256")) # beyond this, hashing requests get a 503
+OPS_TOKEN = os.getenv("OPS_TOKEN", "") # bearer token for the operational endpoints (stats), unset turns them off
 
-# password hashing setup
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# password hashing setup, a hash made with a different work factor "needs update"
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# decoded tokens, so a client reusing its token skips the signature check
+claims_cache = cache.MemoryBackend(CLAIMS_CACHE_MAX_ENTRIES, cache.CacheStats())
+# users.token_version by user id, MISSING_USER for an account that is gone
+version_cache = cache.MemoryBackend(CLAIMS_CACHE_MAX_ENTRIES, cache.CacheStats())
+MISSING_USER = -1
+
 
 # password utilities
 def verify_password(plain_password, hashed_password):
@@ -31,6 +63,78 @@ def verify_password(plain_password, hashed_password):
 def get_password(password):
     return pwd_context.hash(password)
 
+def verify_and_update_password(plain_password, hashed_password):
+    # (valid, new hash or None), the new hash is set when the work factor changed
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+class HashingStats:
+    def __init__(self):
+        self.completed = 0
+        self.rejected = 0
+        self.waiting = 0
+        self.running = 0
+        self.queue_seconds_total = 0.0
+        self.queue_seconds_max = 0.0
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+class PasswordHasher:
+    # runs bcrypt on a dedicated executor, at most `workers` at a time, and
+    # measures how long each call waited for a free slot
+    def __init__(self, kind: str = HASH_EXECUTOR, workers: int = HASH_WORKERS, max_waiting: int = HASH_MAX_WAITING):
+        self.kind = kind
+        self.workers = max(1, workers)
+        self.max_waiting = max_waiting
+        self.stats = HashingStats()
+        self._executor: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _ensure_started(self):
+        if self._executor is None:
+            executor_class = ProcessPoolExecutor if self.kind == "process" else ThreadPoolExecutor
+            self._executor = executor_class(max_workers=self.workers)
+            self._slots = asyncio.Semaphore(self.workers)
+
+    async def run(self, func, *args):
+        self._ensure_started()
+        if self.stats.waiting >= self.max_waiting:
+            self.stats.rejected += 1
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Too many password checks in progress, try again shortly")
+
+        queued_at = time.perf_counter()
+        self.stats.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.stats.waiting -= 1
+        waited = time.perf_counter() - queued_at
+        self.stats.queue_seconds_total += waited
+        self.stats.queue_seconds_max = max(self.stats.queue_seconds_max, waited)
+
+        self.stats.running += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self.stats.running -= 1
+            self.stats.completed += 1
+            self._slots.release()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+hasher = PasswordHasher()
+
+async def hash_password(password: str) -> str:
+    return await hasher.run(get_password, password)
+
+async def check_password(plain_password: str, hashed_password: str):
+    return await hasher.run(verify_and_update_password, plain_password, hashed_password)
+
 
 # JWT token utilities
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -39,32 +143,96 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode.update({"exp":expire})
     return jwt.encode(to_encode,SECRET_KEY,algorithm=ALGORITHM)
 
+async def create_user_token(user: models.User, expires_delta: Optional[timedelta] = None):
+    # the token version lets us revoke every token of a user by bumping it
+    return create_access_token(
+        data={"sub": user.email, "uid": user.id, "role": user.role, "ver": user.token_version or 0},
+        expires_delta=expires_delta
+    )
+
+
+# token revocation, the versions are kept on the users rows
+def _version_key(user_id: int) -> str:
+    return f"user-token:{user_id}"
+
+async def token_version(user_id: int) -> Optional[int]:
+    # None once the user is deleted
+    version = await version_cache.get(_version_key(user_id))
+    if version is None:
+        async with database.AsyncSessionLocal() as db:
+            version = await db.scalar(select(models.User.token_version).where(models.User.id == user_id))
+        version = MISSING_USER if version is None else version
+        await version_cache.set(_version_key(user_id), version, TOKEN_VERSION_TTL_SECONDS)
+    return None if version == MISSING_USER else version
+
+def revoke_user_tokens(user: models.User):
+    # committed with the caller's transaction, forget_token_version once it is
+    user.token_version = (user.token_version or 0) + 1
+
+async def forget_token_version(user_id: int):
+    # this worker sees the change right away, the others within TOKEN_VERSION_TTL_SECONDS
+    await version_cache.delete(_version_key(user_id))
+
 
 # security dependecies
-def get_current_user(db: Session = Depends(database.get_db), token: str = Depends(oauth2_scheme)):
+async def get_current_claims(token: str = Depends(oauth2_scheme)) -> schemas.TokenClaims:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate":"Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        sub_val: Any = payload.get("sub")
-        if sub_val is None or not isinstance(sub_val, str):
+    claims = await claims_cache.get(token)
+    if claims is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            sub_val: Any = payload.get("sub")
+            if sub_val is None or not isinstance(sub_val, str):
+                raise credentials_exception
+            # tokens issued before claims were added only carry the email, those have to log in again
+            if not isinstance(payload.get("uid"), int) or not isinstance(payload.get("role"), str):
+                raise credentials_exception
+            claims = schemas.TokenClaims(id=payload["uid"], email=sub_val, role=payload["role"], version=payload.get("ver", 0))
+        except JWTError:
             raise credentials_exception
-        email: str = sub_val
-    except JWTError:
+        # never keep a token around for longer than it is valid
+        ttl = min(CLAIMS_CACHE_TTL_SECONDS, payload["exp"] - time.time()) if "exp" in payload else CLAIMS_CACHE_TTL_SECONDS
+        if ttl > 0:
+            await claims_cache.set(token, claims, ttl)
+
+    # a revoked token, or one whose user is gone
+    if claims.version != await token_version(claims.id):
         raise credentials_exception
-    
-    user = db.query(models.User).filter(models.User.email == email).first()
+    return claims
+
+async def get_current_user(claims: schemas.TokenClaims = Depends(get_current_claims), db: AsyncSession = Depends(database.get_db)):
+    # the full ORM user, only for handlers that really need the row
+    user = await db.get(models.User, claims.id)
     if user is None:
-        raise credentials_exception
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate":"Bearer"},
+        )
     return user
 
 
+# operational endpoints are for whoever runs the service, not for its users: anyone can
+# register as an organizer, so they take a token of their own from the configuration
+async def require_ops_token(authorization: Optional[str] = Header(None)):
+    if not OPS_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), OPS_TOKEN.encode()):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid operations token",
+            headers={"WWW-Authenticate":"Bearer"},
+        )
+
+
 # role based access control
 def require_role(role: str):
-    def role_checker(current_user: models.User = Depends(get_current_user)):
+    async def role_checker(current_user: schemas.TokenClaims = Depends(get_current_claims)):
         if str(current_user.role) != role:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -72,4 +240,3 @@ def require_role(role: str):
             )
         return current_user
     return role_checker
-
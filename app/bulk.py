@@ -0,0 +1,257 @@
+"""
+Bulk event import (POST /events/bulk and the command line loader below).
+Events and their tickets arrive as an NDJSON or CSV stream and are written
+in batches: one executemany INSERT ... RETURNING for the events of a batch,
+one executemany INSERT for their tickets, one commit. The input is read line
+by line, so memory depends on the batch size and not on the size of the file.
+
+NDJSON, one event per line in the POST /events body shape:
+
+    {"title": "Jazz Night", "description": "...", "date": "2026-05-01T20:00:00", "venue": "Blue Hall", "tickets": [{"ticket_type": "GA", "price": 25, "quantity_available": 100}]}
+
+CSV with a header row, one row per ticket type. Consecutive rows with the same
+title, description, date and venue are one event (empty ticket columns: no tickets):
+
+    title,description,date,venue,ticket_type,price,quantity_available
+
+Invalid events are skipped and reported with their line number, the rest is imported.
+A line that is not UTF-8 stops the import with DecodeError, the batches before it stay imported.
+
+    PYTHONPATH=. python -m app.bulk events.ndjson --organizer o1@test.com
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
+from typing import AsyncIterator, Iterable, List, Optional
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import cache, database, models, querywatch, schemas
+
+
+# configuration
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "500")) # events per transaction
+BULK_MAX_ERRORS = int(os.getenv("BULK_MAX_ERRORS", "100")) # invalid events listed in the result, the rest are only counted
+
+FORMATS = ("ndjson", "csv")
+CSV_EVENT_COLUMNS = ("title", "description", "date", "venue")
+CSV_TICKET_COLUMNS = ("ticket_type", "price", "quantity_available")
+
+
+class DecodeError(ValueError):
+    # the input is not UTF-8, raised with the number of the line it was found on
+    def __init__(self, line: int):
+        super().__init__(f"line {line}: invalid UTF-8")
+        self.line = line
+
+
+class ParseError:
+    # a line the parsers could not read as an event, skipped and reported like an invalid one
+    def __init__(self, line: int, message: str):
+        self.line = line
+        self.message = message
+
+
+class ImportResult:
+    def __init__(self):
+        self.events = 0
+        self.tickets = 0
+        self.batches = 0
+        self.skipped = 0
+        self.errors: List[dict] = []
+        self.seconds = 0.0
+
+    def error(self, line: int, message: str):
+        self.skipped += 1
+        if len(self.errors) < BULK_MAX_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def as_dict(self):
+        rows = self.events + self.tickets
+        return {
+            "events": self.events,
+            "tickets": self.tickets,
+            "batches": self.batches,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "seconds": round(self.seconds, 3),
+            "rows_per_sec": round(rows / self.seconds) if self.seconds > 0 else rows,
+        }
+
+
+# reading, every parser yields (line number, event as a dict) or a ParseError
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    # a byte stream (request.stream()) as text lines, never holding more than one partial line
+    pending, number = b"", 0
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            number += 1
+            yield _decode(line, number)
+    if pending:
+        yield _decode(pending, number + 1)
+
+def _decode(line: bytes, number: int) -> str:
+    try:
+        return line.decode("utf-8")
+    except UnicodeDecodeError:
+        raise DecodeError(number) from None
+
+async def iter_ndjson(lines: AsyncIterator[str]):
+    number = 0
+    async for line in lines:
+        number += 1
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            yield ParseError(number, f"invalid JSON: {exc}")
+            continue
+        if not isinstance(record, dict):
+            yield ParseError(number, f"expected a JSON object, got {type(record).__name__}")
+            continue
+        yield number, record
+
+async def iter_csv(lines: AsyncIterator[str]):
+    header, event, event_key, event_line = None, None, None, 0
+    number, pending = 0, ""
+    async for line in lines:
+        number += 1
+        # a quoted field may span lines, the row is complete once its quotes are balanced
+        pending += line if not pending else "\n" + line
+        if pending.count('"') % 2:
+            continue
+        row, pending = next(csv.reader([pending.rstrip("\r")]), []), ""
+        if not any(field.strip() for field in row):
+            continue
+        if header is None:
+            header = [field.strip() for field in row]
+            missing = [name for name in CSV_EVENT_COLUMNS if name not in header]
+            if missing:
+                yield ParseError(number, f"CSV header is missing {', '.join(missing)}")
+                return
+            continue
+        values = dict(zip(header, row))
+        key = tuple(values.get(name, "") for name in CSV_EVENT_COLUMNS)
+        if event is None or key != event_key:
+            if event is not None:
+                yield event_line, event
+            event, event_key, event_line = {**dict(zip(CSV_EVENT_COLUMNS, key)), "tickets": []}, key, number
+        if any(values.get(name, "").strip() for name in CSV_TICKET_COLUMNS):
+            event["tickets"].append({name: values.get(name) for name in CSV_TICKET_COLUMNS})
+    if event is not None:
+        yield event_line, event
+
+async def _aiter(lines: Iterable[str]) -> AsyncIterator[str]:
+    for line in lines:
+        yield line.rstrip("\n")
+
+
+# writing
+def _event_row(event: schemas.EventCreate, organizer_id: int) -> dict:
+    # the same columns crud.create_event fills in
+    total_remaining = sum(ticket.quantity_available for ticket in event.tickets)
+    return {
+        "title": event.title,
+        "description": event.description,
+        "date": event.date,
+        "venue": event.venue,
+        "organizer_id": organizer_id,
+        "status": models.EventStatus.ACTIVE.value,
+        "total_remaining": total_remaining,
+        "is_sold_out": bool(event.tickets) and total_remaining <= 0,
+        **models.calendar_fields(event.date),
+    }
+
+async def _insert_batch(db: AsyncSession, organizer_id: int, batch: List[schemas.EventCreate]) -> int:
+    # the events with RETURNING, then all of their tickets. sqlalchemy only promises the ids in
+    # the order of the rows on sqlite by falling back to one INSERT per row, but sqlite hands out
+    # rowids in VALUES order while the transaction holds the write lock, so the batched insert's
+    # ids sorted are in the order of the rows
+    # one round of statements per batch, their repeats are not N+1 (app/querywatch.py)
+    with querywatch.batched():
+        sqlite = db.bind.dialect.name == "sqlite"
+        result = await db.execute(
+            insert(models.Event.__table__).returning(models.Event.id, sort_by_parameter_order=not sqlite),
+            [_event_row(event, organizer_id) for event in batch],
+        )
+        event_ids = sorted(result.scalars()) if sqlite else result.scalars().all()
+        tickets = [
+            {"event_id": event_id, "ticket_type": ticket.ticket_type, "price": ticket.price, "quantity_available": ticket.quantity_available}
+            for event_id, event in zip(event_ids, batch) for ticket in event.tickets
+        ]
+        if tickets:
+            await db.execute(insert(models.Ticket.__table__), tickets)
+        await db.commit()
+    await cache.bump_catalogue()
+    return len(tickets)
+
+async def import_events(db: AsyncSession, lines: AsyncIterator[str], organizer_id: int, import_format: str = "ndjson", batch_size: int = BULK_BATCH_SIZE) -> ImportResult:
+    # every batch is its own transaction, a failure leaves the batches before it imported
+    result = ImportResult()
+    started = time.perf_counter()
+    records = iter_csv(lines) if import_format == "csv" else iter_ndjson(lines)
+    batch = []
+    async for record in records:
+        if isinstance(record, ParseError):
+            result.error(record.line, record.message)
+            continue
+        line, event = record
+        try:
+            batch.append(schemas.EventCreate.model_validate(event))
+        except ValidationError as exc:
+            result.error(line, "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in exc.errors()))
+            continue
+        if len(batch) >= batch_size:
+            result.tickets += await _insert_batch(db, organizer_id, batch)
+            result.events += len(batch)
+            result.batches += 1
+            batch = []
+    if batch:
+        result.tickets += await _insert_batch(db, organizer_id, batch)
+        result.events += len(batch)
+        result.batches += 1
+    result.seconds = time.perf_counter() - started
+    return result
+
+async def load(lines: Iterable[str], organizer_id: int, import_format: str = "ndjson", batch_size: int = BULK_BATCH_SIZE) -> ImportResult:
+    # the same import from any iterable of lines (an open file, a list), on a session of its own
+    async with database.AsyncSessionLocal() as db:
+        return await import_events(db, _aiter(lines), organizer_id, import_format, batch_size)
+
+
+async def _main(args) -> Optional[ImportResult]:
+    async with database.AsyncSessionLocal() as db:
+        organizer = await db.scalar(select(models.User).where(models.User.email == args.organizer))
+    if organizer is None or organizer.role != "organizer":
+        print(f"{args.organizer} is not an organizer", file=sys.stderr)
+        return None
+    import_format = args.format or ("csv" if args.path.lower().endswith(".csv") else "ndjson")
+    if args.path == "-":
+        return await load(sys.stdin, organizer.id, import_format, args.batch_size)
+    with open(args.path, encoding="utf-8", newline="") as file:
+        return await load(file, organizer.id, import_format, args.batch_size)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import events and tickets from an NDJSON or CSV file")
+    parser.add_argument("path", help="file to import, - for stdin")
+    parser.add_argument("--organizer", required=True, help="email of the organizer the events belong to")
+    parser.add_argument("--format", choices=FORMATS, help="default: csv for *.csv files, ndjson otherwise")
+    parser.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE)
+    args = parser.parse_args()
+
+    result = asyncio.run(_main(args))
+    if result is None:
+        sys.exit(1)
+    summary = result.as_dict()
+    for error in summary.pop("errors"):
+        print(f"line {error['line']}: {error['error']}", file=sys.stderr)
+    print(", ".join(f"{name} {value}" for name, value in summary.items()))
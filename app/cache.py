@@ -0,0 +1,233 @@
+"""
+Read-through cache for the public catalogue (GET /events/ and /events/search).
+Entries are keyed by the normalised query parameters plus a catalogue version,
+so any change to what is listed (new, edited or removed events, an event
+selling out) simply moves every reader to fresh keys.
+
+Sales only bump the inventory version. A cached page from an older inventory
+version is still served, after its ticket quantities are refreshed with a
+single query, instead of being thrown away.
+
+The in-process backend is an LRU with TTL; set CACHE_BACKEND=redis to share
+entries and versions between workers.
+
+The same versions make the ETags of the catalogue listings (etag below), so a
+conditional GET is answered without building the page.
+"""
+
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+
+# configuration
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory") # memory, redis or off
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/1")
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "30"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+HTTP_MAX_AGE_SECONDS = int(os.getenv("HTTP_MAX_AGE_SECONDS", "0")) # how long clients may reuse a listing before revalidating it
+
+CATALOGUE = "catalogue"
+INVENTORY = "inventory"
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.inventory_refreshes = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return dict(vars(self))
+
+
+class MemoryBackend:
+    # LRU with per-entry expiry, evicting the least recently used entry when full
+    def __init__(self, max_entries: int, stats: CacheStats):
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.versions: Dict[str, int] = {}
+        # the versions only count this process's writes, its ETags must never match another worker's
+        self.scope = os.urandom(8).hex()
+        self.max_entries = max_entries
+        self.stats = stats
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            self.stats.evictions += 1
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: float):
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    async def delete(self, key: str):
+        self.entries.pop(key, None)
+
+    async def version(self, name: str) -> int:
+        return self.versions.get(name, 0)
+
+    async def bump(self, name: str) -> int:
+        self.versions[name] = self.versions.get(name, 0) + 1
+        return self.versions[name]
+
+
+class RedisBackend:
+    # entries expire on their own in redis, so evictions are not visible from here
+    def __init__(self, url: str):
+        import redis.asyncio as redis
+        self.client = redis.from_url(url)
+        self.prefix = "catalogue-cache:"
+        self.scope = "redis" # versions shared by every worker
+
+    async def get(self, key: str) -> Optional[Any]:
+        raw = await self.client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Any, ttl: float):
+        await self.client.set(self.prefix + key, json.dumps(value), px=int(ttl * 1000))
+
+    async def delete(self, key: str):
+        await self.client.delete(self.prefix + key)
+
+    async def version(self, name: str) -> int:
+        raw = await self.client.get(f"{self.prefix}version:{name}")
+        return int(raw) if raw is not None else 0
+
+    async def bump(self, name: str) -> int:
+        return await self.client.incr(f"{self.prefix}version:{name}")
+
+
+class NullBackend:
+    # CACHE_BACKEND=off, nothing is stored but the versions are still tracked
+    def __init__(self):
+        self.versions: Dict[str, int] = {}
+        self.scope = os.urandom(8).hex()
+
+    async def get(self, key: str) -> Optional[Any]:
+        return None
+
+    async def set(self, key: str, value: Any, ttl: float):
+        pass
+
+    async def delete(self, key: str):
+        pass
+
+    async def version(self, name: str) -> int:
+        return self.versions.get(name, 0)
+
+    async def bump(self, name: str) -> int:
+        self.versions[name] = self.versions.get(name, 0) + 1
+        return self.versions[name]
+
+
+stats = CacheStats()
+
+def _make_backend():
+    if CACHE_BACKEND == "redis":
+        return RedisBackend(CACHE_REDIS_URL)
+    if CACHE_BACKEND == "off":
+        return NullBackend()
+    return MemoryBackend(CACHE_MAX_ENTRIES, stats)
+
+backend = _make_backend()
+
+
+# version counters, bumped by crud after a successful commit
+async def bump_catalogue():
+    await backend.bump(CATALOGUE)
+
+async def bump_inventory():
+    await backend.bump(INVENTORY)
+
+
+def make_key(namespace: str, params: Dict[str, Any], catalogue_version: int) -> str:
+    # normalising the parameters so equivalent requests share one entry
+    normalised = {}
+    for name, value in params.items():
+        if isinstance(value, str):
+            value = value.strip().lower() or None
+        elif hasattr(value, "isoformat"):
+            value = value.isoformat()
+        normalised[name] = value
+    return f"{namespace}:v{catalogue_version}:{json.dumps(normalised, sort_keys=True)}"
+
+
+# conditional GET
+async def etag(namespace: str, params: Dict[str, Any]) -> str:
+    # strong validator for a listing, built from the versions instead of the rendered body.
+    # it also rolls over every CACHE_TTL_SECONDS, which bounds staleness the same way the
+    # entries' TTL does (events dropping out of "upcoming", writes made outside the app)
+    catalogue_version = await backend.version(CATALOGUE)
+    inventory_version = await backend.version(INVENTORY)
+    window = int(time.time() // CACHE_TTL_SECONDS) if CACHE_TTL_SECONDS > 0 else 0
+    raw = f"{backend.scope}:{window}:i{inventory_version}:{make_key(namespace, params, catalogue_version)}"
+    return '"' + hashlib.blake2b(raw.encode(), digest_size=12).hexdigest() + '"'
+
+def etag_matches(if_none_match: Optional[str], current: str) -> bool:
+    # If-None-Match compares weakly, a W/ prefix still matches
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(candidate.strip().removeprefix("W/") == current for candidate in if_none_match.split(","))
+
+def cache_control(private: bool = False) -> str:
+    return f"{'private' if private else 'public'}, max-age={HTTP_MAX_AGE_SECONDS}, must-revalidate"
+
+
+def ticket_ids(page: Dict[str, Any]) -> Iterable[int]:
+    return [ticket["id"] for event in page["items"] for ticket in event.get("tickets", [])]
+
+def apply_quantities(page: Dict[str, Any], quantities: Dict[int, int]):
+    for event in page["items"]:
+        for ticket in event.get("tickets", []):
+            if ticket["id"] in quantities:
+                ticket["quantity_available"] = quantities[ticket["id"]]
+
+
+async def read_through(
+    namespace: str,
+    params: Dict[str, Any],
+    load: Callable[[], Awaitable[Dict[str, Any]]],
+    load_quantities: Callable[[Iterable[int]], Awaitable[Dict[int, int]]],
+    fresh: bool = False,
+    ttl: float = CACHE_TTL_SECONDS,
+) -> Dict[str, Any]:
+    # `load` builds the page ({"items": [...], ...}) on a miss, `load_quantities` maps
+    # ticket ids to their current stock for pages cached under an older inventory version.
+    # `fresh` skips the cached page and replaces it with the one loaded, `ttl` is how long
+    # what this request stores is kept
+    catalogue_version = await backend.version(CATALOGUE)
+    inventory_version = await backend.version(INVENTORY)
+    key = make_key(namespace, params, catalogue_version)
+
+    entry = None if fresh else await backend.get(key)
+    if entry is None:
+        stats.misses += 1
+        page = await load()
+        await backend.set(key, {"inventory": inventory_version, "page": page}, ttl)
+        return page
+
+    stats.hits += 1
+    page = entry["page"]
+    if entry["inventory"] != inventory_version:
+        stats.inventory_refreshes += 1
+        ids = ticket_ids(page)
+        if ids:
+            apply_quantities(page, await load_quantities(ids))
+        await backend.set(key, {"inventory": inventory_version, "page": page}, ttl)
+    return page
@@ -2,149 +2,341 @@
 Create, Read, Update and Delete logic
 """
 
-from sqlalchemy import extract, or_, func
-from sqlalchemy.orm import Session
+from sqlalchemy import case, delete, extract, insert, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from typing import List, Optional, Any
 from datetime import datetime
-from . import models, schemas
+from . import auth, cache, metrics, models, outbox, pagination, sales, schemas, search, serialization, tasks
+
+
+# configuration
+WAITLIST_BATCH_SIZE = 500 # waitlist rows fetched at a time while reassigning cancelled tickets
+EMAIL_CHUNK_SIZE = 1000 # recipients fetched at a time when an event changes
+ATTENDEE_CHUNK_SIZE = 2000 # attendee rows fetched at a time by the exports
+
+# start hours of each time_slot filter value, night wraps around midnight
+TIME_SLOT_HOURS = {
+    "morning": list(range(6, 12)),
+    "noon": list(range(12, 17)),
+    "afternoon": list(range(12, 17)),
+    "evening": list(range(17, 21)),
+    "night": list(range(21, 24)) + list(range(0, 6)),
+}
+
+
+# inventory counters
+async def adjust_event_inventory(db: AsyncSession, ticket_id: int, delta: int):
+    # moves the denormalised counters on the ticket's event by `delta` tickets,
+    # called next to every statement that changes tickets.quantity_available.
+    # returns True when the event flipped between available and sold out
+    event_id = select(models.Ticket.event_id).where(models.Ticket.id == ticket_id).scalar_subquery()
+    return await adjust_event_counters(db, event_id, delta)
+
+async def adjust_event_counters(db: AsyncSession, event_id, delta: int):
+    # same as above for a known event id (or a subquery producing one)
+    remaining = models.Event.total_remaining + delta
+    new_remaining = await db.scalar(
+        update(models.Event)
+        .where(models.Event.id == event_id)
+        .values(total_remaining=remaining, is_sold_out=remaining <= 0)
+        .returning(models.Event.total_remaining)
+        .execution_options(synchronize_session=False)
+    )
+    if new_remaining is None:
+        return False
+    return (new_remaining <= 0) != (new_remaining - delta <= 0)
+
+async def bump_inventory_versions(sold_out_changed: bool):
+    # a sale only refreshes quantities in cached listings, unless an event
+    # sold out (or came back) which changes the order of the listings
+    await cache.bump_inventory()
+    if sold_out_changed:
+        await cache.bump_catalogue()
+
+async def get_ticket_quantities(db: AsyncSession, ticket_ids):
+    rows = await db.execute(select(models.Ticket.id, models.Ticket.quantity_available).where(models.Ticket.id.in_(list(ticket_ids))))
+    return {ticket_id: quantity for ticket_id, quantity in rows}
 
 
 # event management
-def create_event(db: Session, event: schemas.EventCreate, organizer_id: int):
-    # creating event object
+async def create_event(db: AsyncSession, event: schemas.EventCreate, organizer_id: int):
+    # creating event object along with its associated ticket types
+    total_remaining = sum(ticket.quantity_available for ticket in event.tickets)
     db_event = models.Event(
         title = event.title,
         description = event.description,
         date = event.date,
         venue = event.venue,
-        organizer_id = organizer_id
+        organizer_id = organizer_id,
+        total_remaining = total_remaining,
+        is_sold_out = bool(event.tickets) and total_remaining <= 0,
+        tickets = [
+            models.Ticket(
+                ticket_type = ticket.ticket_type,
+                price = ticket.price,
+                quantity_available = ticket.quantity_available
+            )
+            for ticket in event.tickets
+        ]
     )
     db.add(db_event)
-    db.commit()
-    db.refresh(db_event)
-
-    # creating associated ticket types
-    for ticket in event.tickets:
-        db_ticket = models.Ticket(
-            ticket_type = ticket.ticket_type,
-            price = ticket.price,
-            quantity_available = ticket.quantity_available,
-            event_id = db_event.id
-        )
-        db.add(db_ticket)
-    
-    db.commit()
-    db.refresh(db_event)
+    await db.commit()
+    await cache.bump_catalogue()
     return db_event
 
 
-def get_events(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Event).filter(models.Event.status == models.EventStatus.ACTIVE.value, models.Event.deleted_at == None).order_by(models.Event.inventory_status.asc(), models.Event.date.asc()).offset(skip).limit(limit).all()
+async def get_event(db: AsyncSession, event_id: int):
+    return await db.scalar(select(models.Event).options(selectinload(models.Event.tickets)).where(models.Event.id == event_id))
+
+# listings take either an offset (skip) or the decoded cursor key of the previous page (after)
+async def fetch_events(db: AsyncSession, query, as_rows: bool = False):
+    # runs an event listing, as Event objects with their tickets or, for the
+    # FAST_JSON path, as plain dicts in the schemas.Event shape
+    if as_rows:
+        return await serialization.event_rows(db, query)
+    return (await db.scalars(query.options(selectinload(models.Event.tickets)))).all()
 
-def get_organizer_events(db: Session, organizer_id: int):
-    return db.query(models.Event).filter(models.Event.organizer_id == organizer_id).all()
+async def get_events(db: AsyncSession, skip: int = 0, limit: int = 100, after: Optional[tuple] = None, as_rows: bool = False):
+    query = select(models.Event).where(models.Event.status == models.EventStatus.ACTIVE.value, models.Event.deleted_at == None)
+    query = pagination.EVENT_LISTING.page(query, skip=skip, limit=limit, after=after)
+    return await fetch_events(db, query, as_rows)
 
-def update_event(db: Session, event_id: int, event_update: schemas.EventUpdate):
-    db_event = db.query(models.Event).filter(models.Event.id == event_id).first()
+async def get_organizer_events(db: AsyncSession, organizer_id: int, skip: int = 0, limit: int = 100, after: Optional[tuple] = None, as_rows: bool = False):
+    query = select(models.Event).where(models.Event.organizer_id == organizer_id)
+    query = pagination.ORGANIZER_EVENTS.page(query, skip=skip, limit=limit, after=after)
+    return await fetch_events(db, query, as_rows)
+
+async def update_event(db: AsyncSession, event_id: int, event_update: schemas.EventUpdate):
+    # the event row is locked first, bookings update it too (its counters), so none can
+    # commit between reading the recipients and cancelling their bookings
+    db_event = await db.scalar(select(models.Event).options(selectinload(models.Event.tickets)).where(models.Event.id == event_id).with_for_update(of=models.Event))
     if db_event:
         # updating only those fields which were requested
         update_data = event_update.model_dump(exclude_unset=True)
         for key, value in update_data.items():
             setattr(db_event, key, value)
-        # if an event is cancelled, cancel all associated bookings
+        await db.flush()
+
+        # notifying customers of the update or the cancellation, committed together with it. the
+        # recipients are streamed, each chunk is written to the outbox before the next one is read
+        msg = f"Update for {db_event.title}" if db_event.status == models.EventStatus.ACTIVE.value else f"CANCELLED: {db_event.title}"
+        async for recipients in iter_event_customer_emails(db, event_id):
+            outbox.add_all(db, tasks.event_update_messages(recipients, msg))
+            await db.flush()
+
+        # if an event is cancelled, cancel all associated bookings with one set-based update
         if event_update.status == models.EventStatus.CANCELLED.value:
-            bookings = db.query(models.Booking).join(models.Ticket).filter(models.Ticket.event_id == event_id).all()
-            for b in bookings:
-                b.status = models.BookingStatus.CANCELLED.value
-        
-        db.commit()
-        db.refresh(db_event)
+            await db.execute(
+                update(models.Booking)
+                .where(models.Booking.ticket_id.in_(select(models.Ticket.id).where(models.Ticket.event_id == event_id)), models.Booking.status != models.BookingStatus.CANCELLED.value)
+                .values(status=models.BookingStatus.CANCELLED.value)
+                .execution_options(synchronize_session=False)
+            )
+            await sales.clear_event(db, event_id)
+
+        await db.commit()
+        await cache.bump_catalogue()
     return db_event
 
-def delete_event(db: Session, event_id: int):
-    db_event = db.query(models.Event).filter(models.Event.id == event_id).first()
+async def iter_event_customer_emails(db: AsyncSession, event_id: int, chunk_size: int = EMAIL_CHUNK_SIZE):
+    # emails of everyone still holding a confirmed booking for the event,
+    # streamed from the database `chunk_size` at a time
+    query = (
+        select(models.User.email)
+        .join(models.Booking, models.Booking.customer_id == models.User.id)
+        .join(models.Ticket, models.Booking.ticket_id == models.Ticket.id)
+        .where(models.Ticket.event_id == event_id, models.Booking.status == models.BookingStatus.CONFIRMED.value)
+        .distinct()
+        .execution_options(yield_per=chunk_size)
+    )
+    result = await db.stream_scalars(query)
+    async for chunk in result.partitions(chunk_size):
+        yield list(chunk)
+
+async def delete_event(db: AsyncSession, event_id: int):
+    db_event = await db.get(models.Event, event_id)
     if db_event:
         db_event.deleted_at = datetime.now() # soft delete by setting deleted_at timestamp
         db_event.status = models.EventStatus.CANCELLED.value # marking the event as cancelled to prevent it from showing up in active listings
-        db.commit()
+        await db.commit()
+        await cache.bump_catalogue()
     return db_event
 
-def search_events(db: Session, location: str = None, is_weekend: bool = None, date: datetime = None, time_slot: str = None):
+async def search_events(db: AsyncSession, location: str = None, is_weekend: bool = None, date: datetime = None, time_slot: str = None, skip: int = 0, limit: int = 100, after: Optional[tuple] = None, text: str = None, as_rows: bool = False):
     # default active events first and sold out events later, all of these by date ascending
-    query = db.query(models.Event).filter(models.Event.status == models.EventStatus.ACTIVE.value, models.Event.deleted_at == None)
+    query = select(models.Event).where(models.Event.status == models.EventStatus.ACTIVE.value, models.Event.deleted_at == None)
 
     # searching by venue
     if location and location.strip():
-        query = query.filter(models.Event.venue.ilike(f"%{location}"))
+        query = query.where(models.Event.venue.ilike(f"%{location}"))
 
-    # searching by date 
+    # searching by date
     if date:
-        query = query.filter(func.date(models.Event.date) == date.date())
+        query = query.where(models.Event.start_day == date.date())
     else:
-        query = query.filter(models.Event.date >= datetime.now())
-    
-    # searching by time slot
+        query = query.where(models.Event.date >= datetime.now())
+
+    # searching by time slot, the slot's hours looked up on the stored start_hour
     if time_slot:
-        hour_col = func.strftime('%H', models.Event.date)
-        ts = time_slot.lower().strip()
-        if ts == "morning":
-            query = query.filter(hour_col >= '06', hour_col < '12')
-        elif ts in ["noon", "afternoon"]:
-            query = query.filter(hour_col >= '12', hour_col < '17')
-        elif ts == "evening":
-            query = query.filter(hour_col >= '17', hour_col < '21')
-        elif ts == "night":
-            query = query.filter(or_(hour_col >= '21', hour_col < '06'))
-    
+        hours = TIME_SLOT_HOURS.get(time_slot.lower().strip())
+        if hours:
+            query = query.where(models.Event.start_hour.in_(hours))
+
     # weekend flag
     if is_weekend is not None:
-        dow = dow = func.strftime('%w', models.Event.date)
         if is_weekend is True:
             # 0-6 with 0 as Sunday and 6 as Saturday
-            query = query.filter(or_(dow == '0', dow == '6'))
+            query = query.where(models.Event.day_of_week.in_([0, 6]))
         else:
             # 1-5 for weekdays
-            query = query.filter(dow.in_(['1', '2', '3', '4', '5']))
-    
-    return query.order_by(models.Event.inventory_status.asc(), models.Event.date.asc()).all()
+            query = query.where(models.Event.day_of_week.in_([1, 2, 3, 4, 5]))
+
+    # full-text search over title, description and venue, ranked by relevance and paged by offset
+    if text and text.strip():
+        query = search.apply(query, text, db.bind.dialect.name)
+        if query is None:
+            return []
+        return await fetch_events(db, query.offset(skip).limit(limit), as_rows)
+
+    query = pagination.EVENT_LISTING.page(query, skip=skip, limit=limit, after=after)
+    return await fetch_events(db, query, as_rows)
 
 # booking logic for customers
-def create_booking(db: Session, booking: schemas.BookingCreate, customer_id: int):
-    # checking for ticket availability
-    db_ticket = db.query(models.Ticket).filter(models.Ticket.id == booking.ticket_id).with_for_update().first() # locking the row for update to prevent race conditions
-    
-    if not db_ticket:
+async def create_booking(db: AsyncSession, booking: schemas.BookingCreate, customer_id: int, notify_email: Optional[str] = None):
+    if booking.quantity <= 0:
+        metrics.BOOKINGS.inc("single", "invalid_quantity")
         return None
-    
-    # converting the column value to python int for comparison
-    if db_ticket.quantity_available < booking.quantity:
+
+    # deducting stock with a single conditional update, the database checks availability
+    # and decrements in one step so concurrent buyers can never oversell the ticket
+    result = await db.execute(
+        update(models.Ticket)
+        .where(models.Ticket.id == booking.ticket_id, models.Ticket.quantity_available >= booking.quantity)
+        .values(quantity_available=models.Ticket.quantity_available - booking.quantity)
+        .execution_options(synchronize_session=False)
+    )
+
+    # no affected row means the ticket doesn't exist or there isn't enough stock left
+    if result.rowcount != 1:
+        await db.rollback()
+        metrics.BOOKINGS.inc("single", "unavailable")
         return None
+    sold_out_changed = await adjust_event_inventory(db, booking.ticket_id, -booking.quantity)
 
-    # deducting stock
-    db_ticket.quantity_available -= booking.quantity
+    # the ticket and its event come along for the confirmation message
+    db_ticket = await db.scalar(select(models.Ticket).options(selectinload(models.Ticket.event)).where(models.Ticket.id == booking.ticket_id))
 
     new_booking = models.Booking(
         customer_id = customer_id,
-        ticket_id = booking.ticket_id,
+        ticket = db_ticket,
         quantity = booking.quantity,
         status=models.BookingStatus.CONFIRMED.value
     )
-    
+
     db.add(new_booking)
-    db.commit()
-    db.refresh(new_booking)
-    db.refresh(db_ticket) # refreshing ticket to get updated quantity for inventory status calculation
+    await sales.adjust(db, [(db_ticket.id, db_ticket.event_id, booking.quantity, 1)])
+    if notify_email:
+        outbox.add(db, tasks.send_booking_confirmation.s(notify_email, f"CONFIRMED: {db_ticket.event.title}"))
+    await db.commit()
+    metrics.BOOKINGS.inc("single", "confirmed")
+    await bump_inventory_versions(sold_out_changed)
     return new_booking
 
-def get_user_bookings(db: Session, user_id: int):
-    return db.query(models.Booking).filter(models.Booking.customer_id == user_id).all()
+async def create_bookings(db: AsyncSession, items: List[schemas.BookingCreate], customer_id: int, notify_email: Optional[str] = None):
+    # several ticket types in one transaction, either every line is booked or none is
+    quantities = {}
+    for item in items:
+        if item.quantity <= 0:
+            metrics.BOOKINGS.inc("cart", "invalid_quantity")
+            return None
+        quantities[item.ticket_id] = quantities.get(item.ticket_id, 0) + item.quantity
+    ticket_ids = sorted(quantities)
+
+    # locking the ticket rows in id order so two overlapping carts can't deadlock each other
+    db_tickets = (await db.scalars(
+        select(models.Ticket)
+        .options(selectinload(models.Ticket.event))
+        .where(models.Ticket.id.in_(ticket_ids))
+        .order_by(models.Ticket.id)
+        .with_for_update(of=models.Ticket)
+    )).all()
+    if len(db_tickets) != len(ticket_ids):
+        await db.rollback()
+        metrics.BOOKINGS.inc("cart", "unavailable")
+        return None
 
-def get_event_bookings(db: Session, event_id:int):
-    return db.query(models.Booking).join(models.Ticket).filter(models.Ticket.event_id == event_id).all()
+    # one conditional update for every line, a single line short on stock leaves the whole
+    # statement matching fewer rows than requested and the cart is rolled back
+    requested = case(quantities, value=models.Ticket.id)
+    result = await db.execute(
+        update(models.Ticket)
+        .where(models.Ticket.id.in_(ticket_ids), models.Ticket.quantity_available >= requested)
+        .values(quantity_available=models.Ticket.quantity_available - requested)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != len(ticket_ids):
+        await db.rollback()
+        metrics.BOOKINGS.inc("cart", "unavailable")
+        return None
+
+    event_deltas = {}
+    for db_ticket in db_tickets:
+        event_deltas[db_ticket.event_id] = event_deltas.get(db_ticket.event_id, 0) + quantities[db_ticket.id]
+    sold_out_changed = False
+    for event_id in sorted(event_deltas):
+        sold_out_changed |= await adjust_event_counters(db, event_id, -event_deltas[event_id])
+
+    new_bookings = [
+        models.Booking(
+            customer_id = customer_id,
+            ticket = db_ticket,
+            quantity = quantities[db_ticket.id],
+            status=models.BookingStatus.CONFIRMED.value
+        )
+        for db_ticket in db_tickets
+    ]
+    db.add_all(new_bookings)
+    await sales.adjust(db, [(db_ticket.id, db_ticket.event_id, quantities[db_ticket.id], 1) for db_ticket in db_tickets])
+    if notify_email:
+        # one confirmation for the whole cart
+        lines = ", ".join(f"{db_ticket.event.title} - {db_ticket.ticket_type} x{quantities[db_ticket.id]}" for db_ticket in db_tickets)
+        outbox.add(db, tasks.send_booking_confirmation.s(notify_email, f"CONFIRMED: {lines}"))
+    await db.commit()
+    metrics.BOOKINGS.inc("cart", "confirmed")
+    await bump_inventory_versions(sold_out_changed)
+    return new_bookings
+
+async def get_user_bookings(db: AsyncSession, user_id: int, skip: int = 0, limit: int = 100, after: Optional[tuple] = None, as_rows: bool = False):
+    query = pagination.USER_BOOKINGS.page(select(models.Booking).where(models.Booking.customer_id == user_id), skip=skip, limit=limit, after=after)
+    if as_rows:
+        return await serialization.booking_rows(db, query)
+    return (await db.scalars(query)).all()
+
+def event_attendees_query(event_id: int):
+    # the event's confirmed bookings with their customer's email and ticket type. ticket then
+    # booking order is the order ix_bookings_ticket_status hands them out in, nothing gets sorted
+    return (
+        select(models.Booking.id, models.Ticket.id, models.Ticket.ticket_type, models.User.email, models.Booking.quantity)
+        .join(models.Ticket, models.Booking.ticket_id == models.Ticket.id)
+        .join(models.User, models.Booking.customer_id == models.User.id)
+        .where(models.Ticket.event_id == event_id, models.Booking.status == models.BookingStatus.CONFIRMED.value)
+        .order_by(models.Ticket.id, models.Booking.id)
+    )
+
+async def iter_event_attendees(db: AsyncSession, event_id: int, chunk_size: int = ATTENDEE_CHUNK_SIZE):
+    # streamed through a server-side cursor `chunk_size` rows at a time
+    result = await db.stream(event_attendees_query(event_id).execution_options(yield_per=chunk_size))
+    async for chunk in result.partitions(chunk_size):
+        yield chunk
+
+async def cancel_booking(db: AsyncSession, booking_id: int, user_id: int, notify_email: Optional[str] = None):
+    # the event row is locked before the booking, in the order update_event takes them, so a
+    # cancellation and an edit of the same event wait for each other instead of deadlocking
+    booking_event = select(models.Ticket.event_id).join(models.Booking, models.Booking.ticket_id == models.Ticket.id).where(models.Booking.id == booking_id).scalar_subquery()
+    await db.execute(select(models.Event.id).where(models.Event.id == booking_event).with_for_update())
+    booking = await db.scalar(select(models.Booking).options(selectinload(models.Booking.ticket).selectinload(models.Ticket.event)).where(models.Booking.id == booking_id, models.Booking.customer_id == user_id).with_for_update()) # locking the row for update to prevent race conditions
 
-def cancel_booking(db: Session, booking_id: int, user_id: int):
-    booking = db.query(models.Booking).filter(models.Booking.id == booking_id, models.Booking.customer_id == user_id).with_for_update().first() # locking the row for update to prevent race conditions
-    
     if not booking or booking.status == models.BookingStatus.CANCELLED.value:
         return booking, []
 
@@ -152,83 +344,118 @@ def cancel_booking(db: Session, booking_id: int, user_id: int):
     ticket_id = booking.ticket_id
     available_to_reassign = booking.quantity
     fulfilled_users = [] # to keep track of waitlist users who got fulfilled from this cancellation
-
-    print(f"DEBUG: Cancelling {available_to_reassign} tickets for booking ID {ticket_id}")
-
-    # keep fulfilling the cancelled booking quantity from the waitlist before adding back to available stock
-    while available_to_reassign > 0:
-        all_waiting = db.query(models.Waitlist).filter(models.Waitlist.ticket_id == ticket_id).all()
-        print(f"DEBUG: Total people on waitlist for this: {len(all_waiting)}")
-        
-        # checking the waitlist with the first entry for same event
-        waitlist_entry = db.query(models.Waitlist).filter(models.Waitlist.ticket_id == ticket_id, models.Waitlist.quantity <= available_to_reassign).order_by(models.Waitlist.created_at.asc()).with_for_update().first()
-
-        if not waitlist_entry:
-            print(f"DEBUG: No suitable waitlist entry found. Breaking loop")
+    sold_out_changed = None # stays None when the waitlist takes every ticket and stock is untouched
+
+    # one ordered pass over the waitlist (oldest first, served by ix_waitlist_queue), every entry that
+    # still fits the tickets left gets them, larger ones keep their place in the queue. the user's
+    # email comes along in the same query and the scan stops as soon as nothing is left to hand out
+    candidates = await db.stream(
+        select(models.Waitlist.id, models.Waitlist.user_id, models.Waitlist.quantity, models.User.email)
+        .join(models.User, models.User.id == models.Waitlist.user_id)
+        .where(models.Waitlist.ticket_id == ticket_id, models.Waitlist.quantity <= available_to_reassign)
+        .order_by(models.Waitlist.created_at.asc(), models.Waitlist.id.asc())
+        .with_for_update(of=models.Waitlist)
+        .execution_options(yield_per=WAITLIST_BATCH_SIZE)
+    )
+    fulfilled_entry_ids = []
+    new_bookings = []
+    async for entry_id, entry_user_id, entry_quantity, entry_email in candidates:
+        if entry_quantity > available_to_reassign:
+            continue
+        fulfilled_entry_ids.append(entry_id)
+        new_bookings.append({"customer_id": entry_user_id, "ticket_id": ticket_id, "quantity": entry_quantity, "status": models.BookingStatus.CONFIRMED.value})
+        fulfilled_users.append({"email": entry_email, "event_title": booking.ticket.event.title, "quantity": entry_quantity})
+        available_to_reassign -= entry_quantity
+        if available_to_reassign <= 0:
             break
+    await candidates.close()
 
-        print(f"DEBUG: Fulfilling waitlist for User {waitlist_entry.user_id} with {waitlist_entry.quantity} tickets")
-        
-        new_booking = models.Booking(customer_id=waitlist_entry.user_id, ticket_id=ticket_id, quantity=waitlist_entry.quantity, status=models.BookingStatus.CONFIRMED.value)
-        db.add(new_booking)
-
-        # track the user and their email for notification
-        fulfilled_users.append({
-            "email": waitlist_entry.user.email,
-            "event_title": waitlist_entry.ticket.event.title,
-            "quantity": waitlist_entry.quantity
-        })
-
-        available_to_reassign -= waitlist_entry.quantity
-        db.delete(waitlist_entry)
-        db.flush() # flushing after each assignment to update the available quantity for next waitlist entry
+    if fulfilled_entry_ids:
+        await db.execute(insert(models.Booking), new_bookings)
+        await db.execute(delete(models.Waitlist).where(models.Waitlist.id.in_(fulfilled_entry_ids)).execution_options(synchronize_session=False))
 
     if available_to_reassign > 0:
-        # adding the remaining quantity back to available stock
-        ticket = db.query(models.Ticket).filter(models.Ticket.id == ticket_id).with_for_update().first()
-        if ticket:
-            ticket.quantity_available += available_to_reassign
-            print(f"DEBUG: Returned {available_to_reassign} tickets to genarak slot")
-    
-    db.commit()
-    db.refresh(booking)
+        # adding the remaining quantity back to available stock, relative to whatever is in the row right now
+        await db.execute(
+            update(models.Ticket)
+            .where(models.Ticket.id == ticket_id)
+            .values(quantity_available=models.Ticket.quantity_available + available_to_reassign)
+            .execution_options(synchronize_session=False)
+        )
+        sold_out_changed = await adjust_event_inventory(db, ticket_id, available_to_reassign)
+
+    # the cancelled booking out of the ticket type's sales and the waitlist's bookings in, one rollup row
+    # either way, after the ticket and its event like on the booking path
+    handed_out = sum(row["quantity"] for row in new_bookings)
+    await sales.adjust(db, [(ticket_id, booking.ticket.event_id, handed_out - booking.quantity, len(new_bookings) - 1)])
+
+    # notifying the user about cancellation and the user(s) who got confirmed tickets from waitlist, all in one batch
+    messages = [(notify_email, f"CANCELLED: {booking.ticket.event.title}")] if notify_email else []
+    for user_data in fulfilled_users:
+        messages.append((user_data["email"], f"CONFIRMED from Waitlist: {user_data['event_title']} (Quantity: {user_data['quantity']})"))
+    outbox.add_all(db, tasks.confirmation_messages(messages))
+
+    await db.commit()
+    if sold_out_changed is not None:
+        await bump_inventory_versions(sold_out_changed)
     return booking, fulfilled_users
 
-def join_waitlist(db: Session, ticket_id: int, user_id: int, quantity: int):
+async def join_waitlist(db: AsyncSession, ticket_id: int, user_id: int, quantity: int, notify_email: Optional[str] = None):
+    # notifying the user for waitlisting
+    def notify():
+        if notify_email:
+            outbox.add(db, tasks.send_booking_confirmation.s(notify_email, f"WAITLISTED: You are in line for {quantity} ticket(s)."))
+
     # not allowing to make duplicate waitlist entries for same user and ticket
-    existing = db.query(models.Waitlist).filter(models.Waitlist.ticket_id == ticket_id, models.Waitlist.user_id == user_id).first()
+    existing = await db.scalar(select(models.Waitlist).where(models.Waitlist.ticket_id == ticket_id, models.Waitlist.user_id == user_id))
 
     if existing:
+        notify()
+        await db.commit()
         return existing
-    
+
     # not allowing to join waitlist with quantity more than total capacity of the event
-    ticket = db.query(models.Ticket).filter(models.Ticket.id == ticket_id).first()
+    ticket = await db.get(models.Ticket, ticket_id)
 
-    total_ever_available = ticket.quantity_available + db.query(func.sum(models.Booking.quantity)).filter(models.Booking.ticket_id == ticket_id, models.Booking.status == "confirmed").scalar() or 0
+    booked = await db.scalar(select(func.sum(models.Booking.quantity)).where(models.Booking.ticket_id == ticket_id, models.Booking.status == "confirmed")) or 0
+    total_ever_available = ticket.quantity_available + booked
 
     if quantity > total_ever_available:
         return "EXCEEDS_CAPACITY"
 
     new_entry = models.Waitlist(ticket_id=ticket_id, user_id=user_id, quantity=quantity)
     db.add(new_entry)
-    db.commit()
-    db.refresh(new_entry)
+    notify()
+    await db.commit()
+    await db.refresh(new_entry)
     return new_entry
 
 # user management
-def update_user(db: Session, user_id: int, user_update: schemas.UserUpdate):
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+async def get_user_by_email(db: AsyncSession, email: str):
+    return await db.scalar(select(models.User).where(models.User.email == email))
+
+async def update_user(db: AsyncSession, user_id: int, user_update: schemas.UserUpdate):
+    db_user = await db.get(models.User, user_id)
     if db_user:
         if user_update.email:
             setattr(db_user, "email", str(user_update.email))
-        db.commit()
-        db.refresh(db_user)
+        if user_update.password:
+            setattr(db_user, "hashed_password", await auth.hash_password(user_update.password))
+        # the email is part of the token and a new password should log everyone else out,
+        # the tokens issued before are revoked in the same transaction
+        if user_update.email or user_update.password:
+            auth.revoke_user_tokens(db_user)
+        await db.commit()
+        await auth.forget_token_version(user_id)
     return db_user
 
-def delete_user(db: Session, user_id: int):
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+async def delete_user(db: AsyncSession, user_id: int):
+    db_user = await db.get(models.User, user_id)
     if db_user:
-        db.delete(db_user)
-        db.commit()
+        await sales.remove_customer(db, user_id) # their bookings go with them
+        await db.delete(db_user)
+        await db.commit()
+        await auth.forget_token_version(user_id) # their tokens stop working with the row
+        await cache.bump_catalogue() # an organizer's events go with them
         return True
-    return False
\ No newline at end of file
+    return False
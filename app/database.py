@@ -1,29 +1,193 @@
 """
-Database connection setup. It tells FastAPI 
+Database connection setup. It tells FastAPI
 how to talk to our database, where is it present, etc.
 """
 
-from sqlalchemy import create_engine
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from . import metrics
 
-# creating a local sqlite database file
-SQLALCHEMY_DATABASE_URL = "sqlite:///./event_system.db"
+# configuration, DATABASE_URL points us somewhere other than the local sqlite file
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./event_system.db")
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()] # read-only copies of the primary, app/replicas.py routes reads to them
+DB_ECHO = os.getenv("DB_ECHO", "off") == "on" # logs every statement
+QUERY_COUNT_HEADER = os.getenv("QUERY_COUNT_HEADER", "off") == "on" # X-Query-Count on every response, for development and the benchmarks
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10")) # connections kept open per engine
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20")) # extra connections under load, closed when returned
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30")) # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800")) # reconnect after this many seconds, before servers or proxies drop idle connections
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "on") == "on" # test a connection on checkout, a dead one is replaced instead of failing the request
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL") # WAL lets readers carry on while a writer commits
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL") # NORMAL is durable with WAL except for the last commits on power loss
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")) # how long a writer waits for the lock before "database is locked"
+SQLITE_CACHE_SIZE_KIB = int(os.getenv("SQLITE_CACHE_SIZE_KIB", "65536")) # page cache per connection
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))) # bytes of the file read through mmap, 0 turns it off
 
-# core interface of the db is engine
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread":False}, echo=True)
+# async driver used for every sync url we know about
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "postgresql+psycopg": "postgresql+psycopg",
+}
+
+def to_async_url(url: str) -> str:
+    sync_url = make_url(url)
+    return sync_url.set(drivername=ASYNC_DRIVERS.get(sync_url.drivername, sync_url.drivername)).render_as_string(hide_password=False)
+
+ASYNC_DATABASE_URL = to_async_url(SQLALCHEMY_DATABASE_URL)
+
+# pools that report how long a checkout waited for a connection to /metrics
+class TimedCheckout:
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.DB_POOL_CHECKOUT.observe(time.perf_counter() - started)
+
+class TimedQueuePool(TimedCheckout, QueuePool):
+    pass
+
+class TimedAsyncQueuePool(TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+def engine_options(url: str, asynchronous: bool = False) -> dict:
+    # create_engine arguments for the url, the same for the sync and the async engine
+    # apart from the pool class
+    sync_url = make_url(url)
+    options = {"echo": DB_ECHO}
+    if sync_url.get_backend_name() == "sqlite":
+        options["connect_args"] = {"check_same_thread": False}
+        if sync_url.database in (None, "", ":memory:"):
+            # an in-memory database lives in its one connection, sqlalchemy picks the pool for it
+            return options
+    # a LIFO queue hands out the most recently used connections, the rest go idle and get recycled
+    options.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        pool_use_lifo=True,
+    )
+    if metrics.METRICS_ENABLED:
+        options["poolclass"] = TimedAsyncQueuePool if asynchronous else TimedQueuePool
+    return options
+
+def sqlite_pragmas() -> List[str]:
+    return [
+        f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}",
+        f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}",
+        f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+        f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KIB}", # negative: KiB rather than pages
+        f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    # every new connection, pysqlite and aiosqlite alike
+    cursor = dbapi_connection.cursor()
+    for pragma in sqlite_pragmas():
+        cursor.execute(pragma)
+    cursor.close()
+
+# core interface of the db is engine, the sync one is kept for scripts and alembic
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_options(SQLALCHEMY_DATABASE_URL))
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(SQLALCHEMY_DATABASE_URL, asynchronous=True))
+
+# one async engine per read replica, same pool settings as the primary
+replica_engines = [create_async_engine(to_async_url(url), **engine_options(url, asynchronous=True)) for url in DATABASE_REPLICA_URLS]
+
+for _engine in (engine, async_engine.sync_engine, *(replica.sync_engine for replica in replica_engines)):
+    if _engine.dialect.name == "sqlite":
+        event.listen(_engine, "connect", _apply_sqlite_pragmas)
 
 # each instance of Sessionlocal will become database session
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# request handlers use the async sessions, objects stay readable after commit
+# because lazy loading is not available outside of the greenlet
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False, class_=AsyncSession)
+
+# counting every statement sent to the database while a counter is active, main.py
+# opens one per request so N+1 loading shows up as a growing X-Query-Count
+# (with QUERY_COUNT_HEADER on) and in /metrics
+class QueryCounter:
+    def __init__(self):
+        self.statements: List[str] = []
+        self.seconds = 0.0 # spent executing them, with METRICS on
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+_query_counter: ContextVar[Optional[QueryCounter]] = ContextVar("query_counter", default=None)
+
+@contextmanager
+def count_queries():
+    counter = QueryCounter()
+    token = _query_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _query_counter.reset(token)
+
+def _record_query(conn, cursor, statement, parameters, context, executemany):
+    counter = _query_counter.get()
+    if counter is not None:
+        counter.statements.append(statement)
+
+# statement timings for /metrics, the start is kept on the statement's execution context
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.metrics_started = time.perf_counter()
+
+def _stop_timer(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "metrics_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    metrics.DB_STATEMENT_DURATION.observe(elapsed, metrics.statement_operation(statement))
+    counter = _query_counter.get()
+    if counter is not None:
+        counter.seconds += elapsed
+
+# the async engines run their statements through a sync engine underneath
+for _engine in (engine, async_engine.sync_engine, *(replica.sync_engine for replica in replica_engines)):
+    event.listen(_engine, "before_cursor_execute", _record_query)
+    if metrics.METRICS_ENABLED:
+        event.listen(_engine, "before_cursor_execute", _start_timer)
+        event.listen(_engine, "after_cursor_execute", _stop_timer)
+
+# pool usage, read when /metrics is scraped
+@metrics.collector
+def _pool_connections():
+    named = [("primary", async_engine.sync_engine), ("primary-sync", engine)]
+    named += [(f"replica-{i}", replica.sync_engine) for i, replica in enumerate(replica_engines)]
+    for name, _engine in named:
+        pool = _engine.pool
+        if isinstance(pool, QueuePool):
+            metrics.DB_POOL_CONNECTIONS.set(pool.checkedout(), name, "in_use")
+            metrics.DB_POOL_CONNECTIONS.set(pool.checkedin(), name, "idle")
+
 # creating new db models by inheriting from Base class
 Base = declarative_base()
 
-# this is a dependency which ensures that a DB connection 
+# this is a dependency which ensures that a DB connection
 # starts (request initiated) and closes automatically (request finished)
-def get_db():
-    db = SessionLocal()
+async def get_db():
+    db = AsyncSessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        await db.close()
@@ -3,202 +3,424 @@ Entry point for the app. Initializes the database
 and tells FastAPI which routes to use
 """
 
-from typing import List, Any
-from fastapi import FastAPI, Depends, HTTPException, status
+import time
+from typing import List, Literal, Optional
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
-from . import models, schemas, database, auth, crud, tasks
+from . import models, schemas, database, auth, bulk, crud, exports, metrics, pagination, cache, querywatch, replicas, sales, serialization
 
 app = FastAPI(title="Event Booking System")
+app.router.route_class = replicas.ReplicaRoute # reads that fail on a replica run again on the primary
+
+
+# with QUERY_COUNT_HEADER on every response reports how many SQL statements it took,
+# with METRICS on the request also goes into /metrics under its route template
+@app.middleware("http")
+async def count_queries(request: Request, call_next):
+    if not (database.QUERY_COUNT_HEADER or metrics.METRICS_ENABLED):
+        return await call_next(request)
+    started = time.perf_counter()
+    with database.count_queries() as counter:
+        try:
+            response = await call_next(request)
+        except Exception:
+            if metrics.METRICS_ENABLED:
+                metrics.observe_request(request.method, metrics.route_template(request.scope), 500, time.perf_counter() - started, counter.count, counter.seconds)
+            raise
+    if database.QUERY_COUNT_HEADER:
+        response.headers["X-Query-Count"] = str(counter.count)
+    if metrics.METRICS_ENABLED:
+        metrics.observe_request(request.method, metrics.route_template(request.scope), response.status_code, time.perf_counter() - started, counter.count, counter.seconds)
+    return response
+
+
+# with read replicas, a client's reads stay on the primary for a moment after each of its writes
+@app.middleware("http")
+async def read_your_writes(request: Request, call_next):
+    response = await call_next(request)
+    if replicas.replica_set.replicas and request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        replicas.pin_to_primary(response)
+    return response
+
+
+# N+1 and slow statement reports on development and canary hosts (QUERY_WATCH, see app/querywatch.py)
+if querywatch.QUERY_WATCH != "off":
+    app.add_middleware(querywatch.QueryWatchMiddleware)
+
+
+# listings page with ?cursor= (keyset) or ?skip= (offset), the cursor
+# for the following page travels back in the X-Next-Cursor header
+def read_cursor(keyset: pagination.Keyset, cursor: Optional[str]):
+    if cursor is None:
+        return None
+    try:
+        return keyset.decode(cursor)
+    except pagination.InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+def set_next_cursor(response: Response, keyset: pagination.Keyset, rows, limit: int):
+    next_cursor = keyset.next_cursor(rows, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+
+# conditional GET for the catalogue listings. the ETag comes from the cache versions, a
+# matching If-None-Match is answered with a 304 before any listing query runs. it is taken
+# before the page is loaded, a write racing the load leaves a newer page under an older
+# ETag, which the next request simply replaces
+async def check_not_modified(request: Request, response: Response, namespace: str, params: dict, private: bool = False) -> Optional[Response]:
+    etag = await cache.etag(namespace, params)
+    headers = {"ETag": etag, "Cache-Control": cache.cache_control(private)}
+    if cache.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+# the public catalogue listings are served through the read-through cache,
+# a page is cached as its serialized events plus the cursor that follows it
+async def cached_event_page(request: Request, namespace: str, params: dict, db: AsyncSession, load, keyset: Optional[pagination.Keyset] = pagination.EVENT_LISTING):
+    async def load_page():
+        events = await load()
+        return {
+            "items": serialization.EVENTS.dump_python(serialization.EVENTS.validate_python(events, from_attributes=True), mode="json"),
+            "next_cursor": keyset.next_cursor(events, params["limit"]) if keyset else None,
+        }
+
+    async def load_quantities(ticket_ids):
+        return await crud.get_ticket_quantities(db, ticket_ids)
+
+    # with read replicas a client pinned to the primary after its own write skips the cached
+    # page, it may come from a lagging replica, and a page read from a replica is only kept
+    # as long as a replica is expected to lag, so it can't outlive a newer version for long
+    on_replica = getattr(request.state, "replica", None) is not None
+    ttl = min(cache.CACHE_TTL_SECONDS, replicas.REPLICA_STICKY_SECONDS) if on_replica else cache.CACHE_TTL_SECONDS
+    return await cache.read_through(namespace, params, load_page, load_quantities, fresh=replicas.pinned_to_primary(request), ttl=ttl)
 
 # --- ROOT & AUTH ---
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Welcome to the Event Booking API"}
 
 @app.post("/register", response_model=schemas.User)
-def register_user(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
-    db_user = db.query(models.User).filter(models.User.email == user.email).first()
+async def register_user(user: schemas.UserCreate, db: AsyncSession = Depends(database.get_db)):
+    db_user = await crud.get_user_by_email(db, user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    hashed_pass = auth.get_password(user.password)
+    hashed_pass = await auth.hash_password(user.password)
     new_user = models.User(email=user.email, hashed_password=hashed_pass, role=user.role)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
     return new_user
 
 @app.post("/token")
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
-    user = db.query(models.User).filter(models.User.email == form_data.username).first()
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(database.get_db)):
+    user = await crud.get_user_by_email(db, form_data.username)
+    if not user:
+        raise HTTPException(status_code=401, detail="Incorrect email or password")
+    valid, new_hash = await auth.check_password(form_data.password, user.hashed_password)
+    if not valid:
         raise HTTPException(status_code=401, detail="Incorrect email or password")
+
+    # the configured work factor changed since this hash was made, store the upgraded one
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
     
-    access_token = auth.create_access_token(data={"sub": user.email})
+    access_token = await auth.create_user_token(user)
     return {"access_token": access_token, "token_type": "bearer"}
 
 # --- ORGANIZER ENDPOINTS ---
 
 @app.post("/events", response_model=schemas.Event)
-def create_new_event(
+async def create_new_event(
     event: schemas.EventCreate,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(auth.require_role("organizer"))
+    db: AsyncSession = Depends(database.get_db),
+    current_user: schemas.TokenClaims = Depends(auth.require_role("organizer"))
 ):
     user_id = int(getattr(current_user, 'id'))
-    return crud.create_event(db=db, event=event, organizer_id=user_id)
+    return await crud.create_event(db=db, event=event, organizer_id=user_id)
+
+@app.post("/events/bulk")
+async def import_events(
+    request: Request,
+    import_format: Optional[str] = Query(None, alias="format"),
+    db: AsyncSession = Depends(database.get_db),
+    current_user: schemas.TokenClaims = Depends(auth.require_role("organizer"))
+):
+    # the body is an NDJSON or CSV stream (see app/bulk.py), read as it arrives
+    import_format = import_format or ("csv" if "csv" in request.headers.get("content-type", "") else "ndjson")
+    if import_format not in bulk.FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format, use one of {', '.join(bulk.FORMATS)}")
+    user_id = int(getattr(current_user, 'id'))
+    try:
+        result = await bulk.import_events(db, bulk.iter_lines(request.stream()), user_id, import_format)
+    except bulk.DecodeError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return result.as_dict()
 
 @app.get("/organizer/events", response_model=List[schemas.Event])
-def list_organizer_events(
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(auth.require_role("organizer"))
+async def list_organizer_events(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(replicas.get_read_db),
+    current_user: schemas.TokenClaims = Depends(auth.require_role("organizer"))
+):
+    user_id = int(getattr(current_user, 'id'))
+    after = read_cursor(pagination.ORGANIZER_EVENTS, cursor)
+    not_modified = await check_not_modified(request, response, "organizer", {"organizer": user_id, "skip": skip, "limit": limit, "cursor": cursor}, private=True)
+    if not_modified:
+        return not_modified
+    events = await crud.get_organizer_events(db, user_id, skip=skip, limit=limit, after=after, as_rows=serialization.FAST_JSON)
+    set_next_cursor(response, pagination.ORGANIZER_EVENTS, events, limit)
+    if serialization.FAST_JSON:
+        return serialization.json_response(serialization.EVENTS.dump_json(serialization.EVENTS.validate_python(events)), response)
+    return events
+
+@app.get("/organizer/dashboard", response_model=schemas.SalesDashboard)
+async def read_sales_dashboard(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(replicas.get_read_db),
+    current_user: schemas.TokenClaims = Depends(auth.require_role("organizer"))
 ):
+    # revenue, tickets sold and what is left, per event and ticket type, paged like /organizer/events
     user_id = int(getattr(current_user, 'id'))
-    return crud.get_organizer_events(db, user_id)
+    after = read_cursor(pagination.ORGANIZER_EVENTS, cursor)
+    dashboard = await sales.get_dashboard(db, user_id, skip=skip, limit=limit, after=after)
+    set_next_cursor(response, pagination.ORGANIZER_EVENTS, dashboard["items"], limit)
+    return dashboard
 
 @app.put("/events/{event_id}", response_model=schemas.Event)
-def update_existing_event(
+async def update_existing_event(
     event_id: int, 
     event_update: schemas.EventUpdate,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(auth.require_role("organizer"))
+    db: AsyncSession = Depends(database.get_db),
+    current_user: schemas.TokenClaims = Depends(auth.require_role("organizer"))
 ):
-    db_event = crud.update_event(db=db, event_id=event_id, event_update=event_update)
+    # customers are notified through the outbox, in the same transaction as the update
+    db_event = await crud.update_event(db=db, event_id=event_id, event_update=event_update)
     if not db_event:
         raise HTTPException(status_code=404, detail="Event not found!")
-
-    # If event was updated or cancelled, notify customers via Celery
-    emails = [b.customer.email for t in db_event.tickets for b in t.bookings if b.status == models.BookingStatus.CONFIRMED.value]
-    if emails:
-        task_func: Any = tasks.notify_event_update
-        msg = f"Update for {db_event.title}" if db_event.status == models.EventStatus.ACTIVE.value else f"CANCELLED: {db_event.title}"
-        task_func.delay(list(set(emails)), msg)
     
     return db_event
 
 @app.delete("/events/{event_id}")
-def delete_event(
+async def delete_event(
     event_id: int,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(auth.require_role("organizer"))
+    db: AsyncSession = Depends(database.get_db),
+    current_user: schemas.TokenClaims = Depends(auth.require_role("organizer"))
 ):
-    success = crud.delete_event(db, event_id)
+    success = await crud.delete_event(db, event_id)
     if not success:
         raise HTTPException(status_code=404, detail="Event not found")
     return {"message": "Event permanently deleted"}
 
+@app.get("/events/{event_id}/attendees.{export_format}")
+async def export_attendees(
+    event_id: int,
+    export_format: Literal["csv", "ndjson"],
+    db: AsyncSession = Depends(replicas.get_read_db),
+    current_user: schemas.TokenClaims = Depends(auth.require_role("organizer"))
+):
+    # the confirmed bookings of one of the organizer's own events, streamed (see app/exports.py)
+    db_event = await db.get(models.Event, event_id)
+    if not db_event or db_event.organizer_id != int(getattr(current_user, 'id')):
+        raise HTTPException(status_code=404, detail="Event not found")
+    return exports.attendee_response(db, event_id, export_format)
+
 # --- CUSTOMER ENDPOINTS ---
 
 @app.get("/events/", response_model=List[schemas.Event])
-def read_public_events(skip: int = 0, limit: int = 100, db: Session = Depends(database.get_db)):
-    return crud.get_events(db, skip=skip, limit=limit)
+async def read_public_events(request: Request, response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: AsyncSession = Depends(replicas.get_read_db)):
+    after = read_cursor(pagination.EVENT_LISTING, cursor)
+    params = {"skip": skip, "limit": limit, "cursor": cursor}
+    not_modified = await check_not_modified(request, response, "events", params)
+    if not_modified:
+        return not_modified
+    page = await cached_event_page(
+        request,
+        "events",
+        params,
+        db,
+        lambda: crud.get_events(db, skip=skip, limit=limit, after=after, as_rows=serialization.FAST_JSON)
+    )
+    if page["next_cursor"]:
+        response.headers["X-Next-Cursor"] = page["next_cursor"]
+    # the cached items are validated JSON data already, they only need encoding
+    if serialization.FAST_JSON:
+        return serialization.json_response(serialization.dumps(page["items"]), response)
+    return page["items"]
 
 @app.post("/bookings/", response_model=schemas.Booking)
-def book_event_ticket(
+async def book_event_ticket(
     booking: schemas.BookingCreate,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(auth.require_role("customer"))
+    db: AsyncSession = Depends(database.get_db),
+    current_user: schemas.TokenClaims = Depends(auth.require_role("customer"))
 ):
     user_id = int(getattr(current_user, 'id'))
-    new_booking = crud.create_booking(db=db, booking=booking, customer_id=user_id)
+    new_booking = await crud.create_booking(db=db, booking=booking, customer_id=user_id, notify_email=current_user.email)
     if not new_booking:
         raise HTTPException(status_code=400, detail="Tickets unavailable or insufficient")
-    
-    confirm_task: Any = tasks.send_booking_confirmation
-    confirm_task.delay(current_user.email, f"CONFIRMED: {new_booking.ticket.event.title}")
     return new_booking
 
+@app.post("/bookings/batch", response_model=List[schemas.Booking])
+async def book_event_tickets(
+    cart: schemas.BookingBatchCreate,
+    db: AsyncSession = Depends(database.get_db),
+    current_user: schemas.TokenClaims = Depends(auth.require_role("customer"))
+):
+    user_id = int(getattr(current_user, 'id'))
+    new_bookings = await crud.create_bookings(db=db, items=cart.items, customer_id=user_id, notify_email=current_user.email)
+    if not new_bookings:
+        raise HTTPException(status_code=400, detail="Tickets unavailable or insufficient")
+    return new_bookings
+
 @app.get("/bookings/my", response_model=List[schemas.Booking])
-def get_my_bookings(
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(auth.require_role("customer"))
+async def get_my_bookings(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(replicas.get_read_db),
+    current_user: schemas.TokenClaims = Depends(auth.require_role("customer"))
 ):
     user_id = int(getattr(current_user, 'id'))
-    return crud.get_user_bookings(db, user_id)
+    after = read_cursor(pagination.USER_BOOKINGS, cursor)
+    bookings = await crud.get_user_bookings(db, user_id, skip=skip, limit=limit, after=after, as_rows=serialization.FAST_JSON)
+    set_next_cursor(response, pagination.USER_BOOKINGS, bookings, limit)
+    if serialization.FAST_JSON:
+        return serialization.json_response(serialization.BOOKINGS.dump_json(serialization.BOOKINGS.validate_python(bookings)), response)
+    return bookings
 
 @app.put("/bookings/{booking_id}/cancel", response_model=schemas.Booking)
-def cancel_booking(
+async def cancel_booking(
     booking_id: int,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(auth.require_role("customer"))
+    db: AsyncSession = Depends(database.get_db),
+    current_user: schemas.TokenClaims = Depends(auth.require_role("customer"))
 ):
     user_id = int(getattr(current_user, 'id'))
 
-    # getting the booking and list of people who got auto-booked
-    booking, fullfilled_users = crud.cancel_booking(db, booking_id, user_id)
+    # cancelling the booking, the user and anyone auto-booked from the waitlist are notified through the outbox
+    booking, fullfilled_users = await crud.cancel_booking(db, booking_id, user_id, notify_email=current_user.email)
     
     if not booking:
         raise HTTPException(status_code=404, detail="Booking not found or already cancelled")
     
-    # notifying the user about cancellation
-    tasks.send_booking_confirmation.delay(current_user.email, f"CANCELLED: {booking.ticket.event.title}")
-
-    # notifying the user(s) who got confirmed tickets from waitlist
-    for user_data in fullfilled_users:
-        tasks.send_booking_confirmation.delay(
-            user_data["email"],
-            f"CONFIRMED from Waitlist: {booking.ticket.event.title} (Quantity: {user_data['quantity']})"
-        )
-    
     return booking
 
 @app.post("/tickets/{ticket_id}/waitlist", response_model=schemas.WaitlistResponse)
-def join_waitlist(ticket_id: int, waitlist_data: schemas.WaitlistBase,db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
-    result = crud.join_waitlist(db, ticket_id=ticket_id, user_id=current_user.id, quantity=waitlist_data.quantity)
+async def join_waitlist(ticket_id: int, waitlist_data: schemas.WaitlistBase,db: AsyncSession = Depends(database.get_db), current_user: schemas.TokenClaims = Depends(auth.get_current_claims)):
+    result = await crud.join_waitlist(db, ticket_id=ticket_id, user_id=current_user.id, quantity=waitlist_data.quantity, notify_email=current_user.email)
 
     if result == "EXCEEDS_CAPACITY":
         raise HTTPException(status_code=400, detail="Requested quantity exceeds total event capacity")
-    
-    # notifying the user for waitlisting
-    tasks.send_booking_confirmation.delay(
-        current_user.email,
-        f"WAITLISTED: You are in line for {waitlist_data.quantity} ticket(s)."
-    )
 
     return result
 
 @app.get("/events/search", response_model=List[schemas.Event])
-def search_events(
+async def search_events(
+    request: Request,
+    response: Response,
     venue: str = None,
+    q: Optional[str] = None,
     event_date: datetime = None,
     is_weekend: bool = None,
     time_slot: str = None,
-    db: Session = Depends(database.get_db)
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(replicas.get_read_db)
 ):
-    results = crud.search_events(
-        db, 
-        location=venue,
-        date=event_date,
-        is_weekend=is_weekend,
-        time_slot=time_slot
+    # q= results are ordered by relevance, they page with skip only
+    if q and cursor:
+        raise HTTPException(status_code=400, detail="Full-text search (q) pages with skip, not cursor")
+    after = read_cursor(pagination.EVENT_LISTING, cursor)
+    params = {"venue": venue, "q": q, "event_date": event_date, "is_weekend": is_weekend, "time_slot": time_slot, "skip": skip, "limit": limit, "cursor": cursor}
+    not_modified = await check_not_modified(request, response, "search", params)
+    if not_modified:
+        return not_modified
+    page = await cached_event_page(
+        request,
+        "search",
+        params,
+        db,
+        lambda: crud.search_events(
+            db, 
+            location=venue,
+            date=event_date,
+            is_weekend=is_weekend,
+            time_slot=time_slot,
+            skip=skip,
+            limit=limit,
+            after=after,
+            text=q,
+            as_rows=serialization.FAST_JSON
+        ),
+        keyset=None if q else pagination.EVENT_LISTING
     )
+    results = page["items"]
+    if page["next_cursor"]:
+        response.headers["X-Next-Cursor"] = page["next_cursor"]
 
-    if not results:
+    # running off the end of a paginated search is just an empty page
+    if not results and after is None:
         raise HTTPException(
             status_code=404, 
             detail="No events found matching the search criteria"
         )
     
+    if serialization.FAST_JSON:
+        return serialization.json_response(serialization.dumps(results), response)
     return results
 
 # --- PROFILE MANAGEMENT (BOTH ROLES) ---
 
 @app.put("/users/me", response_model=schemas.User)
-def update_my_profile(
+async def update_my_profile(
     user_update: schemas.UserUpdate,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    db: AsyncSession = Depends(database.get_db),
+    current_user: schemas.TokenClaims = Depends(auth.get_current_claims)
 ):
     user_id = int(getattr(current_user, 'id'))
-    return crud.update_user(db, user_id, user_update)
+    # a new email or password revokes the user's tokens
+    return await crud.update_user(db, user_id, user_update)
 
 @app.delete("/users/me")
-def delete_my_profile(
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+async def delete_my_profile(
+    db: AsyncSession = Depends(database.get_db),
+    current_user: schemas.TokenClaims = Depends(auth.get_current_claims)
 ):
     user_id = int(getattr(current_user, 'id'))
-    crud.delete_user(db, user_id)
-    return {"message": "Profile and all associated data deleted"}
\ No newline at end of file
+    await crud.delete_user(db, user_id)
+    return {"message": "Profile and all associated data deleted"}
+
+# --- STATS ---
+
+@app.get("/cache/stats", dependencies=[Depends(auth.require_ops_token)])
+async def read_cache_stats():
+    return cache.stats.as_dict()
+
+@app.get("/auth/stats", dependencies=[Depends(auth.require_ops_token)])
+async def read_hashing_stats():
+    return auth.hasher.stats.as_dict()
+
+@app.get("/replicas/stats", dependencies=[Depends(auth.require_ops_token)])
+async def read_replica_stats():
+    return replicas.replica_set.as_dict()
+
+@app.get("/querywatch/stats", dependencies=[Depends(auth.require_ops_token)])
+async def read_query_watch_stats():
+    return querywatch.stats.as_dict()
+
+@app.get("/metrics", dependencies=[Depends(auth.require_ops_token)])
+async def read_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
\ No newline at end of file
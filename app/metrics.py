@@ -0,0 +1,199 @@
+"""
+Prometheus metrics, served in the text exposition format by GET /metrics,
+which takes the OPS_TOKEN as a bearer token (Prometheus: authorization.credentials).
+
+    http_requests_total, http_request_duration_seconds          per route template and method
+    http_request_sql_statements, http_request_sql_seconds       SQL statements and their time per request
+    db_statement_duration_seconds                               every statement, by operation
+    db_pool_checkout_seconds, db_pool_connections               waiting for a pooled connection, pool usage
+    celery_enqueue_seconds, celery_enqueue_failures_total       the outbox publishing to the broker
+    outbox_delay_seconds                                        from the request's commit to the broker
+    bookings_total                                              crud.create_booking(s) by outcome
+
+Updating a metric is a dict lookup and an addition under a lock, cheap enough
+to stay on; METRICS=off leaves out the per-request and per-statement timing
+for comparison. Every process keeps its own numbers, so with several uvicorn
+workers each one is scraped on its own (or the totals are summed over the
+instances). The outbox dispatcher runs elsewhere and serves its metrics on
+OUTBOX_METRICS_PORT.
+"""
+
+import os
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Sequence
+
+
+# configuration
+METRICS_ENABLED = os.getenv("METRICS", "on") == "on"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# seconds, from a cached page to a slow booking
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# statements per request, N+1 loading shows up in the upper buckets
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+        self.series: Dict[tuple, object] = {}
+        REGISTRY.append(self)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        with self.lock:
+            self.series[labels] = self.series.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self.series.get(labels, 0)
+
+    def samples(self) -> List[str]:
+        with self.lock:
+            series = list(self.series.items())
+        return [f"{self.name}{_labels(self.label_names, labels)} {_number(value)}" for labels, value in series]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labels):
+        with self.lock:
+            self.series[labels] = value
+
+    def samples(self) -> List[str]:
+        with self.lock:
+            series = list(self.series.items())
+        return [f"{self.name}{_labels(self.label_names, labels)} {_number(value)}" for labels, value in series]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels):
+        # per series: a count for each bucket, the +Inf one last, then the sum
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, *labels) -> int:
+        series = self.series.get(labels)
+        return sum(series[:-1]) if series else 0
+
+    def samples(self) -> List[str]:
+        with self.lock:
+            series = [(labels, list(values)) for labels, values in self.series.items()]
+        lines = []
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_number(values[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+REGISTRY: List[Metric] = []
+# called before every scrape, for the gauges that are read rather than updated
+COLLECTORS: List[Callable[[], None]] = []
+
+def collector(function: Callable[[], None]) -> Callable[[], None]:
+    COLLECTORS.append(function)
+    return function
+
+def render() -> str:
+    for function in COLLECTORS:
+        function()
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+# the metrics
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests by route template, method and status", ["method", "route", "status"])
+HTTP_DURATION = Histogram("http_request_duration_seconds", "Time until the response headers are ready", ["method", "route"])
+HTTP_SQL_STATEMENTS = Histogram("http_request_sql_statements", "SQL statements sent for one request", ["method", "route"], buckets=COUNT_BUCKETS)
+HTTP_SQL_SECONDS = Histogram("http_request_sql_seconds", "Time one request spent executing SQL statements", ["method", "route"])
+DB_STATEMENT_DURATION = Histogram("db_statement_duration_seconds", "Execution time of single SQL statements", ["operation"])
+DB_POOL_CHECKOUT = Histogram("db_pool_checkout_seconds", "Time spent waiting for a pooled connection, opening a new one included")
+DB_POOL_CONNECTIONS = Gauge("db_pool_connections", "Pooled connections per engine, in use or idle", ["engine", "state"])
+CELERY_ENQUEUE = Histogram("celery_enqueue_seconds", "Time to hand one task message to the broker", ["task"])
+CELERY_ENQUEUE_FAILURES = Counter("celery_enqueue_failures_total", "Task messages the broker did not take, retried by the outbox", ["task"])
+OUTBOX_DELAY = Histogram("outbox_delay_seconds", "Time from a message's outbox row to the broker", buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0))
+BOOKINGS = Counter("bookings_total", "Booking attempts, single tickets and carts, by outcome", ["kind", "outcome"])
+
+
+# requests that matched no route share one label, a scan of random urls can't grow the series
+UNMATCHED_ROUTE = "unmatched"
+
+def route_template(scope: dict) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or UNMATCHED_ROUTE
+
+def observe_request(method: str, route: str, status: int, seconds: float, statements: int, sql_seconds: float):
+    HTTP_REQUESTS.inc(method, route, str(status))
+    HTTP_DURATION.observe(seconds, method, route)
+    HTTP_SQL_STATEMENTS.observe(statements, method, route)
+    HTTP_SQL_SECONDS.observe(sql_seconds, method, route)
+
+def statement_operation(statement: str) -> str:
+    head = statement.lstrip()[:12].split(None, 1)
+    return head[0].upper() if head else "OTHER"
+
+
+# for processes without the api in front of them (the outbox dispatcher)
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics").start()
+    return server
@@ -3,8 +3,8 @@ Database tables (SQLAlchemy). Handling organizers,
 customers, events, tickets, and bookings.
 """
 
-from sqlalchemy import Column, Integer, String, ForeignKey, Float, DateTime, Enum, select, func, case
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, Float, Date, DateTime, Boolean, Index, Enum, func, case
+from sqlalchemy.orm import relationship, validates
 from sqlalchemy.ext.hybrid import hybrid_property
 from .database import Base
 import enum
@@ -18,6 +18,10 @@ class InventoryStatus(str, enum.Enum):
     AVAILABLE = "available"
     SOLD_OUT = "sold_out"
 
+class OutboxStatus(str, enum.Enum):
+    PENDING = "pending"
+    FAILED = "failed" # gave up after OUTBOX_MAX_ATTEMPTS
+
 class BookingStatus(str, enum.Enum):
     CONFIRMED = "confirmed"
     CANCELLED = "cancelled"
@@ -27,12 +31,27 @@ class UserRole(enum.Enum):
     CUSTOMER = "customer"
 
 
+def calendar_fields(date) -> dict:
+    # the calendar columns stored next to events.date, day_of_week counts from 0 = Sunday like strftime('%w')
+    if date is None:
+        return {"start_day": None, "start_hour": None, "day_of_week": None}
+    return {"start_day": date.date(), "start_hour": date.hour, "day_of_week": date.isoweekday() % 7}
+
+def _calendar_default(field):
+    # column default for inserts that only set the date, core executemany included
+    def default(context):
+        return calendar_fields(context.get_current_parameters().get("date"))[field]
+    return default
+
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, index=True)
     hashed_password = Column(String)
     role = Column(String)
+    # part of every access token, bumping it revokes the tokens issued before
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
 
     # relationships
     events = relationship("Event", back_populates="organizer", cascade="all, delete-orphan")
@@ -51,36 +70,52 @@ class Event(Base):
     status = Column(String, default=EventStatus.ACTIVE.value)
     deleted_at = Column(DateTime, nullable=True)
 
+    # calendar parts of date, stored so the search filters are plain indexed lookups
+    start_day = Column(Date, default=_calendar_default("start_day"))
+    start_hour = Column(Integer, default=_calendar_default("start_hour"))
+    day_of_week = Column(Integer, default=_calendar_default("day_of_week"))
+
+    # denormalised inventory, kept in step with tickets.quantity_available by crud
+    # so listings can sort on a plain indexed column instead of summing tickets per row
+    total_remaining = Column(Integer, default=0, nullable=False)
+    is_sold_out = Column(Boolean, default=False, nullable=False)
+
     organizer = relationship("User", back_populates="events")
     tickets = relationship("Ticket", back_populates="event")
 
-    @hybrid_property # calculates inventory status based on remaining tickets
+    __table_args__ = (
+        # an organizer's events by date, /organizer/events and the sales dashboard
+        Index("ix_events_organizer", "organizer_id", "date", "id"),
+        # public listings filter on status/deleted_at and sort by sold out flag then date. the calendar
+        # columns at the end let time_slot= and is_weekend= (a good share of all events either way) be
+        # checked inside the index while it is walked in listing order
+        Index("ix_events_listing", "status", "deleted_at", "is_sold_out", "date", "start_hour", "day_of_week"),
+        # date= picks out a single day, looked up directly and already in listing order
+        Index("ix_events_start_day", "status", "deleted_at", "start_day", "is_sold_out", "date"),
+    )
+
+    @validates("date") # keeps the calendar columns in step when the date is set or edited through the orm
+    def _set_calendar_fields(self, key, date):
+        for field, value in calendar_fields(date).items():
+            setattr(self, field, value)
+        return date
+
+    @hybrid_property # inventory status based on the maintained sold out flag
     def inventory_status(self):
-        if not self.tickets:
-            return InventoryStatus.AVAILABLE.value
-        total_remaining = sum(t.quantity_available for t in self.tickets)
-        return InventoryStatus.AVAILABLE.value if total_remaining > 0 else InventoryStatus.SOLD_OUT.value
-    
-    @inventory_status.expression # allows filtering by inventory status in sorting queries
-    def inventory_status(cls):
-        ticket_sum_query = (
-            select(func.sum(Ticket.quantity_available))
-            .where(Ticket.event_id == cls.id)
-            .correlate(cls)
-        )
-        
-        ticket_sum = ticket_sum_query.scalar_subquery()
+        return InventoryStatus.SOLD_OUT.value if self.is_sold_out else InventoryStatus.AVAILABLE.value
 
+    @inventory_status.expression # allows filtering by inventory status in queries
+    def inventory_status(cls):
         return case(
-            (func.coalesce(ticket_sum, 0) > 0, InventoryStatus.AVAILABLE.value),
-            else_=InventoryStatus.SOLD_OUT.value
+            (cls.is_sold_out == True, InventoryStatus.SOLD_OUT.value),
+            else_=InventoryStatus.AVAILABLE.value
         )
 
 
 class Ticket(Base):
     __tablename__ = "tickets"
     id = Column(Integer, primary_key=True, index=True)
-    event_id = Column(Integer, ForeignKey("events.id"))
+    event_id = Column(Integer, ForeignKey("events.id"), index=True)
     ticket_type = Column(String)  # e.g., VIP, General Admission
     price = Column(Float)
     quantity_available = Column(Integer)
@@ -100,6 +135,11 @@ class Booking(Base):
     customer = relationship("User", back_populates="bookings")
     ticket = relationship("Ticket", back_populates="bookings")
 
+    __table_args__ = (
+        # everything done to an event's bookings at once (cancelling it, finding who to notify)
+        Index("ix_bookings_ticket_status", "ticket_id", "status"),
+    )
+
 
 class Waitlist(Base):
     __tablename__ = "waitlist"
@@ -113,4 +153,42 @@ class Waitlist(Base):
     # Relationships
     event = relationship("Event")
     user = relationship("User", back_populates="waitlist_entries")
-    ticket = relationship("Ticket")
\ No newline at end of file
+    ticket = relationship("Ticket")
+
+    __table_args__ = (
+        # the queue for one ticket type, oldest first
+        Index("ix_waitlist_queue", "ticket_id", "created_at", "id"),
+    )
+
+
+class TicketSalesRollup(Base):
+    # running sales totals per ticket type, moved by crud in the same transaction as every
+    # booking, cancellation and waitlist hand-out (app/sales.py), the dashboard reads these
+    __tablename__ = "ticket_sales_rollup"
+    ticket_id = Column(Integer, ForeignKey("tickets.id", ondelete="CASCADE"), primary_key=True)
+    event_id = Column(Integer, ForeignKey("events.id", ondelete="CASCADE"), nullable=False, index=True)
+    tickets_sold = Column(Integer, default=0, nullable=False)
+    confirmed_bookings = Column(Integer, default=0, nullable=False)
+
+
+class OutboxMessage(Base):
+    # celery tasks written in the same transaction as the change they announce,
+    # published later by the dispatcher in app/outbox.py
+    __tablename__ = "outbox"
+    id = Column(Integer, primary_key=True, index=True)
+    task = Column(String, nullable=False)
+    payload = Column(Text, nullable=False) # json list of the task arguments
+    status = Column(String, default=OutboxStatus.PENDING.value, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    available_at = Column(DateTime, default=func.now(), nullable=False) # pushed back after a failed attempt
+    last_error = Column(String)
+    created_at = Column(DateTime, default=func.now())
+
+    __table_args__ = (
+        # the dispatcher reads pending messages that are due, oldest first
+        Index("ix_outbox_pending", "status", "available_at", "id"),
+    )
+
+
+# full-text search objects (fts5 table and triggers, or the tsvector index) are created along with the events table
+from . import search
\ No newline at end of file
@@ -0,0 +1,137 @@
+"""
+Transactional outbox for the Celery notifications. Request handlers only add
+rows to the outbox table inside the transaction that makes the change, so a
+slow or unreachable broker never touches a request. The dispatcher drains
+the table to Celery in batches and retries failed messages with backoff.
+
+Run the dispatcher next to the API and the worker:
+
+    PYTHONPATH=. python -m app.outbox
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from . import database, metrics, models, tasks
+
+
+# configuration
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_PUBLISHERS = int(os.getenv("OUTBOX_PUBLISHERS", "8")) # threads publishing one batch side by side
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "0.5"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+OUTBOX_RETRY_SECONDS = float(os.getenv("OUTBOX_RETRY_SECONDS", "2")) # doubled after every failed attempt
+OUTBOX_RETRY_MAX_SECONDS = float(os.getenv("OUTBOX_RETRY_MAX_SECONDS", "300"))
+OUTBOX_METRICS_PORT = int(os.getenv("OUTBOX_METRICS_PORT", "0")) # the dispatcher serves its /metrics here, 0 for none
+
+logger = logging.getLogger(__name__)
+
+
+# request side, nothing here commits or talks to the broker
+def add(db: AsyncSession, signature):
+    # timestamps set here rather than by the column defaults, so a mailing's rows go out as one multi-row insert
+    now = datetime.now()
+    db.add(models.OutboxMessage(task=signature.task, payload=json.dumps(list(signature.args)), available_at=now, created_at=now))
+
+def add_all(db: AsyncSession, signatures: Iterable):
+    for signature in signatures:
+        add(db, signature)
+
+
+# dispatcher side
+def _publish(messages):
+    # one producer connection for the whole batch, returns the ids that made it
+    # to the broker and the error for each one that didn't
+    sent, failed = [], {}
+    with tasks.celery_app.producer_or_acquire() as producer:
+        for message in messages:
+            started = time.perf_counter()
+            try:
+                tasks.celery_app.send_task(message.task, args=json.loads(message.payload), producer=producer)
+                sent.append(message.id)
+            except Exception as exc:
+                failed[message.id] = repr(exc)
+                metrics.CELERY_ENQUEUE_FAILURES.inc(message.task)
+                continue
+            metrics.CELERY_ENQUEUE.observe(time.perf_counter() - started, message.task)
+            metrics.OUTBOX_DELAY.observe((datetime.now() - message.created_at).total_seconds())
+    return sent, failed
+
+def _retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(OUTBOX_RETRY_MAX_SECONDS, OUTBOX_RETRY_SECONDS * 2 ** (attempts - 1)))
+
+async def dispatch_batch(db: AsyncSession, batch_size: int = OUTBOX_BATCH_SIZE) -> int:
+    # publishes one batch of due messages, returns how many rows it handled.
+    # skip_locked lets several dispatchers share the table on PostgreSQL
+    now = datetime.now()
+    messages = (await db.scalars(
+        select(models.OutboxMessage)
+        .where(models.OutboxMessage.status == models.OutboxStatus.PENDING.value, models.OutboxMessage.available_at <= now)
+        .order_by(models.OutboxMessage.available_at, models.OutboxMessage.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )).all()
+    if not messages:
+        await db.rollback()
+        return 0
+
+    # the batch is split between the publisher threads, each slice on its own broker connection
+    # (celery never promised delivery order, the slices don't keep it either)
+    slices = [messages[i::OUTBOX_PUBLISHERS] for i in range(min(OUTBOX_PUBLISHERS, len(messages)))]
+    sent, failed = [], {}
+    for batch_slice, result in zip(slices, await asyncio.gather(*(run_in_threadpool(_publish, batch_slice) for batch_slice in slices), return_exceptions=True)):
+        if isinstance(result, Exception):
+            # the broker connection itself failed, every message of the slice is retried
+            failed.update({message.id: repr(result) for message in batch_slice})
+        else:
+            sent.extend(result[0])
+            failed.update(result[1])
+
+    if sent:
+        await db.execute(delete(models.OutboxMessage).where(models.OutboxMessage.id.in_(sent)).execution_options(synchronize_session=False))
+    for message in messages:
+        if message.id in failed:
+            message.attempts += 1
+            message.last_error = failed[message.id][:500]
+            message.available_at = now + _retry_delay(message.attempts)
+            if message.attempts >= OUTBOX_MAX_ATTEMPTS:
+                message.status = models.OutboxStatus.FAILED.value
+                logger.error("outbox message %s (%s) failed %s times, giving up: %s", message.id, message.task, message.attempts, message.last_error)
+    await db.commit()
+    return len(messages)
+
+async def drain(batch_size: int = OUTBOX_BATCH_SIZE) -> int:
+    # dispatches batches until nothing due is left
+    total = 0
+    async with database.AsyncSessionLocal() as db:
+        while True:
+            handled = await dispatch_batch(db, batch_size)
+            total += handled
+            if handled < batch_size:
+                return total
+
+async def run_dispatcher(stop: Optional[asyncio.Event] = None, poll_seconds: float = OUTBOX_POLL_SECONDS):
+    stop = stop or asyncio.Event()
+    while not stop.is_set():
+        try:
+            await drain()
+        except Exception:
+            logger.exception("outbox dispatch failed")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=poll_seconds)
+        except asyncio.TimeoutError:
+            pass
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if OUTBOX_METRICS_PORT:
+        metrics.serve(OUTBOX_METRICS_PORT)
+    asyncio.run(run_dispatcher())
@@ -0,0 +1,75 @@
+"""
+Keyset (cursor) pagination. A cursor is an opaque token holding the sort key
+of the last row of a page, the next page starts right after that key so
+deep pages cost the same as the first one
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Sequence
+from sqlalchemy import bindparam, tuple_
+from . import models
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class Keyset:
+    # the columns a listing is ordered by, the last one has to be unique (primary key)
+    def __init__(self, *columns):
+        self.columns = columns
+
+    def order_by(self):
+        return [column.asc() for column in self.columns]
+
+    def page(self, query, skip: int = 0, limit: int = 100, after: Optional[tuple] = None):
+        # keyset page when a cursor was given, plain offset otherwise (compatibility mode)
+        query = query.order_by(*self.order_by())
+        if after is not None:
+            query = query.where(self.after(after))
+        else:
+            query = query.offset(skip)
+        return query.limit(limit)
+
+    def after(self, key: tuple):
+        # row value comparison, (a, b, id) > (:a, :b, :id)
+        return tuple_(*self.columns) > tuple_(*[bindparam(None, value, type_=column.type) for column, value in zip(self.columns, key)])
+
+    def encode(self, row) -> str:
+        # `row` is an ORM object or, on the FAST_JSON path, a dict of its columns
+        values = [row[column.key] if isinstance(row, dict) else getattr(row, column.key) for column in self.columns]
+        raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values], separators=(",", ":"))
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+    def decode(self, token: str) -> tuple:
+        try:
+            raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+            values = json.loads(raw)
+            if not isinstance(values, list) or len(values) != len(self.columns):
+                raise InvalidCursor(token)
+            return tuple(self._convert(column, value) for column, value in zip(self.columns, values))
+        except (ValueError, TypeError) as exc:
+            raise InvalidCursor(token) from exc
+
+    @staticmethod
+    def _convert(column, value):
+        python_type = column.type.python_type
+        if python_type is datetime:
+            return datetime.fromisoformat(value)
+        if python_type is bool:
+            return bool(value)
+        return python_type(value)
+
+    def next_cursor(self, rows: Sequence, limit: int) -> Optional[str]:
+        # a full page means there might be more rows after it
+        if limit > 0 and len(rows) == limit:
+            return self.encode(rows[-1])
+        return None
+
+
+# sort keys of the paginated listings
+EVENT_LISTING = Keyset(models.Event.is_sold_out, models.Event.date, models.Event.id)
+ORGANIZER_EVENTS = Keyset(models.Event.date, models.Event.id)
+USER_BOOKINGS = Keyset(models.Booking.id)
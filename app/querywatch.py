@@ -0,0 +1,235 @@
+"""
+Slow-query and N+1 detector for development and canary hosts.
+
+For every inspected request the statements are recorded under a fingerprint,
+the SQL with literals, parameters and IN / VALUES lists folded away, so the
+same query with other ids is the same fingerprint. A fingerprint repeated
+QUERY_WATCH_REPEATS times or more in one request is reported as N+1 (the
+loop that issues it should be a join, a selectinload or an IN query), a
+statement taking QUERY_WATCH_SLOW_MS or longer as slow, each with the line
+of our code that sent it.
+
+    QUERY_WATCH=off      nothing is registered, the default
+    QUERY_WATCH=log      requests with a finding are logged (as warnings, with the report as JSON)
+    QUERY_WATCH=strict   ... and fail with QueryWatchError, so a test suite or CI run goes red
+
+QUERY_WATCH_SAMPLE inspects that fraction of the requests, the others only
+pay a context variable lookup per statement, so a canary host can run with
+0.01. QUERY_WATCH_HEADER=on adds an
+X-Query-Report summary to the responses, for development only since it shows
+the SQL. The latest findings are at GET /querywatch/stats, behind OPS_TOKEN for
+the same reason.
+
+Loops that run one statement per batch on purpose (app/bulk.py) wrap it in
+batched(), their repeats are not N+1.
+"""
+
+import json
+import logging
+import os
+import random
+import re
+import sys
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Dict, List, Optional
+import greenlet
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+from . import database
+
+
+# configuration
+QUERY_WATCH = os.getenv("QUERY_WATCH", "off") # off, log or strict
+QUERY_WATCH_SAMPLE = float(os.getenv("QUERY_WATCH_SAMPLE", "1")) # fraction of the requests inspected
+QUERY_WATCH_REPEATS = int(os.getenv("QUERY_WATCH_REPEATS", "5")) # the same fingerprint this often in one request is N+1
+QUERY_WATCH_SLOW_MS = float(os.getenv("QUERY_WATCH_SLOW_MS", "100"))
+QUERY_WATCH_HEADER = os.getenv("QUERY_WATCH_HEADER", "off") == "on"
+QUERY_WATCH_RECENT = 20 # findings kept for /querywatch/stats
+HEADER_LENGTH = 300 # X-Query-Report is cut here
+
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the frames between the project's code and the listener
+SKIPPED_FILES = {os.path.abspath(__file__), os.path.abspath(database.__file__)}
+
+
+class QueryWatchError(Exception):
+    def __init__(self, report: dict):
+        super().__init__(f"query problems on {report['request']}: {json.dumps(report)}")
+        self.report = report
+
+
+# fingerprints
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_PARAMETER = re.compile(r"\$\d+|%\(\w+\)s|%s|(?<!:):\w+|\?")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_LISTS = re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+")
+_SPACE = re.compile(r"\s+")
+
+@lru_cache(maxsize=4096)
+def fingerprint(statement: str) -> str:
+    # the statements come from a few hundred compiled queries, each is normalised once
+    text = _STRING.sub("?", statement)
+    text = _PARAMETER.sub("?", text)
+    text = _NUMBER.sub("?", text)
+    text = _LIST.sub("(...)", text)
+    text = _LISTS.sub("(...)", text)
+    return _SPACE.sub(" ", text).strip()
+
+
+def caller() -> Optional[str]:
+    # the innermost frame of our own code (not a library's) that sent the statement. with the
+    # async engines the listener runs in sqlalchemy's greenlet, the request's coroutines wait in its parent
+    frame = sys._getframe(1)
+    current = greenlet.getcurrent()
+    while True:
+        while frame is not None:
+            filename = frame.f_code.co_filename
+            if filename.startswith(ROOT) and "site-packages" not in filename and filename not in SKIPPED_FILES:
+                return f"{os.path.relpath(filename, ROOT)}:{frame.f_lineno} ({frame.f_code.co_name})"
+            frame = frame.f_back
+        current = current.parent
+        if current is None:
+            return None
+        frame = current.gr_frame
+
+
+class Recorder:
+    # the statements of one request
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+        self.fingerprints: Dict[str, list] = {} # fingerprint -> [count, seconds, location]
+        self.slow: List[dict] = []
+
+    def record(self, statement: str, seconds: float, batched: bool):
+        self.statements += 1
+        self.seconds += seconds
+        key = fingerprint(statement)
+        entry = self.fingerprints.get(key)
+        if entry is None:
+            entry = self.fingerprints[key] = [0, 0.0, None]
+        if not batched:
+            entry[0] += 1
+        entry[1] += seconds
+        # frames are only walked for what ends up in the report
+        if entry[0] == QUERY_WATCH_REPEATS:
+            entry[2] = caller()
+        if seconds * 1000 >= QUERY_WATCH_SLOW_MS:
+            self.slow.append({"fingerprint": key, "ms": round(seconds * 1000, 1), "location": caller()})
+
+    def report(self, request: str) -> dict:
+        repeated = [
+            {"fingerprint": key, "count": count, "ms": round(seconds * 1000, 1), "location": location}
+            for key, (count, seconds, location) in self.fingerprints.items() if count >= QUERY_WATCH_REPEATS
+        ]
+        repeated.sort(key=lambda item: -item["count"])
+        return {
+            "request": request,
+            "statements": self.statements,
+            "sql_ms": round(self.seconds * 1000, 1),
+            "repeated": repeated,
+            "slow": self.slow,
+        }
+
+_recorder: ContextVar[Optional[Recorder]] = ContextVar("query_watch_recorder", default=None)
+_batched: ContextVar[bool] = ContextVar("query_watch_batched", default=False)
+
+@contextmanager
+def batched():
+    token = _batched.set(True)
+    try:
+        yield
+    finally:
+        _batched.reset(token)
+
+
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _recorder.get() is not None:
+        context.query_watch_started = time.perf_counter()
+
+def _stop_timer(conn, cursor, statement, parameters, context, executemany):
+    recorder = _recorder.get()
+    started = getattr(context, "query_watch_started", None)
+    if recorder is not None and started is not None:
+        recorder.record(statement, time.perf_counter() - started, _batched.get())
+
+if QUERY_WATCH != "off":
+    for _engine in (database.engine, database.async_engine.sync_engine, *(replica.sync_engine for replica in database.replica_engines)):
+        event.listen(_engine, "before_cursor_execute", _start_timer)
+        event.listen(_engine, "after_cursor_execute", _stop_timer)
+
+
+class QueryWatchStats:
+    def __init__(self):
+        self.inspected = 0
+        self.flagged = 0 # requests with a finding
+        self.repeated = 0 # N+1 fingerprints
+        self.slow = 0 # slow statements
+        self.recent = deque(maxlen=QUERY_WATCH_RECENT)
+
+    def as_dict(self):
+        return {**{key: value for key, value in vars(self).items() if key != "recent"}, "recent": list(self.recent)}
+
+stats = QueryWatchStats()
+
+
+def summary(report: dict) -> str:
+    # the X-Query-Report value, the worst finding first
+    parts = [f"statements={report['statements']}", f"sql_ms={report['sql_ms']}", f"repeated={len(report['repeated'])}", f"slow={len(report['slow'])}"]
+    if report["repeated"]:
+        worst = report["repeated"][0]
+        parts.append(f"worst={worst['count']}x {worst['fingerprint']}")
+    elif report["slow"]:
+        worst = max(report["slow"], key=lambda item: item["ms"])
+        parts.append(f"worst={worst['ms']}ms {worst['fingerprint']}")
+    return "; ".join(parts)[:HEADER_LENGTH].encode("ascii", "replace").decode()
+
+def finish(report: dict):
+    stats.inspected += 1
+    if not report["repeated"] and not report["slow"]:
+        logger.debug("%s: %s", report["request"], summary(report))
+        return
+    stats.flagged += 1
+    stats.repeated += len(report["repeated"])
+    stats.slow += len(report["slow"])
+    stats.recent.append(report)
+    logger.warning("query problems on %s: %s", report["request"], json.dumps(report))
+    if QUERY_WATCH == "strict":
+        raise QueryWatchError(report)
+
+
+class QueryWatchMiddleware:
+    # a plain ASGI middleware rather than an @app.middleware one, so the statements of a
+    # streamed body are recorded up to its last chunk. the header can only carry what ran
+    # before the response started
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or random.random() >= QUERY_WATCH_SAMPLE:
+            await self.app(scope, receive, send)
+            return
+        recorder = Recorder()
+
+        def request_name():
+            route = getattr(scope.get("route"), "path", None) or scope["path"]
+            return f"{scope['method']} {route}"
+
+        async def send_with_report(message):
+            if QUERY_WATCH_HEADER and message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("X-Query-Report", summary(recorder.report(request_name())))
+            await send(message)
+
+        token = _recorder.set(recorder)
+        try:
+            await self.app(scope, receive, send_with_report)
+        finally:
+            _recorder.reset(token)
+        finish(recorder.report(request_name()))
@@ -0,0 +1,220 @@
+"""
+Read replica routing. The read-only listings (GET /events/, /events/search,
+/organizer/events, /organizer/dashboard, /bookings/my and the attendee
+exports) take their session from get_read_db, which binds it to one of the replicas in
+DATABASE_REPLICA_URLS in turn; everything else keeps using the primary
+through database.get_db.
+
+After a successful write (any POST, PUT, PATCH or DELETE) the client gets a
+short-lived cookie and its reads go to the primary until it expires, so a
+customer sees their own booking even on a lagging replica.
+
+Every REPLICA_CHECK_SECONDS the replicas are probed in the background (on
+PostgreSQL the probe also reads the replay lag). A replica that fails the
+probe, lags more than REPLICA_MAX_LAG_SECONDS or fails a request is left out
+until a probe succeeds again; with no healthy replica reads go to the primary.
+The request that found a replica failing is run once more on the primary
+(ReplicaRoute), so the client never sees it; a streamed body that has already
+started can't be taken back, but the attendee export reads its event first.
+A page read from a replica is as old as its lag and may be cached that way,
+so the catalogue cache keeps it for REPLICA_STICKY_SECONDS at most, and a
+client pinned to the primary skips the cached page (main.cached_event_page).
+
+Without DATABASE_REPLICA_URLS every read goes to the primary as before.
+To try it locally, a second SQLite file refreshed from the primary stands in
+for a replica:
+
+    DATABASE_REPLICA_URLS=sqlite:///./event_system_replica.db
+    PYTHONPATH=. python -m app.replicas --interval 2
+"""
+
+import argparse
+import asyncio
+import contextvars
+import logging
+import math
+import os
+import sqlite3
+import time
+from contextlib import closing
+from typing import Dict, List, Optional
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from sqlalchemy import exc, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine
+from . import database
+
+
+# configuration
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "5")) # reads stay on the primary this long after the client's write, above the usual lag
+REPLICA_CHECK_SECONDS = float(os.getenv("REPLICA_CHECK_SECONDS", "5")) # between health probes
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "30")) # postgres only, a replica further behind is left out
+PRIMARY_COOKIE = "read_primary_until"
+
+logger = logging.getLogger(__name__)
+
+# an empty or unmigrated copy answers SELECT 1 just fine, so the probe reads one of our tables
+PROBE = text("SELECT 1 FROM events LIMIT 1")
+# seconds a postgres standby is behind, 0 on anything that is not replaying
+POSTGRES_LAG = text("SELECT CASE WHEN pg_is_in_recovery() THEN coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0) ELSE 0 END")
+
+
+class ReplicaStats:
+    def __init__(self):
+        self.replica_reads = 0
+        self.primary_reads = 0 # no replica configured, or none healthy
+        self.pinned_reads = 0 # on the primary right after the client's own write
+        self.failures = 0 # failed probes and requests
+        self.failovers = 0 # requests run again on the primary after their replica failed
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+class ReplicaSet:
+    def __init__(self, primary: AsyncEngine, replicas: List[AsyncEngine]):
+        self.primary = primary
+        self.replicas = replicas
+        self.down: Dict[AsyncEngine, str] = {} # replica -> why it is out of rotation, the error's type for errors
+        self.stats = ReplicaStats()
+        self._turn = 0
+        self._checked_at = 0.0
+        self._check: Optional[asyncio.Task] = None
+
+    def healthy(self) -> List[AsyncEngine]:
+        return [replica for replica in self.replicas if replica not in self.down]
+
+    def route(self, pinned: bool = False) -> AsyncEngine:
+        # the engine for one read-only request
+        if self.replicas:
+            self._schedule_check()
+        healthy = self.healthy()
+        if pinned and healthy:
+            self.stats.pinned_reads += 1
+            return self.primary
+        if not healthy:
+            self.stats.primary_reads += 1
+            return self.primary
+        self._turn += 1
+        self.stats.replica_reads += 1
+        return healthy[self._turn % len(healthy)]
+
+    def mark_down(self, replica: AsyncEngine, reason: str, error: Optional[BaseException] = None):
+        # the error itself only goes to the log, its message can hold SQL and hosts
+        if replica not in self.down:
+            logger.warning("replica %s left out of rotation: %r", replica.url, error if error is not None else reason)
+        self.down[replica] = reason
+        self.stats.failures += 1
+
+    def _schedule_check(self):
+        # probes run in the background of whichever request comes by once they are due, in a
+        # context of their own so their statements aren't counted as that request's
+        if time.monotonic() - self._checked_at < REPLICA_CHECK_SECONDS or (self._check and not self._check.done()):
+            return
+        self._checked_at = time.monotonic()
+        self._check = asyncio.get_running_loop().create_task(self.check(), context=contextvars.Context())
+
+    async def probe(self, replica: AsyncEngine) -> Optional[str]:
+        # None when the replica can serve reads, the reason it can't otherwise, errors are raised
+        async with replica.connect() as conn:
+            await conn.execute(PROBE)
+            if replica.dialect.name == "postgresql":
+                lag = float(await conn.scalar(POSTGRES_LAG))
+                if lag > REPLICA_MAX_LAG_SECONDS:
+                    return f"{lag:.0f}s behind the primary"
+        return None
+
+    async def check(self):
+        reasons = await asyncio.gather(*(self.probe(replica) for replica in self.replicas), return_exceptions=True)
+        for replica, reason in zip(self.replicas, reasons):
+            if isinstance(reason, Exception):
+                self.mark_down(replica, type(reason).__name__, reason)
+            elif reason is not None:
+                self.mark_down(replica, reason)
+            elif self.down.pop(replica, None) is not None:
+                logger.info("replica %s back in rotation", replica.url)
+
+    def as_dict(self):
+        return {
+            **self.stats.as_dict(),
+            "replicas": len(self.replicas),
+            "healthy": len(self.healthy()),
+            # replicas by their position in DATABASE_REPLICA_URLS, the way /metrics names their pools
+            "down": {f"replica-{self.replicas.index(replica)}": reason for replica, reason in self.down.items()},
+        }
+
+replica_set = ReplicaSet(database.async_engine, database.replica_engines)
+
+
+# read-your-writes
+def pinned_to_primary(request: Request) -> bool:
+    try:
+        return float(request.cookies.get(PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+def pin_to_primary(response: Response):
+    response.set_cookie(PRIMARY_COOKIE, f"{time.time() + REPLICA_STICKY_SECONDS:.3f}", max_age=math.ceil(REPLICA_STICKY_SECONDS), httponly=True, samesite="lax")
+
+
+# dependency for the read-only endpoints, database.get_db on a replica. the replica is kept on
+# the request for ReplicaRoute, None on the primary
+async def get_read_db(request: Request):
+    failover = getattr(request.state, "replica_failed", False)
+    bind = replica_set.primary if failover else replica_set.route(pinned=pinned_to_primary(request))
+    request.state.replica = bind if bind is not replica_set.primary else None
+    db = database.AsyncSessionLocal(bind=bind)
+    try:
+        yield db
+    finally:
+        await db.close()
+
+class ReplicaRoute(APIRoute):
+    # the app's route class: when a replica fails under a request it is left out, the next
+    # requests go elsewhere until a probe finds it well again, and this one runs once more on
+    # the primary. requests that read from the primary are never repeated
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            try:
+                return await handler(request)
+            except (exc.OperationalError, exc.InterfaceError) as error:
+                replica = getattr(request.state, "replica", None)
+                if replica is None:
+                    raise
+                replica_set.mark_down(replica, type(error).__name__, error)
+            request.state.replica_failed = True
+            replica_set.stats.failovers += 1
+            return await handler(request)
+
+        return route_handler
+
+
+# the sqlite stand-in: the primary file copied over every replica file with sqlite's online backup
+def copy_sqlite(source_path: str, target_path: str):
+    with closing(sqlite3.connect(source_path)) as source, closing(sqlite3.connect(target_path)) as target:
+        source.backup(target)
+
+def sqlite_path(url: str) -> Optional[str]:
+    parsed = make_url(url)
+    return parsed.database if parsed.get_backend_name() == "sqlite" and parsed.database not in (None, "", ":memory:") else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh the SQLite replicas in DATABASE_REPLICA_URLS from the primary, a local stand-in for replication")
+    parser.add_argument("--interval", type=float, default=2, help="seconds between copies, i.e. the replica lag")
+    parser.add_argument("--once", action="store_true")
+    args = parser.parse_args()
+
+    source = sqlite_path(database.SQLALCHEMY_DATABASE_URL)
+    targets = [path for path in map(sqlite_path, database.DATABASE_REPLICA_URLS) if path]
+    if source is None or not targets:
+        parser.error("needs a SQLite DATABASE_URL and at least one SQLite file in DATABASE_REPLICA_URLS")
+    while True:
+        for target in targets:
+            copy_sqlite(source, target)
+        if args.once:
+            break
+        time.sleep(args.interval)
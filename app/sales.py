@@ -0,0 +1,215 @@
+"""
+Sales rollups for the organizer dashboard. ticket_sales_rollup holds the
+tickets sold and confirmed bookings of every ticket type; crud moves them in
+the transaction of every booking, cancellation and waitlist hand-out, so
+GET /organizer/dashboard reads one row per ticket type instead of every
+booking. Revenue is tickets sold times the ticket's price, a booking doesn't
+carry a price of its own.
+
+The reconciliation job recomputes the totals from the bookings table and
+reports every ticket type whose rollup drifted from them (a write that went
+around crud, a restore, a bug). With --fix it moves the rollups by the
+difference, which stays correct while bookings keep coming in:
+
+    PYTHONPATH=. python -m app.sales            # report, exit status 1 on drift
+    PYTHONPATH=. python -m app.sales --fix --interval 3600
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from typing import Iterable, List, Optional, Tuple
+from sqlalchemy import func, select, union, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import database, models, pagination
+
+
+# configuration
+RECONCILE_BATCH_SIZE = 500 # corrections written per statement
+RECONCILE_REPORTED = 20 # drifted ticket types listed in a report
+
+ROLLUP = models.TicketSalesRollup.__table__
+
+
+# maintenance, called by crud inside its transactions
+def _insert(db: AsyncSession):
+    # both dialects we run on have INSERT ... ON CONFLICT, through their own constructs
+    return postgresql.insert if db.bind.dialect.name == "postgresql" else sqlite.insert
+
+async def adjust(db: AsyncSession, changes: Iterable[Tuple[int, int, int, int]]):
+    # moves the rollups by (ticket_id, event_id, tickets, bookings), creating a
+    # ticket type's row on its first sale. the rows go in ticket id order, the
+    # order the booking paths lock their tickets in
+    rows = [
+        {"ticket_id": ticket_id, "event_id": event_id, "tickets_sold": tickets, "confirmed_bookings": bookings}
+        for ticket_id, event_id, tickets, bookings in sorted(changes)
+        if tickets or bookings
+    ]
+    if not rows:
+        return
+    statement = _insert(db)(ROLLUP).values(rows)
+    await db.execute(statement.on_conflict_do_update(
+        index_elements=[ROLLUP.c.ticket_id],
+        set_={
+            "tickets_sold": ROLLUP.c.tickets_sold + statement.excluded.tickets_sold,
+            "confirmed_bookings": ROLLUP.c.confirmed_bookings + statement.excluded.confirmed_bookings,
+        },
+    ))
+
+async def clear_event(db: AsyncSession, event_id: int):
+    # a cancelled event has cancelled every booking it had
+    await db.execute(update(ROLLUP).where(ROLLUP.c.event_id == event_id).values(tickets_sold=0, confirmed_bookings=0))
+
+async def remove_customer(db: AsyncSession, user_id: int):
+    # takes the customer's confirmed bookings out of the rollups before their rows are deleted
+    mine = (models.Booking.customer_id == user_id, models.Booking.status == models.BookingStatus.CONFIRMED.value)
+    rows = await db.execute(
+        select(models.Booking.ticket_id, models.Ticket.event_id, func.sum(models.Booking.quantity), func.count())
+        .join(models.Ticket, models.Ticket.id == models.Booking.ticket_id)
+        .where(*mine, models.Ticket.event_id != None)
+        .group_by(models.Booking.ticket_id, models.Ticket.event_id)
+    )
+    await adjust(db, [(ticket_id, event_id, -tickets, -bookings) for ticket_id, event_id, tickets, bookings in rows])
+
+
+# the dashboard
+async def get_dashboard(db: AsyncSession, organizer_id: int, skip: int = 0, limit: int = 100, after: Optional[tuple] = None):
+    # one page of the organizer's events (by date, like /organizer/events) with the sales of
+    # each ticket type, plus the totals over all of their events. four statements whatever
+    # the number of events or bookings
+    events = (await db.execute(pagination.ORGANIZER_EVENTS.page(
+        select(models.Event.id, models.Event.title, models.Event.date, models.Event.status, models.Event.total_remaining).where(models.Event.organizer_id == organizer_id),
+        skip=skip, limit=limit, after=after,
+    ))).all()
+
+    tickets = []
+    if events:
+        tickets = await db.execute(
+            select(models.Ticket.id, models.Ticket.event_id, models.Ticket.ticket_type, models.Ticket.price, models.Ticket.quantity_available, func.coalesce(ROLLUP.c.tickets_sold, 0), func.coalesce(ROLLUP.c.confirmed_bookings, 0))
+            .outerjoin(ROLLUP, ROLLUP.c.ticket_id == models.Ticket.id)
+            .where(models.Ticket.event_id.in_([event.id for event in events]))
+            .order_by(models.Ticket.event_id, models.Ticket.id)
+        )
+    ticket_types = {}
+    for ticket_id, event_id, ticket_type, price, remaining, tickets_sold, bookings in tickets:
+        ticket_types.setdefault(event_id, []).append({
+            "id": ticket_id,
+            "ticket_type": ticket_type,
+            "price": price,
+            "tickets_sold": tickets_sold,
+            "confirmed_bookings": bookings,
+            "revenue": round(tickets_sold * price, 2),
+            "remaining": remaining,
+        })
+
+    items = []
+    for event in events:
+        lines = ticket_types.get(event.id, [])
+        items.append({
+            "id": event.id,
+            "title": event.title,
+            "date": event.date,
+            "status": event.status,
+            "tickets_sold": sum(line["tickets_sold"] for line in lines),
+            "revenue": round(sum(line["revenue"] for line in lines), 2),
+            "remaining": event.total_remaining,
+            "ticket_types": lines,
+        })
+
+    owned = models.Event.organizer_id == organizer_id
+    event_count, remaining = (await db.execute(select(func.count(), func.coalesce(func.sum(models.Event.total_remaining), 0)).where(owned))).one()
+    tickets_sold, revenue = (await db.execute(
+        select(func.coalesce(func.sum(ROLLUP.c.tickets_sold), 0), func.coalesce(func.sum(ROLLUP.c.tickets_sold * models.Ticket.price), 0))
+        .join(models.Ticket, models.Ticket.id == ROLLUP.c.ticket_id)
+        .join(models.Event, models.Event.id == ROLLUP.c.event_id)
+        .where(owned)
+    )).one()
+    return {"events": event_count, "tickets_sold": tickets_sold, "revenue": round(revenue, 2), "remaining": remaining, "items": items}
+
+
+# reconciliation
+def expected_sales():
+    # the rollups as the bookings table has them
+    return (
+        select(
+            models.Booking.ticket_id.label("ticket_id"),
+            models.Ticket.event_id.label("event_id"),
+            func.sum(models.Booking.quantity).label("tickets_sold"),
+            func.count().label("confirmed_bookings"),
+        )
+        .join(models.Ticket, models.Ticket.id == models.Booking.ticket_id)
+        .where(models.Booking.status == models.BookingStatus.CONFIRMED.value, models.Ticket.event_id != None)
+        .group_by(models.Booking.ticket_id, models.Ticket.event_id)
+    )
+
+def backfill():
+    # fills an empty rollup table, for data loaded around crud (benchmarks.datagen)
+    return ROLLUP.insert().from_select(["ticket_id", "event_id", "tickets_sold", "confirmed_bookings"], expected_sales())
+
+def drift_query():
+    # every ticket type whose rollup differs from its bookings, both read in one statement (one
+    # snapshot), so the differences still hold after bookings that commit in the meantime.
+    # the keys are a union rather than a full outer join, which sqlite only has since 3.39
+    expected = expected_sales().subquery("expected")
+    keys = union(select(expected.c.ticket_id), select(ROLLUP.c.ticket_id)).subquery("keys")
+    expected_sold, rollup_sold = func.coalesce(expected.c.tickets_sold, 0), func.coalesce(ROLLUP.c.tickets_sold, 0)
+    expected_bookings, rollup_bookings = func.coalesce(expected.c.confirmed_bookings, 0), func.coalesce(ROLLUP.c.confirmed_bookings, 0)
+    return (
+        select(
+            keys.c.ticket_id,
+            func.coalesce(expected.c.event_id, ROLLUP.c.event_id).label("event_id"),
+            expected_sold.label("expected_sold"),
+            rollup_sold.label("rollup_sold"),
+            expected_bookings.label("expected_bookings"),
+            rollup_bookings.label("rollup_bookings"),
+        )
+        .select_from(keys.outerjoin(expected, expected.c.ticket_id == keys.c.ticket_id).outerjoin(ROLLUP, ROLLUP.c.ticket_id == keys.c.ticket_id))
+        .where((expected_sold != rollup_sold) | (expected_bookings != rollup_bookings))
+        .order_by(keys.c.ticket_id)
+    )
+
+async def reconcile(db: AsyncSession, fix: bool = False) -> dict:
+    started = time.perf_counter()
+    drifted = (await db.execute(drift_query())).all()
+    await db.rollback() # the read transaction, sqlite would keep its snapshot otherwise
+    if fix and drifted:
+        corrections = [
+            (row.ticket_id, row.event_id, row.expected_sold - row.rollup_sold, row.expected_bookings - row.rollup_bookings)
+            for row in drifted
+        ]
+        for i in range(0, len(corrections), RECONCILE_BATCH_SIZE):
+            await adjust(db, corrections[i:i + RECONCILE_BATCH_SIZE])
+        await db.commit()
+    return {
+        "drifted": len(drifted),
+        "tickets_sold_drift": sum(row.expected_sold - row.rollup_sold for row in drifted),
+        "bookings_drift": sum(row.expected_bookings - row.rollup_bookings for row in drifted),
+        "fixed": fix and bool(drifted),
+        "seconds": round(time.perf_counter() - started, 3),
+        "examples": [dict(row._mapping) for row in drifted[:RECONCILE_REPORTED]],
+    }
+
+async def _main(args) -> List[dict]:
+    reports = []
+    while True:
+        async with database.AsyncSessionLocal() as db:
+            report = await reconcile(db, fix=args.fix)
+        reports.append(report)
+        print(f"{report['drifted']} ticket types drifted (tickets sold {report['tickets_sold_drift']:+}, bookings {report['bookings_drift']:+}){', fixed' if report['fixed'] else ''} in {report['seconds']}s", flush=True)
+        for example in report["examples"]:
+            print(f"  ticket {example['ticket_id']} (event {example['event_id']}): sold {example['rollup_sold']} -> {example['expected_sold']}, bookings {example['rollup_bookings']} -> {example['expected_bookings']}", flush=True)
+        if not args.interval:
+            return reports
+        await asyncio.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the sales rollups with the bookings table, and correct them with --fix")
+    parser.add_argument("--fix", action="store_true", help="move drifted rollups to the bookings' totals")
+    parser.add_argument("--interval", type=float, default=0, help="seconds between runs, once when 0")
+    args = parser.parse_args()
+    reports = asyncio.run(_main(args))
+    if not args.fix and reports[-1]["drifted"]:
+        sys.exit(1)
@@ -3,7 +3,7 @@ Data shapes (Pydantic). This defines what the data should
 look like when a user sends a request
 """
 
-from pydantic import BaseModel, EmailStr, ConfigDict
+from pydantic import BaseModel, EmailStr, ConfigDict, Field
 from typing import List, Optional
 from datetime import datetime
 
@@ -25,6 +25,14 @@ class User(UserBase):
     class Config:
         model_config = ConfigDict(from_attributes=True)
 
+class TokenClaims(BaseModel):
+    # the verified identity carried inside an access token, enough for
+    # role checks and most handlers without loading the users row
+    id: int
+    email: str
+    role: str
+    version: int = 0
+
 
 # ticket schemas
 class TicketBase(BaseModel):
@@ -74,6 +82,9 @@ class BookingCreate(BaseModel):
     ticket_id: int
     quantity: int
 
+class BookingBatchCreate(BaseModel):
+    items: List[BookingCreate] = Field(min_length=1, max_length=20) # one line per ticket type, reserved together or not at all
+
 class Booking(BaseModel):
     id: int
     customer_id: int
@@ -83,6 +94,34 @@ class Booking(BaseModel):
     class Config:
         model_config = ConfigDict(from_attributes=True)
 
+# organizer dashboard, from the sales rollups
+class TicketSales(BaseModel):
+    id: int
+    ticket_type: str
+    price: float
+    tickets_sold: int
+    confirmed_bookings: int
+    revenue: float
+    remaining: int
+
+class EventSales(BaseModel):
+    id: int
+    title: str
+    date: datetime
+    status: str
+    tickets_sold: int
+    revenue: float
+    remaining: int
+    ticket_types: List[TicketSales] = []
+
+class SalesDashboard(BaseModel):
+    # totals over all of the organizer's events, `items` is one page of them
+    events: int
+    tickets_sold: int
+    revenue: float
+    remaining: int
+    items: List[EventSales] = []
+
 class WaitlistBase(BaseModel):
     ticket_id: int
     quantity: int = 1
@@ -0,0 +1,92 @@
+"""
+Full-text search over event titles, descriptions and venues.
+
+SQLite uses an external-content FTS5 table (events_fts) kept in sync by
+triggers on events, PostgreSQL a GIN index over a tsvector expression that
+the database maintains on its own. Both are created together with the
+events table (create_all) and by the matching alembic migration.
+"""
+
+import re
+from sqlalchemy import DDL, column, event, func, literal_column, table
+from .models import Event
+
+
+FTS_TABLE = "events_fts"
+TS_CONFIG = "english"
+
+SQLITE_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(title, description, venue, content='events', content_rowid='id')",
+    f"""CREATE TRIGGER IF NOT EXISTS events_fts_insert AFTER INSERT ON events BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, description, venue) VALUES (new.id, new.title, new.description, new.venue);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS events_fts_delete AFTER DELETE ON events BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description, venue) VALUES ('delete', old.id, old.title, old.description, old.venue);
+    END""",
+    # only the searchable columns, inventory updates on every booking leave the index alone
+    f"""CREATE TRIGGER IF NOT EXISTS events_fts_update AFTER UPDATE OF title, description, venue ON events BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description, venue) VALUES ('delete', old.id, old.title, old.description, old.venue);
+        INSERT INTO {FTS_TABLE}(rowid, title, description, venue) VALUES (new.id, new.title, new.description, new.venue);
+    END""",
+    # a title hit counts more than a venue hit, which counts more than one in the description
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES ('rank', 'bm25(10.0, 1.0, 4.0)')",
+    # indexing whatever was already in the table
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+SQLITE_DROP_DDL = [
+    "DROP TRIGGER IF EXISTS events_fts_update",
+    "DROP TRIGGER IF EXISTS events_fts_delete",
+    "DROP TRIGGER IF EXISTS events_fts_insert",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+# same weighting on postgres, A for the title, B for the venue, C for the description
+POSTGRES_DOCUMENT = (
+    f"setweight(to_tsvector('{TS_CONFIG}', coalesce(title, '')), 'A') || "
+    f"setweight(to_tsvector('{TS_CONFIG}', coalesce(venue, '')), 'B') || "
+    f"setweight(to_tsvector('{TS_CONFIG}', coalesce(description, '')), 'C')"
+)
+POSTGRES_DDL = [f"CREATE INDEX IF NOT EXISTS ix_events_search ON events USING gin (({POSTGRES_DOCUMENT}))"]
+POSTGRES_DROP_DDL = ["DROP INDEX IF EXISTS ix_events_search"]
+
+for statement in SQLITE_DDL:
+    event.listen(Event.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+for statement in SQLITE_DROP_DDL:
+    event.listen(Event.__table__, "before_drop", DDL(statement).execute_if(dialect="sqlite"))
+for statement in POSTGRES_DDL:
+    event.listen(Event.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+
+
+_fts = table(FTS_TABLE, column("rowid"), column("rank"))
+
+# the very text of the index expression, so the planner can match the two up
+_postgres_document = literal_column(f"({POSTGRES_DOCUMENT})")
+
+
+def fts5_query(text: str) -> str:
+    # user input as fts5 syntax, every word has to match and the last one may be a prefix
+    # ("jazz clu" finds "Jazz Club"). quoting each word keeps operators and punctuation inert
+    words = re.findall(r"\w+", text.lower())
+    if not words:
+        return ""
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def apply(query, text: str, dialect: str):
+    # filters `query` (a select of Event) to the matches of `text`, best match first.
+    # returns None when the text holds nothing searchable
+    if dialect == "postgresql":
+        tsquery = func.websearch_to_tsquery(TS_CONFIG, text)
+        return query.where(_postgres_document.op("@@")(tsquery)).order_by(func.ts_rank(_postgres_document, tsquery).desc(), Event.id)
+
+    match = fts5_query(text)
+    if not match:
+        return None
+    # bm25 rank, lower is better
+    return (
+        query.join(_fts, _fts.c.rowid == Event.id)
+        .where(literal_column(FTS_TABLE).op("MATCH")(match))
+        .order_by(_fts.c.rank, Event.id)
+    )
@@ -1,11 +1,22 @@
 """
 Celery tasks for email simulations
+
+Mass mailings are split into bounded chunks (event_update_messages and
+confirmation_messages), so the broker never sees a multi-megabyte message
+or one message per recipient
 """
 
-from celery import Celery
+import os
+from typing import Iterable, Iterator, List, Sequence, Tuple
+from celery import Celery, Signature
+
+
+# configuration
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
+NOTIFY_CHUNK_SIZE = int(os.getenv("NOTIFY_CHUNK_SIZE", "500")) # recipients (or confirmations) per task message
 
 # using Redis as the mailman who delivers the messages
-celery_app = Celery("tasks", broker="redis://localhost:6379/0")
+celery_app = Celery("tasks", broker=CELERY_BROKER_URL)
 
 
 @celery_app.task
@@ -13,7 +24,37 @@ def send_booking_confirmation(email: str, event_title: str):
     print(f"CELERY TASK: Sending confirmation email to {email} for event '{event_title}'")
 
 
+@celery_app.task
+def send_booking_confirmations(messages: list):
+    # many (email, message) pairs in one task
+    for email, event_title in messages:
+        send_booking_confirmation(email, event_title)
+
+
 @celery_app.task
 def notify_event_update(emails: list, event_title: str):
     for email in emails:
-        print(f"CELERY TASK: Notifying {email} that the event '{event_title}' has been updated.")
\ No newline at end of file
+        print(f"CELERY TASK: Notifying {email} that the event '{event_title}' has been updated.")
+
+
+def chunked(items: Iterable, size: int) -> Iterator[list]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# batch api, the chunked task signatures for a mailing. they are written to the outbox
+# (app/outbox.py) by the request and published from there
+def event_update_messages(emails: Iterable[str], event_title: str, chunk_size: int = NOTIFY_CHUNK_SIZE) -> List[Signature]:
+    return [notify_event_update.s(chunk, event_title) for chunk in chunked(emails, chunk_size)]
+
+def confirmation_messages(messages: Sequence[Tuple[str, str]], chunk_size: int = NOTIFY_CHUNK_SIZE) -> List[Signature]:
+    # a single confirmation keeps going through the plain task
+    if len(messages) == 1:
+        return [send_booking_confirmation.s(*messages[0])]
+    return [send_booking_confirmations.s([list(message) for message in chunk]) for chunk in chunked(messages, chunk_size)]
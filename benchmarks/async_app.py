@@ -0,0 +1,11 @@
+"""
+app.main for the async benchmark, with the read-through cache off (unless
+CACHE_BACKEND is set): the sync baseline has none and every listing has to
+reach the database on both sides
+"""
+
+import os
+
+os.environ.setdefault("CACHE_BACKEND", "off")
+
+from app.main import app
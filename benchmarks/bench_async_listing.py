@@ -0,0 +1,42 @@
+"""
+Requests/sec on GET /events/ for the async request path against the old
+sync threadpool path, at 500+ concurrent connections.
+
+    python -m benchmarks.bench_async_listing --events 500 --concurrency 500 --duration 30
+"""
+
+import argparse
+import asyncio
+from benchmarks import common
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load per server")
+    parser.add_argument("--limit", type=int, default=20, help="page size asked from /events/")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers per server")
+    args = parser.parse_args()
+
+    common.scratch_database("async_listing")
+    common.create_schema()
+    common.seed_events(args.events)
+
+    rows = []
+    for label, app_path in (("sync (threadpool)", "benchmarks.sync_app:app"), ("async (AsyncSession)", "benchmarks.async_app:app")):
+        port = common.free_port()
+        server = common.serve(app_path, port, workers=args.workers)
+        try:
+            url = f"http://127.0.0.1:{port}/events/?limit={args.limit}"
+            asyncio.run(common.hammer(url, 2, 10)) # warm up
+            rps, latencies, errors = asyncio.run(common.hammer(url, args.duration, args.concurrency))
+        finally:
+            common.stop(server)
+        rows.append((label, f"{rps:8.1f} req/s  p50 {common.percentile(latencies, 50) * 1000:7.1f} ms  p99 {common.percentile(latencies, 99) * 1000:7.1f} ms  errors {errors}"))
+
+    common.report(f"GET /events/?limit={args.limit} with {args.concurrency} concurrent connections", rows)
+
+
+if __name__ == "__main__":
+    main()
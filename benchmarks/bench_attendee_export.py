@@ -0,0 +1,149 @@
+"""
+Attendee exports on a real uvicorn server: GET /events/{id}/attendees.csv and
+.ndjson for an event with --bookings confirmed bookings and one with a tenth
+of them. Reports rows/sec and how much the server's peak RSS (VmHWM) grew
+over the export, against loading the same rows with .all() and encoding them
+in one piece, the way a non-streaming endpoint would (in a process of its
+own, with the same measure). The streamed exports should grow the same for
+both events; the loaded one grows with the event.
+
+SQLite's page cache and mmap count towards RSS too and grow with the pages
+read, up to their limits, so the runs cap them (SQLITE_CACHE_SIZE_KIB=1024,
+SQLITE_MMAP_SIZE=0 unless set) to show the export's own memory.
+
+    python -m benchmarks.bench_attendee_export --bookings 100000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from benchmarks import common
+
+FORMATS = ("csv", "ndjson")
+
+
+def memory_kib(pid, field: str) -> int:
+    # VmRSS (now) or VmHWM (peak) of a process, in KiB
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+
+def seed(args):
+    # one organizer, the customers and three events: big, small and one without bookings for warming up
+    from sqlalchemy import update
+    from app import database, models
+    organizer_id, event_ids = common.seed_events(3, tickets_per_event=3, quantity=args.bookings)
+    with database.engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), [
+            {"email": f"attendee-{i}@example.com", "hashed_password": "x", "role": "customer"} for i in range(args.customers)
+        ])
+        first_customer = organizer_id + 1
+        tickets = {event_id: [row[0] for row in conn.execute(models.Ticket.__table__.select().with_only_columns(models.Ticket.id).where(models.Ticket.event_id == event_id))] for event_id in event_ids}
+        for event_id, n in ((event_ids[0], args.bookings), (event_ids[1], args.bookings // 10)):
+            for start in range(0, n, 10_000):
+                conn.execute(models.Booking.__table__.insert(), [
+                    {"customer_id": first_customer + i % args.customers, "ticket_id": tickets[event_id][i % 3], "quantity": 1 + i % 4, "status": models.BookingStatus.CONFIRMED.value}
+                    for i in range(start, min(n, start + 10_000))
+                ])
+        conn.execute(update(models.Event).values(organizer_id=organizer_id))
+    return organizer_id, event_ids
+
+
+async def export(port, headers, event_id, export_format):
+    import httpx
+    rows, size = 0, 0
+    started = time.perf_counter()
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", headers=headers, timeout=None) as client:
+        async with client.stream("GET", f"/events/{event_id}/attendees.{export_format}") as response:
+            assert response.status_code == 200, response.status_code
+            async for chunk in response.aiter_bytes():
+                rows += chunk.count(b"\n")
+                size += len(chunk)
+    return rows - (export_format == "csv"), size, time.perf_counter() - started
+
+
+async def streamed(args, headers, event_ids):
+    results = []
+    for export_format in FORMATS:
+        for label, event_id in (("big", event_ids[0]), ("small", event_ids[1])):
+            # a fresh server per export, so its peak RSS is this export's
+            port = common.free_port()
+            proc = common.serve("benchmarks.async_app:app", port)
+            try:
+                await export(port, headers, event_ids[2], export_format)
+                before = memory_kib(proc.pid, "VmRSS")
+                rows, size, seconds = await export(port, headers, event_id, export_format)
+                grown = memory_kib(proc.pid, "VmHWM") - before
+            finally:
+                common.stop(proc)
+            results.append((f"{export_format}, {label} event", rows, size, seconds, grown))
+    return results
+
+
+def loaded(event_id, empty_event_id):
+    # what a non-streaming export costs: every row in memory, then the whole body
+    from app import crud, database, exports
+
+    async def load():
+        async with database.AsyncSessionLocal() as db:
+            await db.execute(crud.event_attendees_query(empty_event_id)) # warming up
+            before = memory_kib("self", "VmRSS")
+            started = time.perf_counter()
+            rows = (await db.execute(crud.event_attendees_query(event_id))).all()
+            body = exports.encode_csv([exports.COLUMNS]) + exports.encode_csv(rows)
+            seconds = time.perf_counter() - started
+        grown = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+        return len(rows), len(body), seconds, grown
+
+    print(json.dumps(asyncio.run(load())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bookings", type=int, default=100_000, help="confirmed bookings of the big event, the small one has a tenth")
+    parser.add_argument("--customers", type=int, default=20_000)
+    parser.add_argument("--loaded", type=int, nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    os.environ.setdefault("SQLITE_CACHE_SIZE_KIB", "1024")
+    os.environ.setdefault("SQLITE_MMAP_SIZE", "0")
+    if args.loaded:
+        loaded(*args.loaded)
+        return
+
+    common.scratch_database("attendee_export")
+    common.create_schema()
+    organizer_id, event_ids = seed(args)
+
+    # a JWT signed here is good for every server process, its version is the one on the users row
+    from datetime import timedelta
+    from app import auth
+    version = asyncio.run(auth.token_version(organizer_id))
+    token = auth.create_access_token({"sub": "bench-organizer@test.com", "uid": organizer_id, "role": "organizer", "ver": version}, expires_delta=timedelta(hours=1))
+    headers = {"Authorization": f"Bearer {token}"}
+    results = asyncio.run(streamed(args, headers, event_ids))
+
+    for label, event_id in (("big", event_ids[0]), ("small", event_ids[1])):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_attendee_export", "--loaded", str(event_id), str(event_ids[2])],
+            cwd=common.ROOT, env=os.environ.copy(), capture_output=True, text=True, check=True,
+        ).stdout.strip().splitlines()[-1]
+        rows, size, seconds, grown = json.loads(output)
+        results.append((f"loaded with .all(), {label} event", rows, size, seconds, grown))
+
+    common.report(f"attendee exports, {args.bookings} and {args.bookings // 10} bookings", [
+        (label, f"{rows:8d} rows  {rows / seconds:9.0f} rows/s  {size / 1024 / 1024:6.1f} MiB  peak RSS +{grown / 1024:6.1f} MiB")
+        for label, rows, size, seconds, grown in results
+    ])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Cart checkout: every customer books several ticket types of one event,
+either with one crud.create_booking call (and transaction) per line or with
+a single crud.create_bookings call for the whole cart.
+
+    python -m benchmarks.bench_batch_booking --carts 300 --lines 4 --concurrency 20
+"""
+
+import argparse
+import asyncio
+import time
+from benchmarks import common
+
+
+async def run_mode(mode, args, ticket_ids):
+    from app import crud, database, schemas
+
+    pending = asyncio.Queue()
+    for i in range(args.carts):
+        pending.put_nowait(i)
+    latencies, statements = [], []
+    counts = {"failed": 0, "errors": 0}
+
+    async def checkout(customer_id, items):
+        if mode == "batch":
+            async with database.AsyncSessionLocal() as db:
+                return await crud.create_bookings(db, items, customer_id) is not None
+        for item in items:
+            async with database.AsyncSessionLocal() as db:
+                if await crud.create_booking(db, item, customer_id) is None:
+                    return False
+        return True
+
+    async def attempt(customer_id, items):
+        try:
+            return await checkout(customer_id, items)
+        except Exception:
+            counts["errors"] += 1 # e.g. sqlite "database is locked" under write contention
+            return False
+
+    async def worker():
+        while True:
+            try:
+                i = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            items = [schemas.BookingCreate(ticket_id=ticket_id, quantity=1) for ticket_id in ticket_ids]
+            started = time.perf_counter()
+            with database.count_queries() as counter:
+                ok = await attempt(1000 + i, items)
+            latencies.append(time.perf_counter() - started)
+            statements.append(counter.count)
+            if not ok:
+                counts["failed"] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    common.report(f"{mode}: {args.carts} carts of {args.lines} lines, concurrency {args.concurrency}", [
+        ("carts/sec", f"{args.carts / elapsed:.1f}"),
+        ("failed carts (of which errors)", f"{counts['failed']} ({counts['errors']})"),
+        ("cart latency p50 / p99", f"{common.percentile(latencies, 50) * 1000:.1f} ms / {common.percentile(latencies, 99) * 1000:.1f} ms"),
+        ("SQL statements per cart", f"{sum(statements) / len(statements):.1f}"),
+    ])
+
+
+async def run(args):
+    from sqlalchemy import select
+    from app import database, models
+
+    # one event per mode, with enough stock for every cart
+    _, event_ids = common.seed_events(2, tickets_per_event=args.lines, quantity=args.carts)
+    for mode, event_id in zip(("separate", "batch"), event_ids):
+        async with database.AsyncSessionLocal() as db:
+            ticket_ids = (await db.scalars(select(models.Ticket.id).where(models.Ticket.event_id == event_id))).all()
+        await run_mode(mode, args, ticket_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--carts", type=int, default=300)
+    parser.add_argument("--lines", type=int, default=4, help="ticket types per cart")
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    common.scratch_database("batch_booking")
+    common.create_schema()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
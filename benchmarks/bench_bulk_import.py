@@ -0,0 +1,115 @@
+"""
+Onboarding a season of events. The same NDJSON file of events with their
+tickets goes in through
+
+    per event   one POST /events per line (what organizers had to do)
+    bulk        one POST /events/bulk streaming the whole file
+    loader      the command line loader (python -m app.bulk), run on the file and on
+                one ten times bigger to show that its memory does not grow with the input
+
+    python -m benchmarks.bench_bulk_import --events 5000 --tickets 3
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from benchmarks import common
+
+
+def write_ndjson(path, n_events, n_tickets):
+    # streamed to disk line by line, the big file never sits in memory here either
+    rng = random.Random(1)
+    start = datetime.now() + timedelta(days=30)
+    with open(path, "w", encoding="utf-8") as file:
+        for i in range(n_events):
+            file.write(json.dumps({
+                "title": f"Season Event {i}",
+                "description": "Imported in bulk",
+                "date": (start + timedelta(hours=i)).isoformat(),
+                "venue": f"Venue {i % 40}",
+                "tickets": [{"ticket_type": f"Tier {t}", "price": 15.0 + 10 * t, "quantity_available": rng.randint(50, 500)} for t in range(n_tickets)],
+            }) + "\n")
+    return path
+
+
+async def run(args, small, big):
+    import httpx
+    from app import bulk, main
+
+    rows = args.events * (1 + args.tickets)
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=None)
+    await client.post("/register", json={"email": "bench-organizer@bench-import.com", "password": "pw", "role": "organizer"})
+    token = (await client.post("/token", data={"username": "bench-organizer@bench-import.com", "password": "pw"})).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    # per event
+    statements, started = 0, time.perf_counter()
+    with open(small, encoding="utf-8") as file:
+        for line in file:
+            response = await client.post("/events", content=line.encode(), headers={**headers, "Content-Type": "application/json"})
+            assert response.status_code == 200, response.text
+            statements += int(response.headers["X-Query-Count"])
+    elapsed = time.perf_counter() - started
+    common.report(f"per event: {args.events} x POST /events", [
+        ("seconds", f"{elapsed:.2f}"),
+        ("rows/sec", f"{rows / elapsed:,.0f}"),
+        ("SQL statements", statements),
+    ])
+
+    # bulk
+    async def body():
+        with open(small, "rb") as file:
+            while chunk := file.read(64 * 1024):
+                yield chunk
+
+    started = time.perf_counter()
+    response = await client.post("/events/bulk", content=body(), headers={**headers, "Content-Type": "application/x-ndjson"})
+    elapsed = time.perf_counter() - started
+    result = response.json()
+    assert response.status_code == 200 and result["events"] == args.events, response.text
+    common.report(f"bulk: one POST /events/bulk, {args.events} events", [
+        ("seconds", f"{elapsed:.2f}"),
+        ("rows/sec", f"{rows / elapsed:,.0f}"),
+        ("SQL statements", response.headers["X-Query-Count"]),
+        ("batches", result["batches"]),
+    ])
+
+    # loader, with the python heap traced
+    organizer_id = 1
+    for path, n_events in ((small, args.events), (big, args.events * 10)):
+        tracemalloc.start()
+        with open(path, encoding="utf-8") as file:
+            result = await bulk.load(file, organizer_id)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert result.events == n_events
+        common.report(f"loader: {n_events} events ({os.path.getsize(path) / 1024 / 1024:.1f} MiB file, tracemalloc slows it down)", [
+            ("seconds", f"{result.seconds:.2f}"),
+            ("rows/sec", f"{result.as_dict()['rows_per_sec']:,}"),
+            ("peak traced memory", f"{peak / 1024 / 1024:.1f} MiB"),
+        ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--tickets", type=int, default=3, help="ticket types per event")
+    args = parser.parse_args()
+
+    common.scratch_database("bulk_import")
+    os.environ.update(QUERY_COUNT_HEADER="on")
+    common.create_schema()
+    workdir = tempfile.mkdtemp(prefix="bench-import-")
+    small = write_ndjson(os.path.join(workdir, "season.ndjson"), args.events, args.tickets)
+    big = write_ndjson(os.path.join(workdir, "season-x10.ndjson"), args.events * 10, args.tickets)
+    asyncio.run(run(args, small, big))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Mobile clients polling the catalogue. Every client fetches GET /events/ over
+and over while a customer keeps buying tickets now and then, either
+
+    plain        downloading the page every time
+    conditional  sending back the ETag it got in If-None-Match (304 when unchanged)
+
+and the run reports bytes sent, SQL statements issued and request latency.
+Run it with CACHE_BACKEND=off to see the database side without the cache.
+
+    python -m benchmarks.bench_conditional_get --clients 50 --polls 40 --sale-every 200
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from benchmarks import common
+
+
+async def run(args):
+    import httpx
+    from sqlalchemy import select
+    from app import database, main, models
+
+    common.seed_events(args.page * 2, tickets_per_event=2, quantity=100000)
+    with database.engine.connect() as conn:
+        ticket_id = conn.execute(select(models.Ticket.id).limit(1)).scalar()
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench")
+    await client.post("/register", json={"email": "bench-buyer@bench-etag.com", "password": "pw", "role": "customer"})
+    token = (await client.post("/token", data={"username": "bench-buyer@bench-etag.com", "password": "pw"})).json()["access_token"]
+    buyer = {"Authorization": f"Bearer {token}"}
+
+    for mode in ("plain", "conditional"):
+        totals = {"bytes": 0, "statements": 0, "304": 0, "requests": 0, "sales": 0}
+        latencies = []
+
+        async def poller():
+            etag = None
+            for _ in range(args.polls):
+                headers = {"If-None-Match": etag} if mode == "conditional" and etag else {}
+                started = time.perf_counter()
+                response = await client.get("/events/", params={"limit": args.page}, headers=headers)
+                latencies.append(time.perf_counter() - started)
+                totals["requests"] += 1
+                totals["bytes"] += len(response.content)
+                totals["statements"] += int(response.headers["X-Query-Count"])
+                if response.status_code == 304:
+                    totals["304"] += 1
+                else:
+                    etag = response.headers.get("ETag")
+                if totals["requests"] % args.sale_every == 0:
+                    await client.post("/bookings/", json={"ticket_id": ticket_id, "quantity": 1}, headers=buyer)
+                    totals["sales"] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(poller() for _ in range(args.clients)))
+        elapsed = time.perf_counter() - started
+        common.report(f"{mode}: {args.clients} clients x {args.polls} polls of {args.page} events, {totals['sales']} sales", [
+            ("requests/sec", f"{totals['requests'] / elapsed:.0f}"),
+            ("p50 / p99", f"{common.percentile(latencies, 50) * 1000:.1f} ms / {common.percentile(latencies, 99) * 1000:.1f} ms"),
+            ("304 responses", totals["304"]),
+            ("response bytes", f"{totals['bytes'] / 1024 / 1024:.1f} MiB"),
+            ("SQL statements (listings)", totals["statements"]),
+        ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--polls", type=int, default=40, help="requests per client")
+    parser.add_argument("--page", type=int, default=100, help="events per page")
+    parser.add_argument("--sale-every", type=int, default=200, help="one booking per this many polls")
+    args = parser.parse_args()
+
+    common.scratch_database("conditional_get")
+    os.environ.update(QUERY_COUNT_HEADER="on")
+    common.create_schema()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
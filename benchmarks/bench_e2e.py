@@ -0,0 +1,265 @@
+"""
+End-to-end load suite: the FastAPI app driven in-process through httpx
+against a benchmarks.datagen dataset. Each scenario sends a fixed number of
+requests from --concurrency clients, --repeat times, and reports the best
+round's requests/sec and latency percentiles:
+
+    listing   GET /events/, first pages and the pages behind their cursors
+    search    GET /events/search, keywords plus venue / time slot / weekend filters
+    booking   POST /bookings/ on tickets with stock left
+    cancel    PUT /bookings/{id}/cancel on sold out tickets, the waitlist takes the seats
+    login     POST /token, bcrypt included
+
+A run can be stored as a baseline and later runs compared against it. A
+scenario whose requests/sec drops, or whose p95 grows, by more than
+--tolerance (or that starts failing requests) fails the comparison with exit
+status 1:
+
+    python -m benchmarks.bench_e2e --scale small --save-baseline benchmarks/baselines/e2e-small.json
+    python -m benchmarks.bench_e2e --scale small --baseline benchmarks/baselines/e2e-small.json
+
+--data runs on a copy of a SQLite file made by benchmarks.datagen, so a large
+dataset is generated once and reused. Baselines only compare on the same
+machine and settings, the settings are stored next to the numbers.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import time
+from benchmarks import common, datagen
+
+SCENARIOS = ("listing", "search", "booking", "cancel", "login")
+PAGE_SIZE = 20
+LISTING_DEPTH = 5 # pages a client follows through X-Next-Cursor before starting over
+
+
+async def prepare(args):
+    # everything the scenarios pick from, read once from the dataset
+    from datetime import datetime
+    from sqlalchemy import exists, select
+    from app import auth, database, models
+
+    with database.engine.connect() as conn:
+        customers = conn.execute(
+            select(models.User.id, models.User.email).where(models.User.role == "customer").order_by(models.User.id).limit(args.customers)
+        ).all()
+        tickets = conn.scalars(
+            select(models.Ticket.id).join(models.Event)
+            .where(models.Event.status == models.EventStatus.ACTIVE.value, models.Event.date >= datetime.now(), models.Ticket.quantity_available >= 10)
+            .order_by(models.Ticket.id).limit(5000)
+        ).all()
+        # bookings on tickets people are queueing for, each cancel hands seats to the waitlist
+        queued = exists().where(models.Waitlist.ticket_id == models.Booking.ticket_id)
+        cancellable = conn.execute(
+            select(models.Booking.id, models.User.id, models.User.email).join(models.User, models.User.id == models.Booking.customer_id)
+            .where(models.Booking.status == models.BookingStatus.CONFIRMED.value, queued)
+            .order_by(models.Booking.id).limit(args.cancels * args.repeat)
+        ).all()
+
+    tokens = {}
+    async def token(user_id, email):
+        # minted directly, the login scenario is the only one paying for bcrypt
+        if user_id not in tokens:
+            tokens[user_id] = {"Authorization": f"Bearer {await auth.create_user_token(models.User(id=user_id, email=email, role='customer'))}"}
+        return tokens[user_id]
+
+    return {
+        "customers": [(row[0], row[1], await token(row[0], row[1])) for row in customers],
+        "tickets": tickets,
+        "cancellable": [(booking_id, await token(user_id, email)) for booking_id, user_id, email in cancellable],
+    }
+
+
+# one request of each scenario, `state` belongs to the client sending it
+async def listing(client, ctx, rng, state):
+    params = {"limit": PAGE_SIZE}
+    if state.get("cursor") and state.get("depth", 0) < LISTING_DEPTH:
+        params["cursor"] = state["cursor"]
+        state["depth"] = state.get("depth", 0) + 1
+    else:
+        state["depth"] = 0
+    response = await client.get("/events/", params=params)
+    state["cursor"] = response.headers.get("X-Next-Cursor")
+    return response
+
+async def search(client, ctx, rng, state):
+    kind = rng.randrange(4)
+    if kind == 0:
+        params = {"q": rng.choice(datagen.GENRES)}
+    elif kind == 1:
+        params = {"q": f"{rng.choice(datagen.GENRES)} {rng.choice(datagen.KINDS)[:3]}"}
+    elif kind == 2:
+        params = {"venue": rng.choice(datagen.CITIES), "time_slot": rng.choice(["morning", "afternoon", "evening", "night"])}
+    else:
+        params = {"venue": rng.choice(datagen.CITIES), "is_weekend": rng.choice(["true", "false"])}
+    return await client.get("/events/search", params={**params, "limit": PAGE_SIZE})
+
+async def booking(client, ctx, rng, state):
+    _, _, headers = rng.choice(ctx["customers"])
+    return await client.post("/bookings/", json={"ticket_id": rng.choice(ctx["tickets"]), "quantity": rng.randint(1, 2)}, headers=headers)
+
+async def cancel(client, ctx, rng, state):
+    booking_id, headers = ctx["cancellable"].pop()
+    return await client.put(f"/bookings/{booking_id}/cancel", headers=headers)
+
+async def login(client, ctx, rng, state):
+    _, email, _ = rng.choice(ctx["customers"])
+    return await client.post("/token", data={"username": email, "password": datagen.PASSWORD})
+
+# statuses that count as a served request, an empty search result is a 404
+EXPECTED = {"search": (200, 404)}
+
+
+async def run_scenario(client, name, ctx, requests, args):
+    send = globals()[name]
+    rng = random.Random(f"{args.seed}-{name}")
+    latencies, errors = [], {}
+    left = requests
+
+    async def worker():
+        nonlocal left
+        state = {}
+        while left > 0:
+            left -= 1
+            started = time.perf_counter()
+            try:
+                response = await send(client, ctx, rng, state)
+                status = response.status_code
+            except Exception as exc:
+                status = type(exc).__name__
+            if status in EXPECTED.get(name, (200,)):
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors[status] = errors.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": requests,
+        "errors": sum(errors.values()),
+        "per_sec": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(common.percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(common.percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(common.percentile(latencies, 99) * 1000, 2),
+        "error_statuses": {str(status): count for status, count in errors.items()},
+    }
+
+
+async def run(args):
+    import httpx
+    from app import main
+
+    ctx = await prepare(args)
+    requests = {
+        "listing": args.requests,
+        "search": args.requests,
+        "booking": args.bookings,
+        "cancel": min(args.cancels, len(ctx["cancellable"]) // args.repeat),
+        "login": args.logins,
+    }
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=None)
+    await client.get("/events/", params={"limit": PAGE_SIZE}) # warm up
+    results = {}
+    for name in args.scenarios:
+        # the fastest round is the one least disturbed by the rest of the machine, the errors come from the worst one
+        rounds = [await run_scenario(client, name, ctx, requests[name], args) for _ in range(args.repeat)]
+        worst = max(rounds, key=lambda round: round["errors"])
+        result = results[name] = {**max(rounds, key=lambda round: round["per_sec"]), "errors": worst["errors"], "error_statuses": worst["error_statuses"]}
+        errors = ", ".join(f"{status}: {count}" for status, count in result["error_statuses"].items()) or "none"
+        common.report(f"{name}: {result['requests']} requests, concurrency {args.concurrency}, best of {args.repeat}", [
+            ("requests/sec", result["per_sec"]),
+            ("p50 / p95 / p99", f"{result['p50_ms']:.1f} ms / {result['p95_ms']:.1f} ms / {result['p99_ms']:.1f} ms"),
+            ("errors", errors),
+        ])
+    await client.aclose()
+    return results
+
+
+def settings(args):
+    from app import auth, cache, database, serialization
+    return {
+        "dataset": os.path.basename(args.data) if args.data else f"{args.scale}, seed {args.seed}",
+        "database": database.engine.dialect.name,
+        "concurrency": args.concurrency,
+        "repeat": args.repeat,
+        "cache_backend": cache.CACHE_BACKEND,
+        "fast_json": serialization.FAST_JSON,
+        "bcrypt_rounds": auth.BCRYPT_ROUNDS,
+    }
+
+
+def compare(current, baseline, tolerance) -> list:
+    # prints the change of every scenario against the baseline, returns the regressions
+    for name, value in baseline["settings"].items():
+        if current["settings"].get(name) != value:
+            print(f"warning: {name} is {current['settings'].get(name)!r}, the baseline ran with {value!r}")
+    if current["rows"] != baseline["rows"]:
+        print(f"warning: the dataset differs from the baseline's ({baseline['rows']})")
+
+    regressions, rows = [], []
+    for name, result in current["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if not before:
+            continue
+        speed = result["per_sec"] / before["per_sec"] - 1 if before["per_sec"] else 0.0
+        p95 = result["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] else 0.0
+        verdict = "ok"
+        if speed < -tolerance or p95 > tolerance or result["errors"] > before["errors"]:
+            verdict = "REGRESSION"
+            regressions.append(name)
+        rows.append((name, f"{result['per_sec']:8.1f} req/s ({speed:+6.1%})  p95 {result['p95_ms']:7.1f} ms ({p95:+6.1%})  errors {result['errors']}  {verdict}"))
+    common.report(f"against the baseline, tolerance {tolerance:.0%}", rows)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=datagen.SCALES, default="small", help="dataset generated for the run")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--data", default=None, help="SQLite file from benchmarks.datagen, used instead of --scale (on a copy)")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=SCENARIOS)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=1000, help="requests per read scenario (listing, search)")
+    parser.add_argument("--bookings", type=int, default=300)
+    parser.add_argument("--cancels", type=int, default=200, help="at most, bounded by the bookings with a waitlist behind them")
+    parser.add_argument("--logins", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=3, help="rounds per scenario, the fastest one is reported")
+    parser.add_argument("--customers", type=int, default=500, help="customers the booking and login requests come from")
+    parser.add_argument("--baseline", default=None, help="results file to compare against")
+    parser.add_argument("--save-baseline", default=None, help="write the results to this file")
+    parser.add_argument("--tolerance", type=float, default=0.30, help="allowed drop in requests/sec and growth of p95")
+    args = parser.parse_args()
+
+    path = common.scratch_database("e2e")[len("sqlite:///"):]
+    if args.data:
+        shutil.copyfile(args.data, path)
+    common.create_schema()
+    if not args.data:
+        counts = datagen.generate(seed=args.seed, **datagen.SCALES[args.scale])
+        print(f"generated the {args.scale} dataset in {counts['seconds']}s")
+
+    current = {"settings": settings(args), "rows": datagen.table_counts()}
+    current["scenarios"] = asyncio.run(run(args))
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, "w") as file:
+            json.dump(current, file, indent=2)
+            file.write("\n")
+        print(f"\nbaseline written to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(current, json.load(file), args.tolerance)
+        if regressions:
+            print(f"\nREGRESSION: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Cancelling a sold out stadium event. Compares the set-based path (one bulk
+UPDATE, recipients streamed with one DISTINCT join and written to the outbox
+in chunks) against the
+old one that loaded every Booking into the session and walked
+tickets -> bookings -> customer lazily to collect the emails.
+
+    python -m benchmarks.bench_event_cancel --bookings 100000 --customers 50000
+"""
+
+import argparse
+import asyncio
+import time
+import tracemalloc
+from benchmarks import common
+
+
+def legacy_cancel(event_id):
+    # the old synchronous request path, lazy relationships and all. the old handler walked the
+    # bookings after they were cancelled and so never found anyone, here the walk comes first
+    from app import database, models
+    with database.SessionLocal() as db:
+        db_event = db.query(models.Event).filter(models.Event.id == event_id).first()
+        emails = [b.customer.email for t in db_event.tickets for b in t.bookings if b.status == models.BookingStatus.CONFIRMED.value]
+        db_event.status = models.EventStatus.CANCELLED.value
+        bookings = db.query(models.Booking).join(models.Ticket).filter(models.Ticket.event_id == event_id).all()
+        for b in bookings:
+            b.status = models.BookingStatus.CANCELLED.value
+        db.commit()
+        db.refresh(db_event)
+        return [list(set(emails))] if emails else []
+
+
+async def set_based_cancel(event_id):
+    # what PUT /events/{id} does now, the notification chunks end up in the outbox
+    import json
+    from sqlalchemy import select
+    from app import crud, database, models, schemas
+    async with database.AsyncSessionLocal() as db:
+        await crud.update_event(db, event_id, schemas.EventUpdate(status="cancelled"))
+        payloads = (await db.scalars(select(models.OutboxMessage.payload))).all()
+        return [json.loads(payload)[0] for payload in payloads]
+
+
+def seed(event_id, args):
+    from app import database, models
+    with database.engine.begin() as conn:
+        ticket_ids = [row[0] for row in conn.execute(models.Ticket.__table__.select().with_only_columns(models.Ticket.id).where(models.Ticket.event_id == event_id))]
+        first_user = conn.execute(models.User.__table__.select().with_only_columns(models.User.id).where(models.User.email.like("fan-%")).order_by(models.User.id)).scalar()
+        conn.execute(models.Booking.__table__.insert(), [
+            {"customer_id": first_user + i % args.customers, "ticket_id": ticket_ids[i % len(ticket_ids)], "quantity": 1, "status": models.BookingStatus.CONFIRMED.value}
+            for i in range(args.bookings)
+        ])
+
+
+def measure(name, run, args):
+    from app import database
+    tracemalloc.start()
+    started = time.perf_counter()
+    with database.count_queries() as counter:
+        chunks = run()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    common.report(f"{name}: cancel an event with {args.bookings} bookings", [
+        ("recipients", sum(len(chunk) for chunk in chunks)),
+        ("notification tasks", len(chunks)),
+        ("SQL statements", counter.count),
+        ("time", f"{elapsed:.2f} s"),
+        ("peak python memory", f"{peak / 2**20:.1f} MiB"),
+    ])
+    return sum(len(chunk) for chunk in chunks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bookings", type=int, default=100000)
+    parser.add_argument("--customers", type=int, default=50000)
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+
+    common.scratch_database("event_cancel")
+    common.create_schema()
+    from app import database, models
+    _, event_ids = common.seed_events(2, tickets_per_event=4, quantity=0)
+    with database.engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), [
+            {"email": f"fan-{i}@bench-cancel.com", "hashed_password": "x", "role": "customer"}
+            for i in range(args.customers)
+        ])
+    for event_id in event_ids:
+        seed(event_id, args)
+
+    recipients = {measure("set-based", lambda: asyncio.run(set_based_cancel(event_ids[0])), args)}
+    if not args.skip_legacy:
+        recipients.add(measure("legacy ORM walk", lambda: legacy_cancel(event_ids[1]), args))
+    if len(recipients) != 1:
+        raise SystemExit("the two paths notified different recipients")
+
+
+if __name__ == "__main__":
+    main()
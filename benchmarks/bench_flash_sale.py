@@ -0,0 +1,105 @@
+"""
+Flash sale stress harness: hundreds of concurrent buyers hammering one hot
+ticket type through crud.create_booking. Checks that nothing is oversold
+and reports bookings/sec.
+
+    python -m benchmarks.bench_flash_sale --buyers 500 --stock 2000
+
+--legacy runs the old read-check-decrement logic for comparison.
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from benchmarks import common
+
+
+async def legacy_create_booking(db, booking, customer_id):
+    # the pre-atomic logic: read the row, compare in python, write it back
+    from sqlalchemy import select
+    from app import models
+    db_ticket = await db.scalar(select(models.Ticket).where(models.Ticket.id == booking.ticket_id).with_for_update())
+    if not db_ticket or db_ticket.quantity_available < booking.quantity:
+        return None
+    await asyncio.sleep(0) # any await here lets another buyer read the same stock
+    db_ticket.quantity_available -= booking.quantity
+    new_booking = models.Booking(customer_id=customer_id, ticket_id=booking.ticket_id, quantity=booking.quantity, status=models.BookingStatus.CONFIRMED.value)
+    db.add(new_booking)
+    await db.commit()
+    return new_booking
+
+
+async def run(args):
+    from sqlalchemy import select, func
+    from app import crud, database, models, schemas
+
+    _, event_ids = common.seed_events(1, tickets_per_event=1, quantity=args.stock)
+    async with database.AsyncSessionLocal() as db:
+        ticket_id = await db.scalar(select(models.Ticket.id).where(models.Ticket.event_id == event_ids[0]))
+
+    book = legacy_create_booking if args.legacy else crud.create_booking
+    rng = random.Random(args.seed)
+    sold_out = asyncio.Event()
+    counts = {"ok": 0, "rejected": 0, "errors": 0}
+    latencies = []
+
+    async def buyer(customer_id):
+        while not sold_out.is_set():
+            quantity = rng.randint(1, args.max_quantity)
+            started = time.perf_counter()
+            async with database.AsyncSessionLocal() as db:
+                try:
+                    result = await book(db, schemas.BookingCreate(ticket_id=ticket_id, quantity=quantity), customer_id)
+                except Exception:
+                    counts["errors"] += 1 # e.g. sqlite "database is locked" under write contention
+                    await db.rollback()
+                    continue
+            latencies.append(time.perf_counter() - started)
+            if result is None:
+                counts["rejected"] += 1
+                if quantity == 1:
+                    sold_out.set() # not even a single ticket left
+            else:
+                counts["ok"] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(buyer(1000 + i) for i in range(args.buyers)))
+    elapsed = time.perf_counter() - started
+
+    async with database.AsyncSessionLocal() as db:
+        remaining = await db.scalar(select(models.Ticket.quantity_available).where(models.Ticket.id == ticket_id))
+        sold = await db.scalar(select(func.coalesce(func.sum(models.Booking.quantity), 0)).where(models.Booking.ticket_id == ticket_id))
+
+    oversold = max(0, sold - args.stock) + max(0, -remaining)
+    consistent = sold + remaining == args.stock
+    common.report(f"{'legacy' if args.legacy else 'atomic'} create_booking, {args.buyers} buyers, stock {args.stock}", [
+        ("bookings", counts["ok"]),
+        ("rejected (not enough stock)", counts["rejected"]),
+        ("errors", counts["errors"]),
+        ("tickets sold / remaining", f"{sold} / {remaining}"),
+        ("oversold tickets", oversold),
+        ("stock consistent", consistent),
+        ("bookings/sec", f"{counts['ok'] / elapsed:.1f}"),
+        ("latency p50 / p99", f"{common.percentile(latencies, 50) * 1000:.1f} ms / {common.percentile(latencies, 99) * 1000:.1f} ms"),
+    ])
+    return oversold == 0 and consistent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--buyers", type=int, default=500, help="concurrent buyer tasks")
+    parser.add_argument("--stock", type=int, default=2000, help="tickets available in the hot ticket type")
+    parser.add_argument("--max-quantity", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--legacy", action="store_true", help="use the old read-modify-write booking logic")
+    args = parser.parse_args()
+
+    common.scratch_database("flash_sale")
+    common.create_schema()
+    if not asyncio.run(run(args)):
+        raise SystemExit("oversell detected")
+
+
+if __name__ == "__main__":
+    main()
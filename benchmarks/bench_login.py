@@ -0,0 +1,120 @@
+"""
+Login storm: many concurrent POST /token requests while a probe keeps
+hitting a cheap endpoint, to show whether bcrypt work spills over onto
+everything else. Each hasher variant is run in turn:
+
+    inline   bcrypt on the event loop (what a sync call in an async route does)
+    thread   the bounded thread executor
+    process  the bounded process pool
+
+    python -m benchmarks.bench_login --logins 200 --concurrency 50 --rounds 10
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from benchmarks import common
+
+
+async def run_variant(client, auth, variant, args):
+    if variant == "inline":
+        hasher = InlineHasher()
+    else:
+        hasher = auth.PasswordHasher(kind=variant, workers=args.workers, max_waiting=args.logins)
+    auth.hasher = hasher
+
+    pending = asyncio.Queue()
+    for i in range(args.logins):
+        pending.put_nowait(i)
+    login_latencies, probe_latencies = [], []
+    failures = 0
+    done = asyncio.Event()
+
+    async def login_worker():
+        nonlocal failures
+        while True:
+            try:
+                i = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            started = time.perf_counter()
+            response = await client.post("/token", data={"username": f"user{i % args.users}@bench-login.com", "password": "pw"})
+            login_latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                failures += 1
+
+    async def probe():
+        while not done.is_set():
+            started = time.perf_counter()
+            await client.get("/")
+            probe_latencies.append(time.perf_counter() - started)
+            await asyncio.sleep(0.01)
+
+    probe_task = asyncio.create_task(probe())
+    started = time.perf_counter()
+    await asyncio.gather(*(login_worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await probe_task
+    stats = hasher.stats.as_dict()
+    hasher.shutdown()
+
+    return [
+        ("logins/sec", f"{args.logins / elapsed:.1f}"),
+        ("failed logins", failures),
+        ("login p50 / p99", f"{common.percentile(login_latencies, 50) * 1000:.0f} ms / {common.percentile(login_latencies, 99) * 1000:.0f} ms"),
+        ("probe p50 / p99", f"{common.percentile(probe_latencies, 50) * 1000:.1f} ms / {common.percentile(probe_latencies, 99) * 1000:.1f} ms"),
+        ("max queue wait", f"{stats['queue_seconds_max'] * 1000:.0f} ms"),
+    ]
+
+
+class InlineHasher:
+    # the old behaviour, bcrypt runs right on the event loop
+    def __init__(self):
+        from app import auth
+        self.stats = auth.HashingStats()
+
+    async def run(self, func, *args):
+        self.stats.completed += 1
+        return func(*args)
+
+    def shutdown(self):
+        pass
+
+
+async def run(args):
+    import httpx
+    from app import auth, main
+
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=None)
+    for i in range(args.users):
+        response = await client.post("/register", json={"email": f"user{i}@bench-login.com", "password": "pw", "role": "customer"})
+        assert response.status_code == 200, response.text
+
+    for variant in args.variants:
+        rows = await run_variant(client, auth, variant, args)
+        common.report(f"{variant}: {args.logins} logins, concurrency {args.concurrency}, bcrypt rounds {auth.BCRYPT_ROUNDS}", rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=None, help="hashing workers (default: HASH_WORKERS)")
+    parser.add_argument("--rounds", type=int, default=None, help="bcrypt work factor (default: BCRYPT_ROUNDS)")
+    parser.add_argument("--variants", nargs="+", default=["inline", "thread", "process"], choices=["inline", "thread", "process"])
+    args = parser.parse_args()
+
+    if args.rounds is not None:
+        os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+    common.scratch_database("login")
+    common.create_schema()
+    from app import auth
+    args.workers = args.workers or auth.HASH_WORKERS
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Cost of the always-on /metrics instrumentation: the same listing and booking
+requests with METRICS=off and METRICS=on (the default), each variant in a
+process of its own since the setting is read at import. Reports
+requests/sec and latencies per variant, then how long a scrape of /metrics
+takes and what it found, checked against what the requests themselves saw
+(statement counts from X-Query-Count, confirmed bookings).
+
+    python -m benchmarks.bench_metrics --requests 2000 --concurrency 16
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from benchmarks import common
+
+VARIANTS = ("off", "on")
+
+
+def sample(text: str, name: str, **labels) -> float:
+    # the value of one series from the exposition text, 0 if it isn't there
+    wanted = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    prefix = f"{name}{{{wanted}}} " if wanted else f"{name} "
+    for line in text.splitlines():
+        if line.startswith(prefix):
+            return float(line[len(prefix):])
+    return 0.0
+
+
+async def run(args):
+    import httpx
+    from app import main
+
+    _, event_ids = common.seed_events(200, quantity=10_000)
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=None)
+    await client.post("/register", json={"email": "metrics-customer@test.com", "password": "pw", "role": "customer"})
+    login = await client.post("/token", data={"username": "metrics-customer@test.com", "password": "pw"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    tickets = [ticket["id"] for event in (await client.get("/events/", params={"limit": 100})).json() for ticket in event["tickets"]]
+    rng = random.Random(args.seed)
+    results = {}
+
+    async def scenario(name, send, requests):
+        latencies, statements = [], 0
+        left = requests
+
+        async def worker():
+            nonlocal left, statements
+            while left > 0:
+                left -= 1
+                started = time.perf_counter()
+                response = await send()
+                latencies.append(time.perf_counter() - started)
+                statements += int(response.headers["X-Query-Count"])
+                assert response.status_code == 200, (name, response.status_code, response.text)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+        results[name] = {
+            "per_sec": round(requests / elapsed, 1),
+            "p50_ms": round(common.percentile(latencies, 50) * 1000, 2),
+            "p99_ms": round(common.percentile(latencies, 99) * 1000, 2),
+            "statements": statements,
+        }
+
+    # the cache is off for the run, every listing reaches the database
+    await scenario("listing", lambda: client.get("/events/", params={"limit": 20, "skip": rng.randrange(0, 150)}), args.requests)
+    await scenario("booking", lambda: client.post("/bookings/", json={"ticket_id": rng.choice(tickets), "quantity": 1}, headers=headers), args.bookings)
+
+    scrapes = []
+    for _ in range(20):
+        started = time.perf_counter()
+        exposition = (await client.get("/metrics", headers={"Authorization": f"Bearer {os.environ['OPS_TOKEN']}"})).text
+        scrapes.append(time.perf_counter() - started)
+    results["scrape"] = {"ms": round(common.percentile(scrapes, 50) * 1000, 2), "bytes": len(exposition), "series": sum(1 for line in exposition.splitlines() if not line.startswith("#"))}
+    results["exposition"] = exposition
+    await client.aclose()
+    return results
+
+
+def child(args):
+    common.scratch_database(f"metrics-{args.child}")
+    common.create_schema()
+    print(json.dumps(asyncio.run(run(args))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000, help="listing requests per variant")
+    parser.add_argument("--bookings", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--child", choices=VARIANTS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    runs = {}
+    for name in VARIANTS:
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_metrics", *sys.argv[1:], "--child", name],
+            cwd=common.ROOT, env={**os.environ, "METRICS": name, "CACHE_BACKEND": "off", "QUERY_COUNT_HEADER": "on", "OPS_TOKEN": "bench-metrics"}, capture_output=True, text=True, check=True,
+        ).stdout.strip().splitlines()[-1]
+        runs[name] = json.loads(output)
+
+    for scenario in ("listing", "booking"):
+        off, on = runs["off"][scenario], runs["on"][scenario]
+        common.report(f"{scenario}: METRICS=off against METRICS=on, concurrency {args.concurrency}", [
+            (f"METRICS={name}", f"{run[scenario]['per_sec']:8.1f} req/s  p50 {run[scenario]['p50_ms']:6.2f} ms  p99 {run[scenario]['p99_ms']:6.2f} ms")
+            for name, run in runs.items()
+        ] + [("overhead", f"{1 - on['per_sec'] / off['per_sec']:+.1%} req/s  {on['p50_ms'] / off['p50_ms'] - 1:+.1%} p50")])
+
+    on = runs["on"]
+    exposition = on["exposition"]
+    listed = sample(exposition, "http_request_sql_statements_sum", method="GET", route="/events/")
+    booked = sample(exposition, "bookings_total", kind="single", outcome="confirmed")
+    common.report("the METRICS=on scrape", [
+        ("GET /metrics p50", f"{on['scrape']['ms']:.2f} ms, {on['scrape']['bytes']} bytes, {on['scrape']['series']} series"),
+        ("GET /events/ requests", f"{sample(exposition, 'http_requests_total', method='GET', route='/events/', status='200'):.0f}"),
+        ("GET /events/ SQL statements", f"{listed:.0f} (X-Query-Count total {on['listing']['statements']})"),
+        ("GET /events/ SQL seconds", f"{sample(exposition, 'http_request_sql_seconds_sum', method='GET', route='/events/'):.3f}s of {sample(exposition, 'http_request_duration_seconds_sum', method='GET', route='/events/'):.3f}s"),
+        ("confirmed bookings", f"{booked:.0f} of {args.bookings}"),
+        ("pool checkouts", f"{sample(exposition, 'db_pool_checkout_seconds_count'):.0f}, {sample(exposition, 'db_pool_checkout_seconds_sum') * 1000:.1f} ms waiting"),
+    ])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Broker traffic of the mass mailings, measured on Celery's in-memory broker:
+messages published, bytes on the wire and the largest single message for
+
+    event update    one notify_event_update carrying every recipient vs tasks.event_update_messages
+    waitlist        one send_booking_confirmation per user vs tasks.confirmation_messages
+
+the chunked messages are published as one group, the way the outbox dispatcher sends a batch
+
+    python -m benchmarks.bench_notifications --recipients 50000 --confirmations 2000 --chunk-size 500
+"""
+
+import argparse
+import json
+import os
+import time
+from benchmarks import common
+
+
+class BrokerMeter:
+    # counts what reaches the in-memory transport, i.e. one entry per broker round trip
+    def __init__(self):
+        self.sizes = []
+
+    def install(self):
+        from kombu.transport import memory
+        original = memory.Channel._put
+        meter = self
+
+        def _put(channel, queue, message, **kwargs):
+            meter.sizes.append(len(json.dumps(message)))
+            return original(channel, queue, message, **kwargs)
+
+        memory.Channel._put = _put
+
+    def measure(self, send):
+        self.sizes = []
+        started = time.perf_counter()
+        send()
+        elapsed = time.perf_counter() - started
+        return [
+            ("messages published", len(self.sizes)),
+            ("total bytes", f"{sum(self.sizes) / 1024:.1f} KiB"),
+            ("largest message", f"{max(self.sizes) / 1024:.1f} KiB"),
+            ("publish time", f"{elapsed * 1000:.1f} ms"),
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recipients", type=int, default=50000, help="customers notified about an event update")
+    parser.add_argument("--confirmations", type=int, default=2000, help="waitlist users confirmed by one cancellation")
+    parser.add_argument("--chunk-size", type=int, default=None, help="default: NOTIFY_CHUNK_SIZE")
+    args = parser.parse_args()
+
+    os.environ["CELERY_BROKER_URL"] = "memory://"
+    from celery import group
+    from app import tasks
+    chunk_size = args.chunk_size or tasks.NOTIFY_CHUNK_SIZE
+    meter = BrokerMeter()
+    meter.install()
+
+    emails = [f"fan-{i}@example.com" for i in range(args.recipients)]
+    title = "Update for Stadium Night"
+    common.report(f"event update, {args.recipients} recipients: one message", meter.measure(lambda: tasks.notify_event_update.delay(emails, title)))
+    common.report(f"event update, {args.recipients} recipients: chunks of {chunk_size}", meter.measure(lambda: group(tasks.event_update_messages(emails, title, chunk_size)).apply_async()))
+
+    messages = [(f"fan-{i}@example.com", f"CONFIRMED from Waitlist: Stadium Night (Quantity: {i % 4 + 1})") for i in range(args.confirmations)]
+    def one_by_one():
+        for email, text in messages:
+            tasks.send_booking_confirmation.delay(email, text)
+    common.report(f"waitlist, {args.confirmations} confirmations: one message each", meter.measure(one_by_one))
+    common.report(f"waitlist, {args.confirmations} confirmations: batches of {chunk_size}", meter.measure(lambda: group(tasks.confirmation_messages(messages, chunk_size)).apply_async()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Booking latency with a slow broker. Every publish to Celery's in-memory
+broker is delayed by --broker-delay seconds, then customers arrive at a
+steady --rate and book tickets either
+
+    inline   committing and then calling .delay() from the request (the old handlers)
+    outbox   writing the confirmation to the outbox table in the booking's transaction,
+             with the dispatcher draining it in the background
+
+    python -m benchmarks.bench_outbox --bookings 400 --rate 40 --broker-delay 0.2
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from benchmarks import common
+
+
+def slow_down_broker(delay, published):
+    from kombu.transport import memory
+    original = memory.Channel._put
+
+    def _put(channel, queue, message, **kwargs):
+        time.sleep(delay)
+        published.append(time.perf_counter())
+        return original(channel, queue, message, **kwargs)
+
+    memory.Channel._put = _put
+
+
+async def run_mode(mode, ticket_id, args, published):
+    from starlette.concurrency import run_in_threadpool
+    from app import crud, database, outbox, schemas, tasks
+
+    latencies = []
+    counts = {"ok": 0, "errors": 0}
+
+    async def book(i):
+        email = f"buyer-{i}@bench-outbox.com"
+        async with database.AsyncSessionLocal() as db:
+            if mode == "inline":
+                booking = await crud.create_booking(db, schemas.BookingCreate(ticket_id=ticket_id, quantity=1), 1000 + i)
+                await run_in_threadpool(tasks.send_booking_confirmation.delay, email, f"CONFIRMED: {booking.ticket.event.title}")
+            else:
+                await crud.create_booking(db, schemas.BookingCreate(ticket_id=ticket_id, quantity=1), 1000 + i, notify_email=email)
+
+    async def customer(i):
+        # open loop, customer i shows up at i / rate seconds whatever happened to the others
+        await asyncio.sleep(i / args.rate)
+        started = time.perf_counter()
+        try:
+            await book(i)
+            counts["ok"] += 1
+        except Exception:
+            counts["errors"] += 1 # e.g. sqlite "database is locked" under write contention
+        latencies.append(time.perf_counter() - started)
+
+    published.clear()
+    stop = asyncio.Event()
+    dispatcher = asyncio.create_task(outbox.run_dispatcher(stop, poll_seconds=0.05)) if mode == "outbox" else None
+    started = time.perf_counter()
+    await asyncio.gather(*(customer(i) for i in range(args.bookings)))
+    elapsed = time.perf_counter() - started
+
+    rows = [
+        ("bookings/sec", f"{counts['ok'] / elapsed:.1f}"),
+        ("errors", counts["errors"]),
+        ("booking p50 / p99", f"{common.percentile(latencies, 50) * 1000:.0f} ms / {common.percentile(latencies, 99) * 1000:.0f} ms"),
+    ]
+    if dispatcher:
+        # waiting for the dispatcher to catch up with the backlog
+        while len(published) < counts["ok"]:
+            await asyncio.sleep(0.05)
+        stop.set()
+        await dispatcher
+        rows.append(("confirmations published", len(published)))
+        rows.append(("last confirmation after the last booking", f"{(max(published) - started - elapsed) * 1000:.0f} ms"))
+    else:
+        rows.append(("confirmations published", len(published)))
+    common.report(f"{mode}: {args.bookings} bookings at {args.rate:g}/s, broker delay {args.broker_delay * 1000:.0f} ms", rows)
+
+
+async def run(args, published):
+    from sqlalchemy import select
+    from app import database, models
+
+    _, event_ids = common.seed_events(2, tickets_per_event=1, quantity=args.bookings)
+    for mode, event_id in zip(("inline", "outbox"), event_ids):
+        async with database.AsyncSessionLocal() as db:
+            ticket_id = await db.scalar(select(models.Ticket.id).where(models.Ticket.event_id == event_id))
+        await run_mode(mode, ticket_id, args, published)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bookings", type=int, default=400)
+    parser.add_argument("--rate", type=float, default=40, help="bookings started per second")
+    parser.add_argument("--broker-delay", type=float, default=0.2, help="seconds added to every publish")
+    args = parser.parse_args()
+
+    os.environ["CELERY_BROKER_URL"] = "memory://"
+    common.scratch_database("outbox")
+    common.create_schema()
+    published = []
+    slow_down_broker(args.broker_delay, published)
+    asyncio.run(run(args, published))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Keyword search over a large catalogue: the same words looked up with the
+ilike scan over title, description and venue (what a client had to do before)
+and with the full-text index behind /events/search?q=
+
+    python -m benchmarks.bench_search --events 1000000 --queries 200
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+from benchmarks import common
+
+
+# a few words every other event uses and a long tail of rarer ones (artists, towns, themes)
+COMMON_WORDS = [
+    "jazz", "rock", "opera", "comedy", "cooking", "yoga", "poetry", "techno", "salsa", "chess",
+    "marathon", "wine", "cinema", "ballet", "gospel", "hackathon", "pottery", "karaoke", "magic", "drums",
+]
+SYLLABLES = ["ka", "lo", "mi", "ran", "te", "vo", "sul", "bri", "no", "da", "fen", "gor"]
+RARE_WORDS = [a + b + c + d for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES for d in SYLLABLES]
+PLACES = ["Club", "Arena", "Hall", "Garden", "Theatre", "Warehouse", "Rooftop", "Library"]
+
+
+def seed_catalogue(n_events, chunk_size=20000):
+    # synthetic titles, venues and descriptions from a small vocabulary, inserted in chunks
+    from app import database, models
+    rng = random.Random(42)
+    start = datetime.now() + timedelta(days=1)
+    with database.engine.begin() as conn:
+        organizer_id = conn.execute(models.User.__table__.insert().values(email="bench-organizer@test.com", hashed_password="x", role="organizer")).inserted_primary_key[0]
+        for offset in range(0, n_events, chunk_size):
+            conn.execute(models.Event.__table__.insert(), [
+                {
+                    "title": f"{rng.choice(RARE_WORDS).title()} {rng.choice(COMMON_WORDS).title()} {rng.choice(['Night', 'Session', 'Festival'])}",
+                    "description": " ".join(rng.choices(COMMON_WORDS, k=2) + rng.choices(RARE_WORDS, k=6)),
+                    "date": start + timedelta(minutes=i),
+                    "venue": f"{rng.choice(RARE_WORDS).title()} {rng.choice(PLACES)}",
+                    "organizer_id": organizer_id,
+                    "status": models.EventStatus.ACTIVE.value,
+                    "total_remaining": 100,
+                    "is_sold_out": False,
+                }
+                for i in range(offset, min(n_events, offset + chunk_size))
+            ])
+
+
+def scan_query(word, limit):
+    # the contains-everywhere filter the search used to need, in listing order
+    from sqlalchemy import or_, select
+    from app import models
+    pattern = f"%{word}%"
+    return (
+        select(models.Event)
+        .where(models.Event.status == models.EventStatus.ACTIVE.value, models.Event.deleted_at == None, models.Event.date >= datetime.now())
+        .where(or_(models.Event.title.ilike(pattern), models.Event.description.ilike(pattern), models.Event.venue.ilike(pattern)))
+        .order_by(models.Event.is_sold_out, models.Event.date, models.Event.id)
+        .limit(limit)
+    )
+
+
+async def run(args):
+    from app import crud, database
+    rng = random.Random(7)
+    # as typed into a search box: a name, a name and a genre, a name still being typed
+    specific = [rng.choice([rng.choice(RARE_WORDS), f"{rng.choice(RARE_WORDS)} {rng.choice(COMMON_WORDS)}", rng.choice(RARE_WORDS)[:7]]) for _ in range(args.queries)]
+    # a bare genre matches a large share of the catalogue, the scan's best case
+    broad = [rng.choice(COMMON_WORDS) for _ in range(args.queries)]
+
+    async def measure(label, terms, search):
+        latencies, hits = [], 0
+        async with database.AsyncSessionLocal() as db:
+            for term in terms:
+                started = time.perf_counter()
+                hits += len(await search(db, term))
+                latencies.append(time.perf_counter() - started)
+        common.report(f"{label}: {len(terms)} queries over {args.events} events", [
+            ("queries/sec", f"{len(latencies) / sum(latencies):.1f}"),
+            ("p50 / p99", f"{common.percentile(latencies, 50) * 1000:.1f} ms / {common.percentile(latencies, 99) * 1000:.1f} ms"),
+            ("rows returned", hits),
+        ])
+
+    async def scan(db, term):
+        # every word has to appear somewhere, like the full-text query
+        query = scan_query(term.split()[0], args.limit)
+        for word in term.split()[1:]:
+            query = query.where(scan_query(word, args.limit).whereclause)
+        return (await db.scalars(query)).all()
+
+    indexed = lambda db, term: crud.search_events(db, text=term, limit=args.limit)
+    await measure("specific terms, ilike scan", specific, scan)
+    await measure("specific terms, full-text index", specific, indexed)
+    await measure("broad terms, ilike scan", broad, scan)
+    await measure("broad terms, full-text index", broad, indexed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=20, help="page size")
+    args = parser.parse_args()
+
+    common.scratch_database("search")
+    common.create_schema()
+    started = time.perf_counter()
+    seed_catalogue(args.events)
+    print(f"seeded {args.events} events (index maintained by the triggers) in {time.perf_counter() - started:.1f} s")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Events serialized per second for a 100-event listing page with its tickets,
+the response_model path against the FAST_JSON path (app/serialization.py):
+
+    build    a cache miss, loading the page and turning it into JSON data
+             (ORM objects + from_attributes vs row tuples + a TypeAdapter)
+    encode   a cache hit, the cached JSON data to response bytes
+             (FastAPI's response_model validation + encoding vs to_json)
+    request  GET /events/ end to end, in process, cache on
+
+Every pair is checked to produce the same bytes.
+
+    python -m benchmarks.bench_serialization --page 100 --rounds 200
+"""
+
+import argparse
+import asyncio
+import time
+from benchmarks import common
+
+
+def rate(label, events, seconds):
+    return (label, f"{events / seconds:,.0f} events/sec")
+
+
+async def run(args):
+    import httpx
+    from fastapi.routing import APIRoute
+    from app import crud, database, main, serialization
+
+    common.seed_events(args.page * 2, tickets_per_event=3)
+    adapter = serialization.EVENTS
+    events_served = args.page * args.rounds
+
+    # build
+    async def build(as_rows):
+        async with database.AsyncSessionLocal() as db:
+            started = time.perf_counter()
+            for _ in range(args.rounds):
+                page = adapter.dump_python(adapter.validate_python(await crud.get_events(db, limit=args.page, as_rows=as_rows), from_attributes=True), mode="json")
+                db.expunge_all()
+            return time.perf_counter() - started, page
+
+    orm_seconds, orm_page = await build(False)
+    rows_seconds, rows_page = await build(True)
+    assert serialization.dumps(orm_page) == serialization.dumps(rows_page)
+    common.report(f"build: {args.rounds} pages of {args.page} events", [
+        rate("ORM objects", events_served, orm_seconds),
+        rate("row tuples", events_served, rows_seconds),
+    ])
+
+    # encode, the field below is what FastAPI validates and encodes a GET /events/ result with
+    field = next(route for route in main.app.routes if isinstance(route, APIRoute) and route.path == "/events/").response_field
+    started = time.perf_counter()
+    for _ in range(args.rounds):
+        value, _ = field.validate(rows_page, {}, loc=("response",))
+        legacy = field.serialize_json(value, by_alias=True)
+    legacy_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    for _ in range(args.rounds):
+        fast = serialization.dumps(rows_page)
+    fast_seconds = time.perf_counter() - started
+    assert legacy == fast
+    common.report(f"encode: {args.rounds} cached pages of {args.page} events ({len(fast) / 1024:.0f} KiB)", [
+        rate("response_model", events_served, legacy_seconds),
+        rate("FAST_JSON", events_served, fast_seconds),
+    ])
+
+    # request
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench")
+    rows, bodies = [], []
+    for fast_json in (False, True):
+        serialization.FAST_JSON = fast_json
+        await client.get("/events/", params={"limit": args.page}) # warming the cache
+        latencies = []
+        for _ in range(args.rounds):
+            started = time.perf_counter()
+            response = await client.get("/events/", params={"limit": args.page})
+            latencies.append(time.perf_counter() - started)
+        bodies.append(response.content)
+        label = "FAST_JSON" if fast_json else "response_model"
+        rows.append(rate(label, events_served, sum(latencies)))
+        rows.append((f"{label} p50", f"{common.percentile(latencies, 50) * 1000:.2f} ms"))
+    assert bodies[0] == bodies[1]
+    common.report(f"request: {args.rounds} x GET /events/?limit={args.page}, cache hits", rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page", type=int, default=100, help="events per page")
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    common.scratch_database("serialization")
+    common.create_schema()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
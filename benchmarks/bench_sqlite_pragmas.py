@@ -0,0 +1,125 @@
+"""
+Readers and writers sharing one SQLite file, with the connection settings of
+app/database.py against SQLite's own defaults:
+
+    defaults   rollback journal, synchronous=FULL, 2 MB page cache, no mmap
+    tuned      WAL, synchronous=NORMAL, busy_timeout, 64 MB cache, mmap (the app's defaults)
+
+--readers threads read listing pages (the GET /events/ query) while
+--writers threads book tickets (the booking's UPDATE and INSERT in one
+transaction), for --duration seconds. Both go through app.database.engine,
+its pool and the pragmas it sets on connect, and skip the HTTP layer so the
+database is what gets measured. Each variant runs in a process of its own,
+the settings are read when app.database is imported.
+
+    python -m benchmarks.bench_sqlite_pragmas --readers 8 --writers 4 --duration 10
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from benchmarks import common, datagen
+
+VARIANTS = {
+    "defaults": {"SQLITE_JOURNAL_MODE": "DELETE", "SQLITE_SYNCHRONOUS": "FULL", "SQLITE_CACHE_SIZE_KIB": "2000", "SQLITE_MMAP_SIZE": "0"},
+    "tuned": {},
+}
+
+
+def load(args):
+    from datetime import datetime
+    from sqlalchemy import insert, select, update
+    from app import database, models, pagination
+
+    with database.engine.connect() as conn:
+        customers = conn.scalars(select(models.User.id).where(models.User.role == "customer")).all()
+        tickets = conn.scalars(select(models.Ticket.id).where(models.Ticket.quantity_available >= 10)).all()
+    listing = select(models.Event.__table__).where(models.Event.status == models.EventStatus.ACTIVE.value, models.Event.deleted_at == None, models.Event.date >= datetime.now())
+    reads, writes = [], []
+    errors = {"read": 0, "write": 0}
+    stop_at = time.perf_counter() + args.duration
+
+    def reader(seed):
+        rng = random.Random(seed)
+        while time.perf_counter() < stop_at:
+            started = time.perf_counter()
+            try:
+                with database.engine.connect() as conn:
+                    conn.execute(pagination.EVENT_LISTING.page(listing, skip=rng.randrange(0, 1000), limit=20)).all()
+                reads.append(time.perf_counter() - started)
+            except Exception:
+                errors["read"] += 1 # "database is locked" once busy_timeout runs out
+
+    def writer(seed):
+        rng = random.Random(seed)
+        while time.perf_counter() < stop_at:
+            ticket_id = rng.choice(tickets)
+            started = time.perf_counter()
+            try:
+                with database.engine.begin() as conn:
+                    conn.execute(update(models.Ticket).where(models.Ticket.id == ticket_id, models.Ticket.quantity_available >= 1).values(quantity_available=models.Ticket.quantity_available - 1))
+                    conn.execute(insert(models.Booking).values(customer_id=rng.choice(customers), ticket_id=ticket_id, quantity=1, status=models.BookingStatus.CONFIRMED.value))
+                writes.append(time.perf_counter() - started)
+            except Exception:
+                errors["write"] += 1
+
+    threads = [threading.Thread(target=reader, args=(f"r{i}",)) for i in range(args.readers)]
+    threads += [threading.Thread(target=writer, args=(f"w{i}",)) for i in range(args.writers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {
+        "reads/sec": round(len(reads) / elapsed, 1),
+        "read p50 / p99": f"{common.percentile(reads, 50) * 1000:.2f} ms / {common.percentile(reads, 99) * 1000:.2f} ms",
+        "bookings/sec": round(len(writes) / elapsed, 1),
+        "booking p50 / p99": f"{common.percentile(writes, 50) * 1000:.2f} ms / {common.percentile(writes, 99) * 1000:.2f} ms",
+        "failed reads / bookings": f"{errors['read']} / {errors['write']}",
+    }
+
+
+def child(args):
+    # one variant, the results go back to the parent as json on the last line
+    common.scratch_database(f"pragmas-{args.child}")
+    common.create_schema()
+    datagen.generate(seed=args.seed, **datagen.SCALES[args.scale])
+    from sqlalchemy import text
+    from app import database
+    with database.engine.connect() as conn:
+        settings = {"journal_mode": conn.scalar(text("PRAGMA journal_mode")), "synchronous": conn.scalar(text("PRAGMA synchronous"))}
+    print(json.dumps({"settings": settings, "results": load(args)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10, help="seconds of load per variant")
+    parser.add_argument("--scale", choices=datagen.SCALES, default="small")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--child", choices=VARIANTS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    for name, overrides in VARIANTS.items():
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_sqlite_pragmas", *sys.argv[1:], "--child", name],
+            cwd=common.ROOT, env={**os.environ, **overrides}, capture_output=True, text=True, check=True,
+        ).stdout.strip().splitlines()[-1]
+        run = json.loads(output)
+        title = f"{name} ({', '.join(f'{key}={value}' for key, value in run['settings'].items())}): {args.readers} readers, {args.writers} writers, {args.duration:g}s"
+        common.report(title, list(run["results"].items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Cancelling a large booking against a long waitlist. Times crud.cancel_booking
+(one ordered pass, bulk insert/delete) against the old loop that re-read the
+whole waitlist and flushed after every reassigned entry.
+
+    python -m benchmarks.bench_waitlist --waitlist 10000 --cancel-quantity 200
+
+--skip-legacy leaves the old loop out, it gets slow quickly on long waitlists.
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+from benchmarks import common
+
+
+async def legacy_cancel_booking(db, booking_id, user_id):
+    # the old reassignment loop, minus its DEBUG prints
+    from sqlalchemy import select, update
+    from sqlalchemy.orm import selectinload
+    from app import crud, models
+    booking = await db.scalar(select(models.Booking).options(selectinload(models.Booking.ticket).selectinload(models.Ticket.event)).where(models.Booking.id == booking_id, models.Booking.customer_id == user_id).with_for_update())
+    booking.status = models.BookingStatus.CANCELLED.value
+    ticket_id = booking.ticket_id
+    available_to_reassign = booking.quantity
+    fulfilled_users = []
+
+    while available_to_reassign > 0:
+        # the old loop loaded the whole queue every round and never used it, kept for its cost
+        (await db.scalars(select(models.Waitlist).where(models.Waitlist.ticket_id == ticket_id))).all()
+        waitlist_entry = await db.scalar(select(models.Waitlist).options(selectinload(models.Waitlist.user)).where(models.Waitlist.ticket_id == ticket_id, models.Waitlist.quantity <= available_to_reassign).order_by(models.Waitlist.created_at.asc()).with_for_update())
+        if not waitlist_entry:
+            break
+        db.add(models.Booking(customer_id=waitlist_entry.user_id, ticket_id=ticket_id, quantity=waitlist_entry.quantity, status=models.BookingStatus.CONFIRMED.value))
+        fulfilled_users.append({"email": waitlist_entry.user.email, "event_title": booking.ticket.event.title, "quantity": waitlist_entry.quantity})
+        available_to_reassign -= waitlist_entry.quantity
+        await db.delete(waitlist_entry)
+        await db.flush()
+
+    if available_to_reassign > 0:
+        await db.execute(update(models.Ticket).where(models.Ticket.id == ticket_id).values(quantity_available=models.Ticket.quantity_available + available_to_reassign).execution_options(synchronize_session=False))
+        await crud.adjust_event_inventory(db, ticket_id, available_to_reassign)
+    await db.commit()
+    return booking, fulfilled_users
+
+
+def seed_waitlist(event_id, args, rng):
+    # a sold out ticket, one customer holding the booking to cancel and a long queue behind it
+    from app import database, models
+    started = datetime.now() - timedelta(days=1)
+    with database.engine.begin() as conn:
+        ticket_id = conn.execute(models.Ticket.__table__.insert().values(event_id=event_id, ticket_type="Hot", price=10.0, quantity_available=0)).inserted_primary_key[0]
+        first_user = conn.execute(models.User.__table__.insert().values(email=f"holder-{ticket_id}@bench-waitlist.com", hashed_password="x", role="customer")).inserted_primary_key[0]
+        booking_id = conn.execute(models.Booking.__table__.insert().values(customer_id=first_user, ticket_id=ticket_id, quantity=args.cancel_quantity, status=models.BookingStatus.CONFIRMED.value)).inserted_primary_key[0]
+        conn.execute(models.User.__table__.insert(), [
+            {"email": f"queue-{ticket_id}-{i}@bench-waitlist.com", "hashed_password": "x", "role": "customer"}
+            for i in range(args.waitlist)
+        ])
+        user_ids = [row[0] for row in conn.execute(models.User.__table__.select().with_only_columns(models.User.id).where(models.User.email.like(f"queue-{ticket_id}-%")))]
+        conn.execute(models.Waitlist.__table__.insert(), [
+            {"event_id": event_id, "user_id": user_id, "ticket_id": ticket_id, "quantity": rng.randint(1, args.max_quantity), "created_at": started + timedelta(seconds=i)}
+            for i, user_id in enumerate(user_ids)
+        ])
+    return booking_id, first_user
+
+
+async def run(args):
+    from app import crud, database
+
+    _, event_ids = common.seed_events(1, tickets_per_event=0)
+    modes = [("ordered pass", crud.cancel_booking)]
+    if not args.skip_legacy:
+        modes.append(("legacy loop", legacy_cancel_booking))
+
+    results = {}
+    for name, cancel in modes:
+        booking_id, user_id = seed_waitlist(event_ids[0], args, random.Random(args.seed))
+        async with database.AsyncSessionLocal() as db:
+            started = time.perf_counter()
+            with database.count_queries() as counter:
+                _, fulfilled = await cancel(db, booking_id, user_id)
+            elapsed = time.perf_counter() - started
+        results[name] = [len(fulfilled), sum(user["quantity"] for user in fulfilled)]
+        common.report(f"{name}: cancel {args.cancel_quantity} tickets, waitlist of {args.waitlist}", [
+            ("entries fulfilled", len(fulfilled)),
+            ("tickets reassigned", sum(user["quantity"] for user in fulfilled)),
+            ("SQL statements", counter.count),
+            ("time", f"{elapsed * 1000:.1f} ms"),
+        ])
+    return len({tuple(result) for result in results.values()}) == 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--waitlist", type=int, default=10000, help="entries queued for the ticket")
+    parser.add_argument("--cancel-quantity", type=int, default=200, help="tickets freed by the cancellation")
+    parser.add_argument("--max-quantity", type=int, default=3, help="tickets asked for per waitlist entry")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+
+    common.scratch_database("waitlist")
+    common.create_schema()
+    if not asyncio.run(run(args)):
+        raise SystemExit("the two implementations fulfilled different entries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+N+1 guard for the listing endpoints. Each listing must issue the same
+number of SQL statements whatever the page size; a lazy relationship
+sneaking back into serialization makes the count grow with the page and
+this script exits non-zero, so it can run in CI.
+
+It also checks the conditional GETs of the catalogue listings: a matching
+If-None-Match has to be a 304 issuing no statement at all, and a sale has
+to change the ETag.
+
+    python -m benchmarks.check_query_counts
+"""
+
+import asyncio
+import os
+import sys
+from benchmarks import common
+
+SMALL, LARGE = 2, 40
+
+
+async def run():
+    import httpx
+    from app import database, main, models
+
+    common.seed_events(LARGE * 2)
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench")
+
+    async def login(email, role):
+        await client.post("/register", json={"email": email, "password": "pw", "role": role})
+        response = await client.post("/token", data={"username": email, "password": "pw"})
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    organizer = await login("check-organizer@test.com", "organizer")
+    customer = await login("check-customer@test.com", "customer")
+
+    # the seeded events belong to the new organizer, and the customer holds plenty of bookings
+    with database.engine.begin() as conn:
+        new_organizer_id = conn.execute(models.User.__table__.select().with_only_columns(models.User.id).where(models.User.email == "check-organizer@test.com")).scalar()
+        customer_id = conn.execute(models.User.__table__.select().with_only_columns(models.User.id).where(models.User.email == "check-customer@test.com")).scalar()
+        conn.execute(models.Event.__table__.update().values(organizer_id=new_organizer_id))
+        ticket_ids = [row[0] for row in conn.execute(models.Ticket.__table__.select().with_only_columns(models.Ticket.id))]
+        conn.execute(models.Booking.__table__.insert(), [
+            {"customer_id": customer_id, "ticket_id": ticket_id, "quantity": 1, "status": models.BookingStatus.CONFIRMED.value}
+            for ticket_id in ticket_ids[:LARGE * 2]
+        ])
+
+    endpoints = [
+        ("/events/", {}, None),
+        ("/events/search", {}, None),
+        ("/organizer/events", {}, organizer),
+        ("/bookings/my", {}, customer),
+    ]
+    failures = []
+    rows = []
+    for path, params, headers in endpoints:
+        # an authenticated client's first request also reads its token version, once per
+        # TOKEN_VERSION_TTL_SECONDS, that one is not the listing's
+        if headers:
+            await client.get(path, params={**params, "limit": 1}, headers=headers)
+        counts = []
+        for limit in (SMALL, LARGE):
+            response = await client.get(path, params={**params, "limit": limit}, headers=headers)
+            assert response.status_code == 200, (path, response.status_code, response.text)
+            assert len(response.json()) == limit, (path, len(response.json()))
+            counts.append(int(response.headers["X-Query-Count"]))
+        rows.append((path, f"{counts[0]} statements for {SMALL} rows, {counts[1]} for {LARGE} rows"))
+        if counts[0] != counts[1]:
+            failures.append(f"{path} (N+1)")
+
+    common.report("SQL statements per listing page", rows)
+
+    conditional = [("/events/", None), ("/events/search", None), ("/organizer/events", organizer)]
+    etags, rows = {}, []
+    for path, headers in conditional:
+        first = await client.get(path, params={"limit": SMALL}, headers=headers)
+        etags[path] = first.headers.get("ETag")
+        again = await client.get(path, params={"limit": SMALL}, headers={**(headers or {}), "If-None-Match": etags[path]})
+        statements = int(again.headers["X-Query-Count"])
+        rows.append((f"{path} unchanged", f"{again.status_code}, {statements} statements, {len(again.content)} bytes"))
+        if not etags[path] or again.status_code != 304 or statements != 0:
+            failures.append(f"{path} (If-None-Match)")
+
+    # a sale moves the inventory version, every listing shows the new quantity
+    sold = await client.post("/bookings/", json={"ticket_id": ticket_ids[0], "quantity": 1}, headers=customer)
+    assert sold.status_code == 200, sold.text
+    for path, headers in conditional:
+        after_sale = await client.get(path, params={"limit": SMALL}, headers={**(headers or {}), "If-None-Match": etags[path]})
+        rows.append((f"{path} after a sale", f"{after_sale.status_code}, {after_sale.headers['X-Query-Count']} statements"))
+        if after_sale.status_code != 200 or after_sale.headers.get("ETag") == etags[path]:
+            failures.append(f"{path} (stale ETag)")
+
+    common.report("conditional GET", rows)
+    return failures
+
+
+def main():
+    common.scratch_database("query_counts")
+    os.environ.update(QUERY_COUNT_HEADER="on", TOKEN_VERSION_TTL_SECONDS="3600")
+    common.create_schema()
+    failures = asyncio.run(run())
+    if failures:
+        print(f"\nregression on {', '.join(failures)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
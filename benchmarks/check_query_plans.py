@@ -0,0 +1,96 @@
+"""
+Index guard for the search filters. Runs crud.search_events with each
+filter combination, asks SQLite for the plan of the statement it issued
+(EXPLAIN QUERY PLAN) and exits non-zero if the events table is scanned
+instead of searched through one of its indexes, so it can run in CI. The
+attendee export's query is checked too: bookings through their index, no sort.
+
+    python -m benchmarks.check_query_plans
+"""
+
+import asyncio
+import sys
+from datetime import datetime, timedelta
+from benchmarks import common
+
+
+# filters passed to crud.search_events and the index each one has to use. time slots and
+# weekdays match a good share of all events, walking the listing index until the page is
+# full beats sorting every match, so they stay on it and are checked inside the index
+CASES = [
+    ({}, "ix_events_listing"),
+    ({"date": "day"}, "ix_events_start_day"),
+    ({"date": "day", "time_slot": "evening"}, "ix_events_start_day"),
+    ({"time_slot": "morning"}, "ix_events_listing"),
+    ({"time_slot": "night"}, "ix_events_listing"),
+    ({"is_weekend": True}, "ix_events_listing"),
+    ({"is_weekend": False, "time_slot": "afternoon"}, "ix_events_listing"),
+]
+
+
+async def run():
+    from sqlalchemy import event
+    from app import crud, database, models
+
+    common.seed_events(2000)
+    # the planner weighs the indexes by their statistics, the migration gathers them too
+    with database.engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), [{"email": f"plan-{i}@test.com", "hashed_password": "x", "role": "customer"} for i in range(500)])
+        conn.execute(models.Booking.__table__.insert(), [{"customer_id": 2 + i % 500, "ticket_id": 1 + i % 40, "quantity": 1, "status": "confirmed"} for i in range(5000)])
+        conn.exec_driver_sql("ANALYZE")
+    day = datetime.now() + timedelta(days=3)
+
+    # the events query is the first statement search_events issues, the tickets come after it
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+    event.listen(database.async_engine.sync_engine, "before_cursor_execute", record)
+
+    failures, rows = [], []
+    for filters, index in CASES:
+        kwargs = {**filters, "date": day} if "date" in filters else filters
+        statements.clear()
+        async with database.AsyncSessionLocal() as db:
+            await crud.search_events(db, limit=20, **kwargs)
+        statement, parameters = statements[0]
+        with database.engine.connect() as conn:
+            plan = [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+        events_step = next((step for step in plan if step.startswith(("SCAN events", "SEARCH events"))), "")
+        # a function applied to events.date is evaluated row by row, whatever index gets picked
+        ok = events_step.startswith("SEARCH events") and f"INDEX {index} " in events_step and "strftime(" not in statement and "date(events.date)" not in statement
+        rows.append((", ".join(f"{key}={value}" for key, value in filters.items()) or "(no filters)", events_step or " / ".join(plan)))
+        if not ok:
+            failures.append(f"{filters} expected {index}")
+
+    # the attendee export streams its rows in index order, a sort would read them all first
+    statements.clear()
+    async with database.AsyncSessionLocal() as db:
+        async for _ in crud.iter_event_attendees(db, 1):
+            pass
+    statement, parameters = statements[0]
+    with database.engine.connect() as conn:
+        plan = [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+    ok = (
+        any(step.startswith("SEARCH bookings USING INDEX ix_bookings_ticket_status ") for step in plan)
+        and any(step.startswith("SEARCH users USING INTEGER PRIMARY KEY") for step in plan)
+        and not any("TEMP B-TREE" in step for step in plan)
+    )
+    rows.append(("attendee export", " / ".join(plan)))
+    if not ok:
+        failures.append("attendee export expected ix_bookings_ticket_status and users by id, without a sort")
+
+    common.report("search_events and attendee export plans", rows)
+    return failures
+
+
+def main():
+    common.scratch_database("query_plans")
+    common.create_schema()
+    failures = asyncio.run(run())
+    if failures:
+        print("\nindex regression: " + "; ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
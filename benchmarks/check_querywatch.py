@@ -0,0 +1,156 @@
+"""
+The N+1 / slow-query detector (app/querywatch.py) in strict mode. Checks that
+
+    the fingerprints fold literals, parameters and IN / VALUES lists
+    the listings, a booking and a cancellation run clean
+    a route loading tickets event by event is reported as N+1, with the line that does it
+    a slow statement is reported
+    strict mode raises QueryWatchError for both, the findings land in GET /querywatch/stats
+    a bulk import of many batches is not mistaken for N+1
+    with QUERY_WATCH_SAMPLE=0 nothing is inspected
+
+and exits non-zero otherwise. It also reports what an inspected request
+costs next to an uninspected one.
+
+    python -m benchmarks.check_querywatch
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+from benchmarks import common
+
+SLOW_MS = 50
+
+
+def check_fingerprints(check):
+    from app import querywatch
+    cases = [
+        ("SELECT * FROM tickets WHERE tickets.id IN (?, ?, ?) AND price > 10", "SELECT * FROM tickets WHERE tickets.id IN (...) AND price > ?"),
+        ("select 1 from events where title = 'it''s' limit 20", "select ? from events where title = ? limit ?"),
+        ("INSERT INTO t (a, b) VALUES (?, ?), (?, ?), (?, ?)", "INSERT INTO t (a, b) VALUES (...)"),
+        ("SELECT x::integer FROM t WHERE id = $1 OR id = %(id_1)s OR id = :id", "SELECT x::integer FROM t WHERE id = ? OR id = ? OR id = ?"),
+        ("SELECT anon_1.id\n   FROM  t AS anon_1", "SELECT anon_1.id FROM t AS anon_1"),
+    ]
+    for i, (statement, expected) in enumerate(cases, 1):
+        got = querywatch.fingerprint(statement)
+        check(f"fingerprint {i}", got == expected, "" if got == expected else f"(got {got!r})")
+
+
+async def run():
+    import httpx
+    from fastapi import Depends
+    from sqlalchemy import select, text
+    from app import database, main, models, querywatch
+
+    organizer_id, event_ids = common.seed_events(30)
+    failures = []
+    rows = []
+
+    def check(label, ok, detail=""):
+        rows.append((label, f"{'ok' if ok else 'FAILED'} {detail}"))
+        if not ok:
+            failures.append(label)
+
+    check_fingerprints(check)
+
+    # two routes the app doesn't have, one with an N+1 loop and one with a slow statement
+    async def tickets_event_by_event(db=Depends(database.get_db)):
+        events = (await db.scalars(select(models.Event).limit(20))).all()
+        return {event.id: len((await db.scalars(select(models.Ticket).where(models.Ticket.event_id == event.id))).all()) for event in events}
+
+    async def slow_statement(db=Depends(database.get_db)):
+        return {"n": await db.scalar(text("WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 3000000) SELECT count(*) FROM n"))}
+
+    main.app.add_api_route("/check/n-plus-one", tickets_event_by_event)
+    main.app.add_api_route("/check/slow", slow_statement)
+
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://check")
+    lenient = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app, raise_app_exceptions=False), base_url="http://check")
+
+    async def login(email, role):
+        await client.post("/register", json={"email": email, "password": "pw", "role": role})
+        response = await client.post("/token", data={"username": email, "password": "pw"})
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    customer = await login("watch-customer@test.com", "customer")
+    organizer = await login("watch-organizer@test.com", "organizer")
+    ops = {"Authorization": f"Bearer {os.environ['OPS_TOKEN']}"}
+
+    # the regular endpoints, strict mode would raise on a finding
+    try:
+        listing = await client.get("/events/", params={"limit": 20})
+        await client.get("/events/search", params={"q": "Event", "limit": 20})
+        await client.get("/organizer/events", params={"limit": 20}, headers=organizer)
+        ticket_id = listing.json()[0]["tickets"][0]["id"]
+        booked = await client.post("/bookings/", json={"ticket_id": ticket_id, "quantity": 1}, headers=customer)
+        await client.get("/bookings/my", headers=customer)
+        await client.put(f"/bookings/{booked.json()['id']}/cancel", headers=customer)
+        check("endpoints run clean", True, f"(X-Query-Report: {listing.headers.get('X-Query-Report')})")
+    except querywatch.QueryWatchError as error:
+        check("endpoints run clean", False, str(error)[:200])
+
+    try:
+        await client.get("/check/n-plus-one")
+        check("N+1 reported", False, "(no QueryWatchError)")
+    except querywatch.QueryWatchError as error:
+        repeated = error.report["repeated"]
+        found = repeated and repeated[0]["count"] == 20 and "FROM tickets" in repeated[0]["fingerprint"]
+        check("N+1 reported", bool(found), f"({repeated[0]['count']}x)" if repeated else "(nothing repeated)")
+        # the loop is the comprehension in tickets_event_by_event
+        located = bool(repeated) and (repeated[0]["location"] or "").startswith("benchmarks/check_querywatch.py:")
+        check("N+1 located in the loop", located, f"({repeated[0]['location']})" if repeated else "")
+
+    # the lenient client only logs the QueryWatchError
+    await lenient.get("/check/slow")
+    recent = querywatch.stats.recent[-1] if querywatch.stats.recent else {}
+    slow = recent.get("slow", [])
+    check("slow statement reported", bool(slow) and recent["request"] == "GET /check/slow", f"({slow[0]['ms']} ms)" if slow else "")
+
+    # 1200 events in batches of BULK_BATCH_SIZE=100, twelve rounds of the same inserts
+    lines = [json.dumps({"title": f"Bulk {i}", "description": "x", "date": "2031-01-01T10:00:00", "venue": "Hall", "tickets": [{"ticket_type": "GA", "price": 5, "quantity_available": 10}]}) for i in range(1200)]
+    try:
+        imported = await client.post("/events/bulk", content="\n".join(lines), headers={**organizer, "Content-Type": "application/x-ndjson"})
+        check("bulk import not flagged", imported.status_code == 200, f"({imported.json().get('batches')} batches)")
+    except querywatch.QueryWatchError as error:
+        check("bulk import not flagged", False, str(error)[:200])
+
+    stats = (await client.get("/querywatch/stats", headers=ops)).json()
+    check("stats", stats["flagged"] == 2 and stats["repeated"] == 1 and stats["slow"] >= 1, f"({ {key: value for key, value in stats.items() if key != 'recent'} })")
+
+    # an inspected request against an uninspected one
+    timings = {}
+    for sample in (0.0, 1.0):
+        querywatch.QUERY_WATCH_SAMPLE = sample
+        latencies = []
+        for i in range(300):
+            started = time.perf_counter()
+            await client.get("/events/", params={"limit": 20, "skip": i % 20})
+            latencies.append(time.perf_counter() - started)
+        timings[sample] = common.percentile(latencies, 50) * 1000
+    querywatch.QUERY_WATCH_SAMPLE = 0.0
+    before = (await client.get("/querywatch/stats", headers=ops)).json()["inspected"]
+    await client.get("/events/", params={"limit": 20})
+    check("sample 0 inspects nothing", (await client.get("/querywatch/stats", headers=ops)).json()["inspected"] == before)
+    rows.append(("GET /events/ p50", f"{timings[0.0]:.2f} ms uninspected, {timings[1.0]:.2f} ms inspected"))
+
+    await client.aclose()
+    await lenient.aclose()
+    common.report("query watch, strict mode", rows)
+    return failures
+
+
+def main():
+    common.scratch_database("querywatch")
+    os.environ.update(QUERY_WATCH="strict", QUERY_WATCH_HEADER="on", QUERY_WATCH_SLOW_MS=str(SLOW_MS), BULK_BATCH_SIZE="100", CACHE_BACKEND="off", OPS_TOKEN="check-querywatch")
+    common.create_schema()
+    failures = asyncio.run(run())
+    if failures:
+        print(f"\nFAILED: {', '.join(failures)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
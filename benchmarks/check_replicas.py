@@ -0,0 +1,146 @@
+"""
+Read replica routing against a SQLite stand-in: a second file copied from
+the primary with app.replicas.copy_sqlite, which lags until the next copy.
+Checks that
+
+    listings are read from the replica
+    a customer's own booking shows up in GET /bookings/my right away (pinned to the primary)
+    another client of the same customer, without the cookie, still reads the lagging replica
+    the pin expires after REPLICA_STICKY_SECONDS
+    with the catalogue cache on, a page cached from the lagging replica is kept
+    REPLICA_STICKY_SECONDS at most and a pinned client does not get it
+    a broken replica is left out after its failed request, which is run again on
+    the primary, and reads fall back to the primary
+    a probe brings it back once it is repaired
+
+and exits non-zero otherwise.
+
+    python -m benchmarks.check_replicas
+"""
+
+import asyncio
+import os
+import sys
+from benchmarks import common
+
+STICKY_SECONDS = 1
+
+
+async def run(replica_path):
+    import httpx
+    from sqlalchemy import text
+    from app import cache, database, main, replicas
+
+    primary_path = database.engine.url.database
+    _, event_ids = common.seed_events(5)
+    replicas.copy_sqlite(primary_path, replica_path)
+    failures = []
+    rows = []
+
+    def check(label, ok, detail=""):
+        rows.append((label, f"{'ok' if ok else 'FAILED'} {detail}"))
+        if not ok:
+            failures.append(label)
+
+    def client():
+        # errors come back as 500s instead of being raised, the way a server would answer
+        return httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app, raise_app_exceptions=False), base_url="http://check")
+
+    async def stats():
+        return (await anonymous.get("/replicas/stats", headers=ops)).json()
+
+    anonymous, customer = client(), client()
+    ops = {"Authorization": f"Bearer {os.environ['OPS_TOKEN']}"}
+    await customer.post("/register", json={"email": "replica-customer@test.com", "password": "pw", "role": "customer"})
+    login = await customer.post("/token", data={"username": "replica-customer@test.com", "password": "pw"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    replicas.copy_sqlite(primary_path, replica_path) # the replica knows the customer
+
+    before = await stats()
+    listing = await anonymous.get("/events/", params={"limit": 5})
+    after = await stats()
+    check("listing read from the replica", listing.status_code == 200 and after["replica_reads"] == before["replica_reads"] + 1)
+
+    ticket_id = listing.json()[0]["tickets"][0]["id"]
+    booked = await customer.post("/bookings/", json={"ticket_id": ticket_id, "quantity": 1}, headers=headers)
+    check("booking sets the primary cookie", booked.status_code == 200 and replicas.PRIMARY_COOKIE in booked.cookies)
+
+    mine = await customer.get("/bookings/my", headers=headers)
+    check("own booking visible right away", mine.status_code == 200 and [b["id"] for b in mine.json()] == [booked.json()["id"]], f"(pinned reads: {(await stats())['pinned_reads']})")
+
+    elsewhere = client()
+    stale = await elsewhere.get("/bookings/my", headers=headers)
+    check("cookieless client reads replica", stale.status_code == 200 and stale.json() == [])
+
+    await asyncio.sleep(STICKY_SECONDS + 0.2)
+    before = await stats()
+    await customer.get("/bookings/my", headers=headers)
+    check("pin expires", (await stats())["replica_reads"] == before["replica_reads"] + 1)
+
+    replicas.copy_sqlite(primary_path, replica_path)
+    caught_up = await elsewhere.get("/bookings/my", headers=headers)
+    check("replica caught up after a copy", len(caught_up.json()) == 1)
+
+    # the catalogue cache on, filled by reads of the lagging replica
+    cache.backend = cache.MemoryBackend(cache.CACHE_MAX_ENTRIES, cache.stats)
+    organizer = client()
+    await organizer.post("/register", json={"email": "replica-organizer@test.com", "password": "pw", "role": "organizer"})
+    login = await organizer.post("/token", data={"username": "replica-organizer@test.com", "password": "pw"})
+    organizer.headers["Authorization"] = f"Bearer {login.json()['access_token']}"
+    replicas.copy_sqlite(primary_path, replica_path)
+
+    async def listed(who, title):
+        return title in [event["title"] for event in (await who.get("/events/", params={"limit": 100})).json()]
+
+    async def new_event(title):
+        return await organizer.post("/events", json={"title": title, "description": "x", "date": "2031-01-01T10:00:00", "venue": "Hall", "tickets": []})
+
+    await new_event("Replica cached")
+    stale = not await listed(anonymous, "Replica cached")
+    replicas.copy_sqlite(primary_path, replica_path)
+    still_cached = not await listed(anonymous, "Replica cached")
+    await asyncio.sleep(STICKY_SECONDS + 0.2)
+    check("replica page cached briefly", stale and still_cached and await listed(anonymous, "Replica cached"))
+
+    await new_event("Replica pinned")
+    stale = not await listed(anonymous, "Replica pinned")
+    check("pinned client skips the cached page", stale and await listed(organizer, "Replica pinned"))
+    await organizer.aclose()
+    cache.backend = cache.NullBackend()
+
+    # breaking the replica under its open connections
+    async with database.replica_engines[0].begin() as conn:
+        await conn.execute(text("DROP TABLE events"))
+    failed = await anonymous.get("/events/", params={"limit": 5})
+    fallback = await anonymous.get("/events/", params={"limit": 5})
+    state = await stats()
+    check("broken replica left out", state["healthy"] == 0 and state["failovers"] == 1)
+    check("failing read rerun on the primary", failed.status_code == 200 and len(failed.json()) == 5, f"(first request {failed.status_code})")
+    check("reads fall back to the primary", fallback.status_code == 200 and len(fallback.json()) == 5 and state["primary_reads"] == 1)
+
+    replicas.copy_sqlite(primary_path, replica_path)
+    await replicas.replica_set.check()
+    before = await stats()
+    back = await elsewhere.get("/bookings/my", headers=headers)
+    check("probe brings the replica back", back.status_code == 200 and (await stats())["replica_reads"] == before["replica_reads"] + 1 and before["healthy"] == 1)
+
+    common.report("read replica routing", rows)
+    return failures
+
+
+def main():
+    primary = common.scratch_database("primary")
+    replica_path = os.path.join(os.path.dirname(primary[len("sqlite:///"):]), "replica.db")
+    os.environ["DATABASE_REPLICA_URLS"] = f"sqlite:///{replica_path}"
+    os.environ["REPLICA_STICKY_SECONDS"] = str(STICKY_SECONDS)
+    os.environ["CACHE_BACKEND"] = "off" # every listing has to reach a database
+    os.environ["OPS_TOKEN"] = "check-replicas"
+    common.create_schema()
+    failures = asyncio.run(run(replica_path))
+    if failures:
+        print(f"\nFAILED: {', '.join(failures)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
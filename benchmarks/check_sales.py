@@ -0,0 +1,174 @@
+"""
+The sales rollups behind GET /organizer/dashboard (app/sales.py). Checks that
+
+    bookings, carts, a cancellation handing tickets to the waitlist, an event
+    cancellation and a deleted customer keep the rollups equal to the bookings
+    the dashboard's numbers match totals computed from the bookings table
+    the dashboard runs the same number of statements for 5 and for 50 events
+    drift written around crud is reported, and --fix corrects it
+
+and exits non-zero otherwise. It then reports the dashboard next to the
+GROUP BY over the bookings it replaces, on --bookings confirmed bookings.
+
+    python -m benchmarks.check_sales --bookings 200000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from benchmarks import common
+
+
+async def run(args):
+    import httpx
+    from sqlalchemy import func, select, update
+    from app import database, main, models, sales
+
+    organizer_id, event_ids = common.seed_events(60, tickets_per_event=3, quantity=1000)
+    failures = []
+    rows = []
+
+    def check(label, ok, detail=""):
+        rows.append((label, f"{'ok' if ok else 'FAILED'} {detail}"))
+        if not ok:
+            failures.append(label)
+
+    async def drift():
+        async with database.AsyncSessionLocal() as db:
+            return await sales.reconcile(db)
+
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://check")
+
+    async def login(email, role):
+        response = await client.post("/register", json={"email": email, "password": "pw", "role": role})
+        user_id = response.json()["id"]
+        response = await client.post("/token", data={"username": email, "password": "pw"})
+        return user_id, {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    owner_id, organizer = await login("sales-organizer@test.com", "organizer")
+    customers = [await login(f"sales-customer-{i}@test.com", "customer") for i in range(4)]
+    with database.engine.begin() as conn:
+        conn.execute(update(models.Event).values(organizer_id=owner_id))
+
+    tickets = [ticket["id"] for event in (await client.get("/events/", params={"limit": 100})).json() for ticket in event["tickets"]]
+    rng = random.Random(args.seed)
+
+    # singles and carts from every customer
+    booked = []
+    for _, headers in customers:
+        for _ in range(10):
+            response = await client.post("/bookings/", json={"ticket_id": rng.choice(tickets), "quantity": rng.randint(1, 4)}, headers=headers)
+            booked.append((response.json()["id"], headers))
+        cart = [{"ticket_id": ticket_id, "quantity": rng.randint(1, 3)} for ticket_id in rng.sample(tickets, 4)]
+        await client.post("/bookings/batch", json={"items": cart}, headers=headers)
+    check("bookings and carts", (await drift())["drifted"] == 0)
+
+    # a sold out ticket type, a waitlist behind it, then a cancellation that hands its tickets over
+    scarce = tickets[0]
+    with database.engine.begin() as conn:
+        conn.execute(update(models.Ticket).where(models.Ticket.id == scarce).values(quantity_available=5))
+    _, first = customers[0]
+    holder = (await client.post("/bookings/", json={"ticket_id": scarce, "quantity": 5}, headers=first)).json()["id"]
+    for _, headers in customers[1:]:
+        await client.post(f"/tickets/{scarce}/waitlist", json={"ticket_id": scarce, "quantity": 2}, headers=headers)
+    for booking_id, headers in booked[:5]:
+        await client.put(f"/bookings/{booking_id}/cancel", headers=headers)
+    await client.put(f"/bookings/{holder}/cancel", headers=first)
+    async with database.AsyncSessionLocal() as db:
+        handed_out = await db.scalar(select(func.count()).select_from(models.Booking).where(models.Booking.ticket_id == scarce, models.Booking.status == models.BookingStatus.CONFIRMED.value, models.Booking.customer_id != customers[0][0]))
+    check("cancellations with a waitlist", (await drift())["drifted"] == 0, f"({handed_out} waitlist bookings)")
+
+    await client.put(f"/events/{event_ids[1]}", json={"status": models.EventStatus.CANCELLED.value}, headers=organizer)
+    check("event cancellation", (await drift())["drifted"] == 0)
+
+    # a customer going takes their bookings out of the totals
+    await client.delete("/users/me", headers=customers[-1][1])
+    check("deleted customer", (await drift())["drifted"] == 0)
+
+    # the dashboard against the bookings table
+    dashboard = (await client.get("/organizer/dashboard", params={"limit": 100}, headers=organizer)).json()
+    async with database.AsyncSessionLocal() as db:
+        expected = sales.expected_sales().subquery()
+        sold, revenue = (await db.execute(select(func.sum(expected.c.tickets_sold), func.sum(expected.c.tickets_sold * models.Ticket.price)).join(models.Ticket, models.Ticket.id == expected.c.ticket_id))).one()
+    by_lines = sum(line["tickets_sold"] for item in dashboard["items"] for line in item["ticket_types"])
+    check("dashboard totals", dashboard["tickets_sold"] == sold == by_lines and abs(dashboard["revenue"] - round(revenue, 2)) < 0.01 and dashboard["events"] == len(event_ids), f"({sold} tickets, {dashboard['revenue']:.2f} revenue)")
+
+    counts = {}
+    for limit in (5, 50):
+        response = await client.get("/organizer/dashboard", params={"limit": limit}, headers=organizer)
+        counts[limit] = int(response.headers["X-Query-Count"])
+    check("dashboard statements constant", counts[5] == counts[50], f"({counts[5]} for 5 events, {counts[50]} for 50)")
+
+    # drift written around crud, reported then fixed
+    with database.engine.begin() as conn:
+        sold_ids = conn.scalars(select(sales.ROLLUP.c.ticket_id).where(sales.ROLLUP.c.tickets_sold > 0).order_by(sales.ROLLUP.c.ticket_id).limit(4)).all()
+        conn.execute(update(sales.ROLLUP).where(sales.ROLLUP.c.ticket_id.in_(sold_ids[:3])).values(tickets_sold=sales.ROLLUP.c.tickets_sold + 7))
+        conn.execute(sales.ROLLUP.delete().where(sales.ROLLUP.c.ticket_id == sold_ids[3]))
+    report = await drift()
+    async with database.AsyncSessionLocal() as db:
+        fixed = await sales.reconcile(db, fix=True)
+    check("drift reported", report["drifted"] == 4 and report["tickets_sold_drift"] < 0, f"({report['drifted']} ticket types, {report['tickets_sold_drift']:+} tickets)")
+    check("drift fixed", fixed["fixed"] and (await drift())["drifted"] == 0)
+
+    # the dashboard next to the per-request GROUP BY over every booking it replaces
+    statuses = (models.BookingStatus.CONFIRMED.value, models.BookingStatus.CANCELLED.value)
+    with database.engine.begin() as conn:
+        conn.execute(models.Booking.__table__.insert(), [
+            {"customer_id": customers[0][0], "ticket_id": rng.choice(tickets), "quantity": rng.randint(1, 4), "status": statuses[rng.random() < 0.1]}
+            for _ in range(args.bookings)
+        ])
+    async with database.AsyncSessionLocal() as db:
+        await sales.reconcile(db, fix=True)
+
+    async def aggregate():
+        async with database.AsyncSessionLocal() as db:
+            return (await db.execute(
+                select(models.Ticket.id, func.sum(models.Booking.quantity), func.count(), func.sum(models.Booking.quantity * models.Ticket.price))
+                .join(models.Booking, models.Booking.ticket_id == models.Ticket.id)
+                .join(models.Event, models.Event.id == models.Ticket.event_id)
+                .where(models.Event.organizer_id == owner_id, models.Booking.status == models.BookingStatus.CONFIRMED.value)
+                .group_by(models.Ticket.id)
+            )).all()
+
+    async def dashboard_page():
+        return await client.get("/organizer/dashboard", params={"limit": 20}, headers=organizer)
+
+    timings = {}
+    for name, call in (("GROUP BY over bookings", aggregate), ("GET /organizer/dashboard", dashboard_page)):
+        latencies = []
+        for _ in range(args.rounds):
+            started = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - started)
+        timings[name] = common.percentile(latencies, 50) * 1000
+        rows.append((f"{name} p50", f"{timings[name]:.2f} ms"))
+    async with database.AsyncSessionLocal() as db:
+        reconciled = await sales.reconcile(db)
+    rows.append(("reconciliation", f"{reconciled['seconds'] * 1000:.0f} ms over {args.bookings} bookings, {reconciled['drifted']} drifted"))
+
+    await client.aclose()
+    common.report(f"sales rollups, {len(event_ids)} events, {args.bookings} bulk bookings", rows)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bookings", type=int, default=200_000, help="confirmed and cancelled bookings loaded for the timings")
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    common.scratch_database("sales")
+    os.environ.update(CACHE_BACKEND="off", QUERY_COUNT_HEADER="on")
+    common.create_schema()
+    failures = asyncio.run(run(args))
+    if failures:
+        print(f"\nFAILED: {', '.join(failures)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
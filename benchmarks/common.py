@@ -0,0 +1,134 @@
+"""
+Shared helpers for the benchmark scripts. Every benchmark runs against a
+throwaway SQLite file so it never touches event_system.db
+
+Run them from the project root, e.g. python -m benchmarks.bench_async_listing
+"""
+
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def scratch_database(name: str) -> str:
+    # has to run before anything from app is imported, database.py reads the url at import time
+    path = os.path.join(tempfile.mkdtemp(prefix="bench-"), f"{name}.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    return os.environ["DATABASE_URL"]
+
+
+def create_schema():
+    # app.search hooks the full-text index onto the events table's creation
+    from app import database, models, search
+    models.Base.metadata.create_all(bind=database.engine)
+
+
+def seed_events(n_events: int, tickets_per_event: int = 2, quantity: int = 100):
+    # plain executemany inserts, one organizer owning everything
+    from app import database, models
+    start = datetime.now() + timedelta(days=1)
+    with database.engine.begin() as conn:
+        organizer_id = conn.execute(models.User.__table__.insert().values(email="bench-organizer@test.com", hashed_password="x", role="organizer")).inserted_primary_key[0]
+        conn.execute(models.Event.__table__.insert(), [
+            {
+                "title": f"Event {i}",
+                "description": "Benchmark",
+                "date": start + timedelta(hours=i),
+                "venue": f"Venue {i % 50}",
+                "organizer_id": organizer_id,
+                "status": models.EventStatus.ACTIVE.value,
+                "total_remaining": tickets_per_event * quantity,
+                "is_sold_out": tickets_per_event * quantity <= 0,
+            }
+            for i in range(n_events)
+        ])
+        event_ids = [row[0] for row in conn.execute(models.Event.__table__.select().with_only_columns(models.Event.id))]
+        conn.execute(models.Ticket.__table__.insert(), [
+            {"event_id": event_id, "ticket_type": f"Type {t}", "price": 10.0 * (t + 1), "quantity_available": quantity}
+            for event_id in event_ids for t in range(tickets_per_event)
+        ])
+    return organizer_id, event_ids
+
+
+def percentile(samples, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def report(title: str, rows):
+    print(f"\n{title}")
+    print("-" * len(title))
+    for label, value in rows:
+        print(f"{label:<32} {value}")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve(app_path: str, port: int, workers: int = 1) -> subprocess.Popen:
+    # real uvicorn process so the client and the server do not share an event loop
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app_path, "--port", str(port), "--workers", str(workers), "--log-level", "critical", "--backlog", "4096"],
+        cwd=ROOT, env=os.environ.copy(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return proc
+        except OSError:
+            time.sleep(0.2)
+    stop(proc)
+    raise RuntimeError(f"{app_path} did not start on port {port}")
+
+
+def stop(proc: subprocess.Popen):
+    # a wedged threadpool server never finishes its graceful shutdown
+    proc.terminate()
+    try:
+        proc.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+async def hammer(url: str, duration: float, concurrency: int, headers=None, timeout: float = 10):
+    # keeps `concurrency` connections busy with GETs for `duration` seconds and
+    # returns (ok requests/sec, latencies, errors); anything slower than `timeout` is an error
+    import httpx
+    latencies, errors, ok = [], 0, 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=timeout, headers=headers) as client:
+        stop_at = time.perf_counter() + duration
+
+        async def worker():
+            nonlocal errors, ok
+            while time.perf_counter() < stop_at:
+                started = time.perf_counter()
+                try:
+                    response = await client.get(url)
+                    if response.status_code >= 400:
+                        errors += 1
+                    else:
+                        ok += 1
+                        latencies.append(time.perf_counter() - started)
+                except Exception:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return ok / elapsed, latencies, errors
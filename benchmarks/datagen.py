@@ -0,0 +1,236 @@
+"""
+Deterministic synthetic data: organizers, customers, events, tickets,
+bookings and waitlists at a configurable scale, up to millions of rows.
+The same --seed and --start date always give the same rows.
+
+Rows are written with executemany inserts in chunks of --chunk events
+(their tickets, bookings and waitlist entries travel along), so memory stays
+flat whatever the scale. Ticket stock matches the bookings, every event
+holds its inventory counters, and a share of "hot" events is sold out with
+a waitlist queued behind it.
+
+    python -m benchmarks.datagen --scale medium --seed 7
+    python -m benchmarks.datagen --scale large --database-url sqlite:////tmp/large.db
+    python -m benchmarks.datagen --scale small --events 20000    # any count can be overridden
+
+Every generated user has the password PASSWORD. The target database has to
+be empty (tables are created if missing).
+"""
+
+import argparse
+import os
+import random
+import time
+from datetime import date, datetime, time as clock, timedelta
+from benchmarks import common
+
+SCALES = {
+    "tiny":   {"organizers": 5,    "customers": 200,     "events": 300,     "tickets_per_event": 3, "bookings": 1_500,     "waitlist": 300},
+    "small":  {"organizers": 20,   "customers": 2_000,   "events": 3_000,   "tickets_per_event": 3, "bookings": 15_000,    "waitlist": 3_000},
+    "medium": {"organizers": 200,  "customers": 50_000,  "events": 50_000,  "tickets_per_event": 3, "bookings": 250_000,   "waitlist": 25_000},
+    "large":  {"organizers": 2000, "customers": 500_000, "events": 500_000, "tickets_per_event": 3, "bookings": 2_500_000, "waitlist": 250_000},
+}
+PASSWORD = "datagen-password"
+HOT_SHARE = 0.05 # events sold out on purpose, the waitlists queue on their tickets
+CANCELLED_SHARE = 0.02 # events cancelled by their organizer
+CANCELLED_BOOKING_SHARE = 0.03
+
+# titles come out as "<adjective> <genre> <kind>", venues as "<place>, <city>"
+ADJECTIVES = ["Midnight", "Summer", "Grand", "Open Air", "Late", "Sunday", "Electric", "Acoustic", "Winter", "Downtown", "Spring", "Vintage"]
+GENRES = ["Jazz", "Rock", "Comedy", "Tech", "Food", "Film", "Poetry", "Dance", "Chess", "Wine", "Blues", "Startup", "Gaming", "Opera", "Yoga"]
+KINDS = ["Night", "Festival", "Meetup", "Showcase", "Conference", "Session", "Fair", "Tour", "Marathon", "Gala", "Club", "Workshop"]
+PLACES = ["Blue Hall", "Riverside Arena", "Old Town Theatre", "Harbour Stage", "Central Park", "Grand Ballroom", "Warehouse 9", "City Library", "Rooftop Garden", "Expo Centre"]
+CITIES = ["Lisbon", "Porto", "Berlin", "Hamburg", "Madrid", "Valencia", "Paris", "Lyon", "Rome", "Milan", "Vienna", "Prague"]
+DESCRIPTIONS = [
+    "An evening of {genre} with local and touring acts.",
+    "Bring your friends for {genre} at its best, doors open an hour early.",
+    "The yearly {genre} gathering, talks, food stalls and late sets.",
+    "A relaxed {genre} afternoon, family friendly.",
+    "Limited capacity, the {genre} crowd books early.",
+]
+TICKET_TYPES = ["General Admission", "VIP", "Early Bird", "Balcony", "Student", "Backstage"]
+START_HOURS = [9, 10, 11, 13, 15, 17, 18, 19, 20, 21, 22] # every search time slot gets its share
+
+
+def _split(total: int, start: int, end: int, size: int) -> int:
+    # the part of `total` that belongs to items [start, end) out of `size`, the parts add up to total
+    return total * end // size - total * start // size
+
+
+def generate(seed: int = 1, start: date = None, chunk: int = 5000, organizers: int = 20, customers: int = 2000, events: int = 3000,
+             tickets_per_event: int = 3, bookings: int = 15000, waitlist: int = 3000, progress: bool = False) -> dict:
+    # fills the (empty) database behind app.database.engine, returns the row counts
+    from sqlalchemy import func, select, text
+    from app import auth, database, models, sales
+
+    rng = random.Random(seed)
+    anchor = datetime.combine(start or date.today(), clock())
+    started = time.perf_counter()
+    counts = {"users": 0, "events": 0, "tickets": 0, "bookings": 0, "waitlist": 0}
+    dialect = database.engine.dialect.name
+
+    with database.engine.begin() as conn:
+        if conn.scalar(select(func.count()).select_from(models.User.__table__)):
+            raise RuntimeError("the target database already holds users, datagen only fills an empty one")
+
+    # one bcrypt hash shared by everybody, at the configured work factor
+    hashed = auth.get_password(PASSWORD)
+    with database.engine.begin() as conn:
+        for first in range(0, organizers + customers, chunk * 10):
+            last = min(organizers + customers, first + chunk * 10)
+            conn.execute(models.User.__table__.insert(), [
+                {"id": i + 1, "email": f"organizer-{i}@example.com", "hashed_password": hashed, "role": "organizer"} if i < organizers else
+                {"id": i + 1, "email": f"customer-{i - organizers}@example.com", "hashed_password": hashed, "role": "customer"}
+                for i in range(first, last)
+            ])
+    counts["users"] = organizers + customers
+    first_customer = organizers + 1
+
+    booking_id = waitlist_id = 0
+    for first in range(0, events, chunk):
+        last = min(events, first + chunk)
+        event_rows, ticket_rows, booking_rows, waitlist_rows = [], [], [], []
+        remaining = {} # ticket id -> stock left
+        weights, ticket_ids, hot_tickets = [], [], []
+
+        for event_id in range(first + 1, last + 1):
+            hot = rng.random() < HOT_SHARE
+            genre = rng.choice(GENRES)
+            if hot:
+                when = anchor + timedelta(days=rng.randint(1, 60), hours=rng.choice(START_HOURS))
+            else:
+                when = anchor + timedelta(days=rng.randint(-30, 365), hours=rng.choice(START_HOURS))
+            cancelled = not hot and rng.random() < CANCELLED_SHARE
+            event_rows.append({
+                "id": event_id,
+                "title": f"{rng.choice(ADJECTIVES)} {genre} {rng.choice(KINDS)}",
+                "description": rng.choice(DESCRIPTIONS).format(genre=genre.lower()),
+                "date": when,
+                "venue": f"{rng.choice(PLACES)}, {rng.choice(CITIES)}",
+                "organizer_id": rng.randint(1, organizers),
+                "status": (models.EventStatus.CANCELLED if cancelled else models.EventStatus.ACTIVE).value,
+                **models.calendar_fields(when),
+            })
+            # a few events draw most of the bookings
+            popularity = rng.paretovariate(1.2)
+            for t in range(tickets_per_event):
+                ticket_id = (event_id - 1) * tickets_per_event + t + 1
+                capacity = rng.randint(5, 20) if hot else rng.randint(50, 500)
+                ticket_rows.append({"id": ticket_id, "event_id": event_id, "ticket_type": TICKET_TYPES[t % len(TICKET_TYPES)], "price": float(rng.randint(1, 40) * 5)})
+                remaining[ticket_id] = capacity
+                if hot:
+                    hot_tickets.append(ticket_id)
+                elif not cancelled:
+                    ticket_ids.append(ticket_id)
+                    weights.append(popularity)
+
+        def book(ticket_id, quantity, status=models.BookingStatus.CONFIRMED.value):
+            nonlocal booking_id
+            booking_id += 1
+            booking_rows.append({"id": booking_id, "customer_id": rng.randint(first_customer, organizers + customers), "ticket_id": ticket_id, "quantity": quantity, "status": status})
+
+        # the hot tickets sell out first, whatever is left of the chunk's share goes by popularity
+        quota = _split(bookings, first, last, events)
+        for ticket_id in hot_tickets:
+            while remaining[ticket_id] > 0 and len(booking_rows) < quota:
+                quantity = min(rng.randint(1, 4), remaining[ticket_id])
+                remaining[ticket_id] -= quantity
+                book(ticket_id, quantity)
+        if ticket_ids and len(booking_rows) < quota:
+            for ticket_id in rng.choices(ticket_ids, weights=weights, k=quota - len(booking_rows)):
+                if remaining[ticket_id] <= 0:
+                    # the favourites sell out, their fans settle for any other event
+                    ticket_id = rng.choice(ticket_ids)
+                quantity = min(rng.randint(1, 4), remaining[ticket_id])
+                if quantity <= 0:
+                    continue
+                if rng.random() < CANCELLED_BOOKING_SHARE:
+                    book(ticket_id, quantity, models.BookingStatus.CANCELLED.value)
+                    continue
+                remaining[ticket_id] -= quantity
+                book(ticket_id, quantity)
+
+        # queues behind the sold out tickets, oldest entry first
+        queued_at = anchor - timedelta(days=7)
+        sold_out = [ticket_id for ticket_id in hot_tickets if remaining[ticket_id] <= 0]
+        for _ in range(_split(waitlist, first, last, events) if sold_out else 0):
+            waitlist_id += 1
+            ticket_id = rng.choice(sold_out)
+            queued_at += timedelta(seconds=rng.randint(1, 120))
+            waitlist_rows.append({
+                "id": waitlist_id,
+                "event_id": (ticket_id - 1) // tickets_per_event + 1,
+                "user_id": rng.randint(first_customer, organizers + customers),
+                "ticket_id": ticket_id,
+                "quantity": rng.randint(1, 2),
+                "created_at": queued_at,
+            })
+
+        for row in ticket_rows:
+            row["quantity_available"] = remaining[row["id"]]
+        for row in event_rows:
+            left = sum(remaining[(row["id"] - 1) * tickets_per_event + t + 1] for t in range(tickets_per_event))
+            row["total_remaining"] = left
+            row["is_sold_out"] = tickets_per_event > 0 and left <= 0
+
+        with database.engine.begin() as conn:
+            conn.execute(models.Event.__table__.insert(), event_rows)
+            if ticket_rows:
+                conn.execute(models.Ticket.__table__.insert(), ticket_rows)
+            if booking_rows:
+                conn.execute(models.Booking.__table__.insert(), booking_rows)
+            if waitlist_rows:
+                conn.execute(models.Waitlist.__table__.insert(), waitlist_rows)
+        counts["events"] += len(event_rows)
+        counts["tickets"] += len(ticket_rows)
+        counts["bookings"] += len(booking_rows)
+        counts["waitlist"] += len(waitlist_rows)
+        if progress:
+            print(f"{last}/{events} events, {counts['bookings']} bookings, {time.perf_counter() - started:.0f}s", flush=True)
+
+    with database.engine.begin() as conn:
+        # the bookings went in around crud, their sales rollups are summed up from them in one go
+        conn.execute(sales.backfill())
+        # the ids were given explicitly, postgres sequences have to catch up with them
+        if dialect == "postgresql":
+            for table in ("users", "events", "tickets", "bookings", "waitlist"):
+                conn.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), coalesce(max(id), 1)) FROM {table}"))
+        # fresh statistics, the planner picks its indexes from them
+        conn.execute(text("ANALYZE"))
+
+    counts["seconds"] = round(time.perf_counter() - started, 1)
+    return counts
+
+
+def table_counts() -> dict:
+    # rows per table of the database behind app.database.engine
+    from sqlalchemy import func, select
+    from app import database, models
+    tables = {"users": models.User, "events": models.Event, "tickets": models.Ticket, "bookings": models.Booking, "waitlist": models.Waitlist}
+    with database.engine.connect() as conn:
+        return {name: conn.scalar(select(func.count()).select_from(model.__table__)) for name, model in tables.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--start", type=date.fromisoformat, default=None, help="day the event dates are laid out from (default: today)")
+    parser.add_argument("--database-url", default=None, help="default: a new SQLite file in a temporary directory")
+    parser.add_argument("--chunk", type=int, default=5000, help="events written per transaction")
+    for name in SCALES["small"]:
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, default=None, help=f"overrides the scale's {name}")
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        common.scratch_database(f"datagen-{args.scale}")
+    common.create_schema()
+    sizes = {name: getattr(args, name) if getattr(args, name) is not None else value for name, value in SCALES[args.scale].items()}
+    counts = generate(seed=args.seed, start=args.start, chunk=args.chunk, progress=True, **sizes)
+    common.report(f"{args.scale} dataset, seed {args.seed}: {os.environ['DATABASE_URL']}", list(counts.items()))
+
+
+if __name__ == "__main__":
+    main()
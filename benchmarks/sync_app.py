@@ -0,0 +1,25 @@
+"""
+The pre-async listing endpoint: a plain `def` route on Starlette's threadpool
+drawing a blocking Session, kept only as the comparison point for the
+async benchmark
+"""
+
+from typing import List
+from fastapi import FastAPI, Depends
+from sqlalchemy.orm import Session
+from app import database, models, schemas
+
+app = FastAPI(title="Event Booking System (sync baseline)")
+
+
+def get_sync_db():
+    db = database.SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@app.get("/events/", response_model=List[schemas.Event])
+def read_public_events(skip: int = 0, limit: int = 100, db: Session = Depends(get_sync_db)):
+    return db.query(models.Event).filter(models.Event.status == models.EventStatus.ACTIVE.value, models.Event.deleted_at == None).order_by(models.Event.inventory_status.asc(), models.Event.date.asc()).offset(skip).limit(limit).all()
@@ -5,10 +5,12 @@ from app import models  # Essential: This registers the models with SQLAlchemy
 def reset_database():
     db_path = "event_system.db"
     
-    # 1. Remove the old database file if it exists
+    # 1. Remove the old database file if it exists (and the WAL files next to it)
     if os.path.exists(db_path):
         print(f"🗑️  Removing old database: {db_path}")
-        os.remove(db_path)
+    for path in (db_path, f"{db_path}-wal", f"{db_path}-shm"):
+        if os.path.exists(path):
+            os.remove(path)
     
     # 2. Use SQLAlchemy to create the tables from scratch
     try:
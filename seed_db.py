@@ -1,8 +1,14 @@
+import asyncio
 import json
-from datetime import datetime
 from sqlalchemy.orm import Session
-from app.database import SessionLocal, engine
-from app import models, auth
+from app.database import SessionLocal, engine, async_engine
+from app import models, auth, bulk
+
+async def import_events(events_list, organizer_map):
+    # one batched import per organizer (app/bulk.py) instead of a commit and a refresh per event
+    for json_id, organizer_id in organizer_map.items():
+        await bulk.load([json.dumps(item) for item in events_list if item["organizer_id"] == json_id], organizer_id)
+    await async_engine.dispose()
 
 def seed_data():
     db = SessionLocal()
@@ -379,31 +385,8 @@ def seed_data():
     events_list = json.loads(events_json)
     
     print("📅 Seeding Events and Tickets...")
-    for item in events_list:
-        # Create Event
-        new_event = models.Event(
-            title=item["title"],
-            description=item["description"],
-            date=datetime.fromisoformat(item["date"]),
-            venue=item["venue"],
-            organizer_id=organizer_map[item["organizer_id"]],
-            status=models.EventStatus.ACTIVE.value
-        )
-        db.add(new_event)
-        db.commit()
-        db.refresh(new_event)
-        
-        # Create Tickets for this Event
-        for t in item["tickets"]:
-            new_ticket = models.Ticket(
-                ticket_type=t["ticket_type"],
-                price=t["price"],
-                quantity_available=t["quantity_available"],
-                event_id=new_event.id
-            )
-            db.add(new_ticket)
+    asyncio.run(import_events(events_list, organizer_map))
     
-    db.commit()
     db.close()
     print("✅ Database successfully seeded with 18 events!")
 